@@ -0,0 +1,126 @@
+"""
+Item analysis over the packed per-attempt responses (QuizAttempt.responses).
+
+Responses of one quiz version are fixed-width byte strings, so a chunk of
+attempts concatenated into one buffer is a row-major matrix. Column j is
+then the slice buffer[j::width], and per-option counts are bytes.count()
+calls; the per-question work runs in C rather than looping over rows in Python.
+"""
+
+from array import array
+
+from django.db import transaction
+from user_actions.scoring import NOT_DRAWN
+from .models import QuizAttempt, QuizLayout
+from .pagination import keyset_rows
+
+# Share of top and bottom scorers compared for the discrimination index
+GROUP_FRACTION = 0.27
+CHUNK_SIZE = 5000
+
+_recorded_layouts = set()
+
+
+def ensure_layout(quiz_id, version, answer_key):
+    """
+        Store the question order of a quiz version the first time an attempt
+        against it is recorded. Call inside the transaction that records the attempt.
+    """
+
+    if (quiz_id, version) in _recorded_layouts:
+        return
+    # A version's layout never changes, so a concurrent insert of it is as good as ours
+    QuizLayout.objects.bulk_create([QuizLayout(
+        quiz_id=quiz_id, version=version, question_ids=array('q', answer_key).tobytes(),
+        answers=bytes(key[2] for key in answer_key.values()),
+    )], ignore_conflicts=True)
+    transaction.on_commit(lambda: _recorded_layouts.add((quiz_id, version)))
+
+
+def _score_cutoff(attempts, ordering, size):
+    return attempts.order_by(ordering).values_list('score', flat=True)[size - 1]
+
+
+def item_analysis(quiz_id):
+    """
+        Per-question statistics of a quiz across all of its versions.
+
+        Returns a list of dicts, one per question, in question id order:
+        responses, difficulty (share answered correctly), discrimination
+        (difficulty in the top GROUP_FRACTION of scorers minus the bottom),
+        option counts, unanswered and other (answer matching no option).
+    """
+
+    items = {}
+    for layout in QuizLayout.objects.filter(quiz_id=quiz_id).order_by('version'):
+        question_ids = array('q')
+        question_ids.frombytes(bytes(layout.question_ids))
+        answers = bytes(layout.answers)
+        width = len(question_ids)
+        attempts = QuizAttempt.objects.filter(quiz_id=quiz_id, quiz_version=layout.version, responses__isnull=False)
+        total = attempts.count()
+        if not width or not total:
+            continue
+        group_size = max(1, int(total * GROUP_FRACTION))
+        low_cutoff = _score_cutoff(attempts, 'score', group_size)
+        high_cutoff = _score_cutoff(attempts, '-score', group_size)
+
+        counts = [[0] * 7 for _ in range(width)]  # unanswered, options 1-4, correct, not drawn
+        upper_correct, lower_correct = [0] * width, [0] * width
+        upper_skipped, lower_skipped = [0] * width, [0] * width
+        processed = upper_total = lower_total = 0
+        rows = keyset_rows(attempts, ['id', 'score', 'responses'], CHUNK_SIZE)
+        while True:
+            chunk = [row for _, row in zip(range(CHUNK_SIZE), rows)]
+            if not chunk:
+                break
+            # Skip responses recorded against a different question set
+            chunk = [row for row in chunk if len(row[2]) == width]
+            processed += len(chunk)
+            matrix = b''.join(bytes(row[2]) for row in chunk)
+            upper = b''.join(bytes(row[2]) for row in chunk if row[1] >= high_cutoff)
+            lower = b''.join(bytes(row[2]) for row in chunk if row[1] <= low_cutoff)
+            upper_total += len(upper) // width
+            lower_total += len(lower) // width
+            for j in range(width):
+                column = matrix[j::width]
+                for code in range(5):
+                    counts[j][code] += column.count(code)
+                counts[j][5] += column.count(answers[j])
+                counts[j][6] += column.count(NOT_DRAWN)
+                upper_correct[j] += upper[j::width].count(answers[j])
+                lower_correct[j] += lower[j::width].count(answers[j])
+                upper_skipped[j] += upper[j::width].count(NOT_DRAWN)
+                lower_skipped[j] += lower[j::width].count(NOT_DRAWN)
+
+        for j, question_id in enumerate(question_ids):
+            item = items.setdefault(question_id, {
+                'question': question_id, 'responses': 0, 'correct': 0, 'options': [0] * 4,
+                'unanswered': 0, 'upper': [0, 0], 'lower': [0, 0],
+            })
+            item['correct_option'] = answers[j]
+            # Attempts of pooled quizzes only count for the questions drawn for them
+            item['responses'] += processed - counts[j][6]
+            item['correct'] += counts[j][5]
+            item['unanswered'] += counts[j][0]
+            item['options'] = [a + b for a, b in zip(item['options'], counts[j][1:5])]
+            item['upper'] = [item['upper'][0] + upper_correct[j], item['upper'][1] + upper_total - upper_skipped[j]]
+            item['lower'] = [item['lower'][0] + lower_correct[j], item['lower'][1] + lower_total - lower_skipped[j]]
+
+    results = []
+    for question_id in sorted(items):
+        item = items[question_id]
+        responses = item['responses']
+        upper_correct, upper_total = item['upper']
+        lower_correct, lower_total = item['lower']
+        results.append({
+            'question': question_id,
+            'correct_option': item['correct_option'],
+            'responses': responses,
+            'difficulty': item['correct'] / responses if responses else None,
+            'discrimination': (upper_correct / upper_total if upper_total else 0) - (lower_correct / lower_total if lower_total else 0),
+            'options': {str(number): count for number, count in enumerate(item['options'], start=1)},
+            'unanswered': item['unanswered'],
+            'other': responses - item['unanswered'] - sum(item['options']),
+        })
+    return results
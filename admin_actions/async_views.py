@@ -0,0 +1,44 @@
+"""
+ASGI-native admin endpoints. Like user_actions/async_views.py, they use
+@async_api_view and Django's async ORM, and only work fully when served by
+an ASGI server.
+"""
+
+from django.http import StreamingHttpResponse
+from user.async_api import async_api_view, json_response
+from . import feed
+from .models import Quiz
+
+
+@async_api_view(['GET'])
+async def submission_feed(request):
+    """
+        Stream new attempts of one of the admin's quizzes and its running stats as server-sent events (Admin only)
+
+        Query params:
+        - quiz_id (int, required): The ID of the quiz
+        - last_event_id (int, optional): Resume after this attempt id; the
+          Last-Event-ID header sent by reconnecting EventSource clients takes precedence
+
+        Events:
+        - stats: the quiz stats, as returned by get_quiz_stats; sent on connect and after each batch of attempts
+        - attempt (id: attempt id): {'id', 'score', 'attempted_at', 'user', 'quiz'}
+    """
+
+    if request.user.role != 'admin':
+        return json_response({'status':False, 'message': 'You are not authorized to perform this action'})
+    if not request.GET.get('quiz_id'):
+        return json_response({'status':False, 'message': 'Quiz ID is required'})
+    try:
+        quiz_id = int(request.GET['quiz_id'])
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return json_response({'status':False, 'message': 'Invalid query parameters'})
+    if not await Quiz.objects.filter(id=quiz_id, created_by=request.user).aexists():
+        return json_response({'status':False, 'message': 'Quiz not found'})
+    response = StreamingHttpResponse(feed.submission_feed.stream(quiz_id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
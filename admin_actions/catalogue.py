@@ -0,0 +1,112 @@
+"""
+Conditional GETs for the catalogue listings.
+
+Every add/update view bumps the catalogue version of the global scope and
+of the writing admin (bump_catalogue). The listing views are decorated with
+@conditional_catalogue, which derives a strong ETag and Last-Modified from
+the version of their scope, so a poll with a matching If-None-Match or
+If-Modified-Since gets a 304 after a single version lookup. The rendered
+JSON of each (scope, version, request) is also cached, so the serializers
+only run once per change.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .models import CatalogueVersion
+
+_config = getattr(settings, 'CATALOGUE_CACHE', {})
+CACHE_ALIAS = _config.get('BACKEND', 'default')
+CACHE_TIMEOUT = _config.get('TIMEOUT', 300)
+
+GLOBAL_SCOPE = 'global'
+
+
+def admin_scope(admin_id):
+    return f'admin:{admin_id}'
+
+
+def bump_catalogue(admin_id):
+    """Record a change to the catalogue made by an admin. Call it after the write."""
+
+    now = timezone.now()
+    for scope in (GLOBAL_SCOPE, admin_scope(admin_id)):
+        if CatalogueVersion.objects.filter(scope=scope).update(version=F('version') + 1, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                CatalogueVersion.objects.create(scope=scope, version=1)
+        except IntegrityError:
+            # Created by a concurrent bump in the meantime
+            CatalogueVersion.objects.filter(scope=scope).update(version=F('version') + 1, updated_at=now)
+
+
+def catalogue_version(scope):
+    """Return (version, updated_at) of a scope; (0, None) before its first change."""
+
+    row = CatalogueVersion.objects.filter(scope=scope).values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization', 'Accept'])
+    return response
+
+
+def conditional_catalogue(role, scope='global'):
+    """
+        Make a GET view under @api_view answer conditional requests.
+
+        The response of the view must depend only on the query string and the
+        catalogue version of `scope`: 'global', or 'admin' for the requesting
+        admin's own scope. Users whose role is not `role` bypass the caching.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user = request.user
+            if getattr(user, 'role', None) != role:
+                return view(request, *args, **kwargs)
+            name = GLOBAL_SCOPE if scope == 'global' else admin_scope(user.id)
+            version, updated_at = catalogue_version(name)
+            renderer = request.accepted_renderer.format
+            variant = hashlib.sha256(
+                f'{name}|{view.__name__}|{request.META.get("QUERY_STRING", "")}|{renderer}'.encode()
+            ).hexdigest()[:16]
+            etag = f'"{version}-{variant}"'
+            last_modified = int(updated_at.timestamp()) if updated_at is not None else None
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return _set_validators(not_modified, etag, last_modified)
+            # The browsable API embeds per-request data, so only JSON is cached
+            cache = caches[CACHE_ALIAS] if renderer == 'json' else None
+            key = f'catalogue:{name}:{version}:{variant}'
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                content, content_type = cached
+                return _set_validators(HttpResponse(content, content_type=content_type), etag, last_modified)
+
+            response = view(request, *args, **kwargs)
+            if cache is not None and isinstance(response, Response) and response.status_code == 200:
+                def store(rendered):
+                    cache.set(key, (rendered.content, rendered['Content-Type']), CACHE_TIMEOUT)
+
+                response.add_post_render_callback(store)
+            return _set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,151 @@
+"""
+Precompiled quiz documents (QuizDocument).
+
+Publishing a quiz compiles it and its active questions, answers stripped,
+into the JSON served by get_quiz_document, stored as is and gzip-compressed.
+update_quiz, add_question, import_questions and update_question recompile
+the document of a published quiz, so a delivery is a blob read (or a hit in
+the small per-process cache of recent documents) instead of loading and
+serializing every question.
+
+The byte offsets of every question in the document are stored with it, so
+the questions drawn for a student from a pooled quiz are spliced out of the
+stored bytes without parsing them.
+"""
+
+import gzip
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import Question, Quiz, QuizDocument
+from .pagination import dumps
+from .serializers import QUESTION_DOCUMENT_ROWS, QUIZ_ROWS
+
+_config = getattr(settings, 'QUIZ_DOCUMENTS', {})
+COMPRESS_LEVEL = _config.get('COMPRESS_LEVEL', 6)
+MAX_CACHED = _config.get('MAX_CACHED', 64)
+
+_TAIL = b']}'
+
+
+def compile_quiz(quiz):
+    """Render quiz into an unsaved QuizDocument."""
+
+    head = ('{"quiz":' + dumps(QUIZ_ROWS.from_objects([quiz])[0]) + ',"questions":[').encode()
+    parts = [head]
+    position = len(head)
+    question_ids = array('q')
+    offsets = array('q')
+    questions = Question.objects.filter(quiz_id=quiz.id, is_active=True).order_by('id')
+    for index, question in enumerate(QUESTION_DOCUMENT_ROWS.data(questions)):
+        if index:
+            parts.append(b',')
+            position += 1
+        fragment = dumps(question).encode()
+        parts.append(fragment)
+        question_ids.append(question['id'])
+        offsets.extend((position, position + len(fragment)))
+        position += len(fragment)
+    parts.append(_TAIL)
+    content = b''.join(parts)
+    return QuizDocument(
+        quiz=quiz,
+        etag=hashlib.sha256(content).hexdigest()[:32],
+        content=content,
+        compressed=gzip.compress(content, COMPRESS_LEVEL),
+        question_ids=question_ids.tobytes(),
+        offsets=offsets.tobytes(),
+    )
+
+
+def publish(quiz_id):
+    """Compile and store the document of a quiz. Returns it, or None if the quiz does not exist."""
+
+    quiz = Quiz.objects.filter(id=quiz_id).first()
+    if quiz is None:
+        return None
+    document = compile_quiz(quiz)
+    document.save()
+    return document
+
+
+def ensure_published(quiz):
+    """Return the etag of the document of quiz, compiling and storing it if the quiz was never published."""
+
+    document = compile_quiz(quiz)
+    try:
+        with transaction.atomic():
+            document.save(force_insert=True)
+    except IntegrityError:
+        # Published by a concurrent first read or publish_quiz
+        return QuizDocument.objects.filter(quiz_id=quiz.id).values_list('etag', flat=True).get()
+    return document.etag
+
+
+def refresh(quiz_id):
+    """Recompile the document of a quiz if it is published. Call after changing the quiz or its questions."""
+
+    if QuizDocument.objects.filter(quiz_id=quiz_id).exists():
+        publish(quiz_id)
+
+
+def splice(content, question_ids, offsets, selected):
+    """The document restricted to the questions whose ids are in selected."""
+
+    ids = array('q')
+    ids.frombytes(bytes(question_ids))
+    bounds = array('q')
+    bounds.frombytes(bytes(offsets))
+    content = bytes(content)
+    head_end = bounds[0] if bounds else len(content) - len(_TAIL)
+    fragments = [content[bounds[2 * index]:bounds[2 * index + 1]] for index, question_id in enumerate(ids) if question_id in selected]
+    return content[:head_end] + b','.join(fragments) + _TAIL
+
+
+class DocumentCache:
+    """Process-local LRU of document blobs keyed by (quiz_id, etag, field)."""
+
+    def __init__(self, max_entries=MAX_CACHED):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+document_cache = DocumentCache()
+
+
+def document_fields(quiz_id, etag, fields):
+    """Values of fields of the document with etag, from the cache or one query."""
+
+    key = (quiz_id, etag, fields)
+    values = document_cache.get(key)
+    if values is None:
+        values = QuizDocument.objects.filter(quiz_id=quiz_id, etag=etag).values_list(*fields).first()
+        if values is None:
+            # Recompiled in the meantime
+            return None
+        values = tuple(bytes(value) for value in values)
+        document_cache.put(key, values)
+    return values
@@ -0,0 +1,201 @@
+"""
+Live submission feed (server-sent events) of a quiz's new attempts.
+
+Each process keeps one channel per watched quiz. The channel's task, running
+on the ASGI event loop, reads the quiz's attempts recorded since the last
+one it saw (id > last id) and the quiz's QuizStats rows, and fans each batch
+out to the queues of every subscriber, so many admins watching a quiz cost
+one query per POLL_INTERVAL rather than a full re-read per poll. Attempts
+recorded in this process wake the channel on commit (notify()); attempts
+recorded by other processes are picked up by the next poll.
+
+Event ids are attempt ids. A reconnect with Last-Event-ID only reads the
+attempts recorded after it before joining the live stream. Attempts can
+commit out of id order on server databases, so each poll rescans the ids
+broadcast during the last SETTLE_POLLS polls and sends only the new ones.
+A subscriber whose queue fills up is disconnected, and catches up from the
+database when it reconnects.
+"""
+
+import asyncio
+import contextvars
+import logging
+from collections import deque
+
+from django.conf import settings
+from .models import QuizAttempt
+from .pagination import dumps
+from .serializers import ATTEMPT_ROWS
+from .stats import aload_stats, stats_payload
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'SUBMISSION_FEED', {})
+POLL_INTERVAL = _config.get('POLL_INTERVAL', 1.0)
+HEARTBEAT = _config.get('HEARTBEAT', 15)
+QUEUE_SIZE = _config.get('QUEUE_SIZE', 1000)
+BATCH_SIZE = _config.get('BATCH_SIZE', 500)
+SETTLE_POLLS = _config.get('SETTLE_POLLS', 3)
+RETRY_MS = _config.get('RETRY_MS', 3000)
+
+
+def format_event(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _attempts_after(quiz_id, after_id, upto_id=None):
+    """The quiz's attempts with after_id < id (<= upto_id), in id order, BATCH_SIZE per query."""
+
+    while True:
+        queryset = QuizAttempt.objects.filter(quiz_id=quiz_id, id__gt=after_id).order_by('id')
+        if upto_id is not None:
+            queryset = queryset.filter(id__lte=upto_id)
+        rows = ATTEMPT_ROWS.to_dicts([row async for row in ATTEMPT_ROWS.values(queryset[:BATCH_SIZE])])
+        if rows:
+            yield rows
+        if len(rows) < BATCH_SIZE:
+            return
+        after_id = rows[-1]['id']
+
+
+async def _stats(quiz_id):
+    payload = stats_payload(*await aload_stats(quiz_id))
+    del payload['status']
+    return payload
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Channel:
+    """The attempts of one quiz, fanned out to the subscribers of this process."""
+
+    def __init__(self, quiz_id, loop, last_id):
+        self.quiz_id = quiz_id
+        self.loop = loop
+        self.subscribers = set()
+        self.wake = asyncio.Event()
+        self.last_id = last_id
+        self._marks = deque([last_id], maxlen=SETTLE_POLLS)
+        self._recent = set()
+        # A fresh context, so the task does not count towards the metrics of the request that started it
+        self.task = loop.create_task(self._run(), context=contextvars.Context())
+
+    def is_live(self, loop):
+        return self.loop is loop and not self.task.done()
+
+    async def _run(self):
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception('Submission feed of quiz %s failed to poll', self.quiz_id)
+
+    async def poll(self):
+        floor = self._marks[0]
+        fresh = []
+        async for rows in _attempts_after(self.quiz_id, floor):
+            fresh.extend(row for row in rows if row['id'] not in self._recent)
+        if fresh:
+            stats = await _stats(self.quiz_id)
+            # No await from here on, so a new subscriber sees either all of this batch or none of it
+            for subscriber in list(self.subscribers):
+                for row in fresh:
+                    subscriber.put(('attempt', row))
+                subscriber.put(('stats', stats))
+            self._recent.update(row['id'] for row in fresh)
+            self.last_id = max(self.last_id, max(row['id'] for row in fresh))
+        self._marks.append(self.last_id)
+        floor = self._marks[0]
+        self._recent = {attempt_id for attempt_id in self._recent if attempt_id > floor}
+
+
+class SubmissionFeed:
+    def __init__(self):
+        self._channels = {}
+
+    async def _channel(self, quiz_id):
+        loop = asyncio.get_running_loop()
+        channel = self._channels.get(quiz_id)
+        if channel is not None and channel.is_live(loop):
+            return channel
+        latest = await QuizAttempt.objects.filter(quiz_id=quiz_id).order_by('-id').values_list('id', flat=True).afirst()
+        # Another subscriber may have started one in the meantime
+        channel = self._channels.get(quiz_id)
+        if channel is None or not channel.is_live(loop):
+            channel = self._channels[quiz_id] = Channel(quiz_id, loop, latest or 0)
+        return channel
+
+    def notify(self, quiz_id):
+        """Wake the channel of a quiz whose attempts were just committed. Safe to call from any thread."""
+
+        channel = self._channels.get(quiz_id)
+        if channel is None:
+            return
+        try:
+            channel.loop.call_soon_threadsafe(channel.wake.set)
+        except RuntimeError:
+            # The loop is closed
+            pass
+
+    async def stream(self, quiz_id, last_event_id=None):
+        """
+            Yield the server-sent events of a quiz: its stats, the attempts
+            after last_event_id (if given), then new attempts and stats as
+            they are recorded, with a comment every HEARTBEAT seconds.
+        """
+
+        channel = await self._channel(quiz_id)
+        subscriber = Subscriber()
+        channel.subscribers.add(subscriber)
+        caught_up_to = channel.last_id
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            yield format_event('stats', await _stats(quiz_id))
+            sent = set()
+            if last_event_id is not None:
+                async for rows in _attempts_after(quiz_id, last_event_id, caught_up_to):
+                    for row in rows:
+                        sent.add(row['id'])
+                        yield format_event('attempt', row, row['id'])
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if subscriber.overflowed:
+                        return
+                    yield ': keepalive\n\n'
+                    continue
+                if event == 'attempt':
+                    if data['id'] in sent:
+                        continue
+                    yield format_event(event, data, data['id'])
+                else:
+                    yield format_event(event, data)
+                if subscriber.overflowed and subscriber.queue.empty():
+                    return
+        finally:
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers:
+                channel.wake.set()
+
+
+submission_feed = SubmissionFeed()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from admin_actions.search import create_index, drop_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text index of the questions and reindex every question'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drop_index(connection)
+            create_index(connection)
+        self.stdout.write(f'Rebuilt the question search index ({connection.vendor})')
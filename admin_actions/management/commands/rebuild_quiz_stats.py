@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from admin_actions.models import Quiz, QuizStats
+from admin_actions.stats import rebuild_stats
+from user_actions.draws import unpack_ids
+from user_actions.models import QuestionDraw
+from user_actions.scoring import load_answer_key, total_marks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-quiz score statistics from the recorded attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, action='append', help='Only rebuild this quiz (repeatable)')
+
+    def handle(self, *args, **options):
+        quizzes = Quiz.objects.order_by('id')
+        if options['quiz']:
+            quizzes = quizzes.filter(id__in=options['quiz'])
+        for quiz_id, draw_count in quizzes.values_list('id', 'draw_count'):
+            # Attempts are bucketed against the current marks of the questions they got
+            answer_key = load_answer_key(quiz_id)
+            quiz_total = total_marks(answer_key)
+            draw_totals = {
+                user_id: total_marks(answer_key, unpack_ids(question_ids))
+                for user_id, question_ids in QuestionDraw.objects.filter(quiz_id=quiz_id).values_list('user_id', 'question_ids')
+            } if draw_count else {}
+            with transaction.atomic():
+                QuizStats.objects.filter(quiz_id=quiz_id).delete()
+                stats = rebuild_stats(quiz_id, lambda user_id: draw_totals.get(user_id, quiz_total))
+            self.stdout.write(f'Quiz {quiz_id}: {stats.attempt_count} attempts')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from task_project.replicas import REPLICAS, copy_sqlite_primary
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database into the SQLite replicas (DB_REPLICAS), to try replica routing locally'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Copy again every INTERVAL seconds, simulating replication lag')
+
+    def handle(self, *args, **options):
+        if not REPLICAS:
+            raise CommandError('No replicas configured; set DB_REPLICAS')
+        while True:
+            copied = copy_sqlite_primary()
+            if not copied:
+                raise CommandError('The primary database is not SQLite')
+            self.stdout.write(f'Copied the primary into {", ".join(copied)}')
+            if options['interval'] is None:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0002_remove_question_created_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 12:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_attempts(apps, schema_editor):
+    # Keep the first attempt of each user on a quiz so the unique constraint can be added
+    QuizAttempt = apps.get_model('admin_actions', 'QuizAttempt')
+    first_ids = QuizAttempt.objects.values('user', 'quiz').annotate(first_id=Min('id')).values('first_id')
+    QuizAttempt.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0003_quiz_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['created_by', 'name'], name='category_owner_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['quiz', 'is_active'], name='question_quiz_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['created_by', 'name'], name='quiz_owner_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['is_active', 'id'], name='quiz_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['attempted_at'], name='attempt_attempted_at_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_attempts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='quizattempt',
+            constraint=models.UniqueConstraint(fields=('user', 'quiz'), name='unique_attempt_per_user'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizStats',
+            fields=[
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='admin_actions.quiz')),
+                ('attempt_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('score_min', models.IntegerField(blank=True, null=True)),
+                ('score_max', models.IntegerField(blank=True, null=True)),
+                ('pass_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizStatsBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('stats', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='admin_actions.quizstats')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stats', 'bucket'), name='unique_bucket_per_quiz')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0005_quiz_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='quiz_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='responses',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='QuizLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('question_ids', models.BinaryField()),
+                ('answers', models.BinaryField()),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='admin_actions.quiz')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('quiz', 'version'), name='unique_layout_per_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 12:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0007_catalogue_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='draw_count',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
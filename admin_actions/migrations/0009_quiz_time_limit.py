@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 12:39
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0008_quiz_draw_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='time_limit',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
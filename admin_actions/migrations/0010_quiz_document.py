@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0009_quiz_time_limit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizDocument',
+            fields=[
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='admin_actions.quiz')),
+                ('etag', models.CharField(max_length=64)),
+                ('content', models.BinaryField()),
+                ('compressed', models.BinaryField()),
+                ('question_ids', models.BinaryField()),
+                ('offsets', models.BinaryField()),
+                ('compiled_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
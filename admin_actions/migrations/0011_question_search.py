@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# The full-text index of admin_actions.search as of this migration, inlined so
+# that later changes to that module do not change what this migration runs.
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS admin_actions_question_fts USING fts5("
+    "question_text, option1, option2, option3, option4, "
+    "content='admin_actions_question', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS admin_actions_question_fts_insert AFTER INSERT ON admin_actions_question BEGIN "
+    "INSERT INTO admin_actions_question_fts(rowid, question_text, option1, option2, option3, option4) "
+    "VALUES (new.id, new.question_text, new.option1, new.option2, new.option3, new.option4); END",
+    "CREATE TRIGGER IF NOT EXISTS admin_actions_question_fts_delete AFTER DELETE ON admin_actions_question BEGIN "
+    "INSERT INTO admin_actions_question_fts(admin_actions_question_fts, rowid, question_text, option1, option2, option3, option4) "
+    "VALUES ('delete', old.id, old.question_text, old.option1, old.option2, old.option3, old.option4); END",
+    "CREATE TRIGGER IF NOT EXISTS admin_actions_question_fts_update "
+    "AFTER UPDATE OF question_text, option1, option2, option3, option4 ON admin_actions_question BEGIN "
+    "INSERT INTO admin_actions_question_fts(admin_actions_question_fts, rowid, question_text, option1, option2, option3, option4) "
+    "VALUES ('delete', old.id, old.question_text, old.option1, old.option2, old.option3, old.option4); "
+    "INSERT INTO admin_actions_question_fts(rowid, question_text, option1, option2, option3, option4) "
+    "VALUES (new.id, new.question_text, new.option1, new.option2, new.option3, new.option4); END",
+    "INSERT INTO admin_actions_question_fts(admin_actions_question_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS admin_actions_question_fts_insert',
+    'DROP TRIGGER IF EXISTS admin_actions_question_fts_delete',
+    'DROP TRIGGER IF EXISTS admin_actions_question_fts_update',
+    'DROP TABLE IF EXISTS admin_actions_question_fts',
+]
+POSTGRESQL_INDEX = [
+    "CREATE INDEX IF NOT EXISTS question_search_idx ON admin_actions_question USING GIN "
+    "(to_tsvector('simple', question_text || ' ' || option1 || ' ' || option2 || ' ' || option3 || ' ' || option4))",
+]
+POSTGRESQL_DROP = ['DROP INDEX IF EXISTS question_search_idx']
+MYSQL_INDEX = ['CREATE FULLTEXT INDEX question_search_idx ON admin_actions_question (question_text, option1, option2, option3, option4)']
+MYSQL_DROP = ['DROP INDEX question_search_idx ON admin_actions_question']
+
+
+def _run(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+        _run(connection, SQLITE_INDEX)
+    elif connection.vendor == 'postgresql':
+        _run(connection, POSTGRESQL_INDEX)
+    elif connection.vendor == 'mysql':
+        _run(connection, MYSQL_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    _run(connection, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP, 'mysql': MYSQL_DROP}.get(connection.vendor, []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0010_quiz_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
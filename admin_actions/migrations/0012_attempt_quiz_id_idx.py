@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 12:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0011_question_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['quiz', 'id'], name='attempt_quiz_id_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -8,6 +9,11 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'name'], name='category_owner_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -17,6 +23,18 @@ class Quiz(models.Model):
     is_active = models.BooleanField(default=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now=True)
+    # Bumped whenever the questions of the quiz change
+    version = models.PositiveIntegerField(default=1)
+    # Questions drawn for each student from the quiz's pool; null delivers them all
+    draw_count = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+    # Seconds allowed per attempt session; timed quizzes can only be taken through start_attempt
+    time_limit = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'name'], name='quiz_owner_name_idx'),
+            models.Index(fields=['is_active', 'id'], name='quiz_active_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -33,6 +51,11 @@ class Question(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['quiz', 'is_active'], name='question_quiz_active_idx'),
+        ]
+
     def __str__(self):
         return self.question_text[:50]
 
@@ -44,6 +67,109 @@ class QuizAttempt(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
     attempted_at = models.DateTimeField(auto_now=True)
+    # Selected options packed one byte per question, in the order of the quiz's
+    # QuizLayout for quiz_version (see user_actions.scoring.grade_answers)
+    quiz_version = models.PositiveIntegerField(null=True, blank=True)
+    responses = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'quiz'], name='unique_attempt_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['attempted_at'], name='attempt_attempted_at_idx'),
+            # Tailing a quiz's new attempts (admin_actions.feed)
+            models.Index(fields=['quiz', 'id'], name='attempt_quiz_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.quiz.name}"
+
+class QuizLayout(models.Model):
+    """
+        Question order of a quiz version, used to decode QuizAttempt.responses.
+        question_ids is an array('q') of question ids and answers holds the
+        correct option number of each, one byte per question.
+    """
+
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField()
+    question_ids = models.BinaryField()
+    answers = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['quiz', 'version'], name='unique_layout_per_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.quiz_id} v{self.version}"
+
+class QuizStats(models.Model):
+    """
+        Running score statistics of a quiz, incremented as attempts are
+        recorded. The histogram is kept in QuizStatsBucket rows.
+    """
+
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    attempt_count = models.PositiveIntegerField(default=0)
+    score_sum = models.BigIntegerField(default=0)
+    score_min = models.IntegerField(null=True, blank=True)
+    score_max = models.IntegerField(null=True, blank=True)
+    pass_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.quiz_id} ({self.attempt_count} attempts)"
+
+class QuizStatsBucket(models.Model):
+    """
+        Number of attempts of a quiz whose score falls in the bucket-th
+        equal-width bucket of the quiz's total marks (see admin_actions.stats).
+    """
+
+    stats = models.ForeignKey(QuizStats, on_delete=models.CASCADE, related_name='buckets')
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stats', 'bucket'], name='unique_bucket_per_quiz'),
+        ]
+
+    def __str__(self):
+        return f"{self.stats_id}[{self.bucket}] = {self.count}"
+
+class CatalogueVersion(models.Model):
+    """
+        Change counter of the catalogue, bumped by the admin add/update views.
+        The 'global' scope covers every quiz and question; 'admin:<id>' only
+        the categories, quizzes and questions written by that admin. Drives
+        the ETags of the catalogue listings (see admin_actions.catalogue).
+    """
+
+    scope = models.CharField(max_length=64, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+class QuizDocument(models.Model):
+    """
+        Pre-rendered student view of a published quiz, answers stripped (see
+        admin_actions.documents). content is the JSON and compressed its gzip.
+        question_ids is an array('q') of the questions in id order and offsets
+        an array('q') of the start and end byte offset of each in content.
+    """
+
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, primary_key=True, related_name='document')
+    etag = models.CharField(max_length=64)
+    content = models.BinaryField()
+    compressed = models.BinaryField()
+    question_ids = models.BinaryField()
+    offsets = models.BinaryField()
+    compiled_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.quiz.name}"
\ No newline at end of file
+        return f"{self.quiz_id} ({self.etag})"
@@ -0,0 +1,116 @@
+import json
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 500
+
+
+def _page_query(queryset, request, default_limit):
+    limit = min(max(int(request.GET.get('limit', default_limit)), 1), MAX_PAGE_SIZE)
+    cursor = request.GET.get('cursor')
+    queryset = queryset.order_by('id')
+    if cursor:
+        queryset = queryset.filter(id__gt=int(cursor))
+    return queryset[:limit + 1], limit
+
+
+def _split_page(items, limit):
+    if len(items) > limit:
+        items = items[:limit]
+        return items, items[-1].id
+    return items, None
+
+
+def keyset_page(queryset, request, default_limit=DEFAULT_PAGE_SIZE):
+    """
+        Return one page of a queryset ordered by id, and the cursor of the next page.
+
+        Query params:
+        - cursor (int, optional): The next_cursor returned by the previous page
+        - limit (int, optional): Page size, capped at MAX_PAGE_SIZE
+
+        Raises ValueError if cursor or limit is not a valid integer.
+    """
+
+    queryset, limit = _page_query(queryset, request, default_limit)
+    return _split_page(list(queryset), limit)
+
+
+async def akeyset_page(queryset, request, default_limit=DEFAULT_PAGE_SIZE):
+    """See keyset_page()."""
+
+    queryset, limit = _page_query(queryset, request, default_limit)
+    return _split_page([item async for item in queryset], limit)
+
+
+def keyset_rows(queryset, fields, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        Yield values_list rows of a queryset in id order, chunk_size rows per
+        query, using id > last id instead of OFFSET. fields must start with 'id'.
+        Memory use is bounded by chunk_size regardless of the total row count.
+    """
+
+    queryset = queryset.order_by('id').values_list(*fields)
+    last_id = None
+    while True:
+        page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
+
+
+def dumps(data):
+    # Same encoding as rest_framework's JSONRenderer
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream_json_array(queryset, serializer, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        Yield a JSON array of the queryset serialized by a RowSerializer
+        without building the whole list in memory. Rows are read with a
+        server-side iterator and serialized chunk_size at a time.
+    """
+
+    rows = serializer.values(queryset).iterator(chunk_size=chunk_size)
+    yield '['
+    first = True
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        body = _json_items(chunk, serializer)
+        yield body if first else ',' + body
+        first = False
+    yield ']'
+
+
+async def astream_json_array(queryset, serializer, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        See stream_json_array(). values_list querysets cannot be iterated
+        lazily with aiterator(), so model instances are read instead.
+    """
+
+    yield '['
+    first = True
+    chunk = []
+    async for obj in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            body = dumps(serializer.from_objects(chunk))[1:-1]
+            yield body if first else ',' + body
+            first = False
+            chunk = []
+    if chunk:
+        body = dumps(serializer.from_objects(chunk))[1:-1]
+        yield body if first else ',' + body
+    yield ']'
+
+
+def _json_items(chunk, serializer):
+    # The serialized chunk without its enclosing brackets
+    return dumps(serializer.to_dicts(chunk))[1:-1]
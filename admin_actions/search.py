@@ -0,0 +1,211 @@
+"""
+Full-text search over an admin's question bank (question_text and the
+options of the questions of the quizzes they created).
+
+Each backend searches its own full-text index:
+- SQLite: an FTS5 table, admin_actions_question_fts, with external content
+  from admin_actions_question. Triggers keep it in sync on every insert,
+  update and delete, bulk_create and queryset updates included. Results are
+  ranked by bm25().
+- PostgreSQL: a GIN index on the to_tsvector() of the text columns, ranked
+  by ts_rank().
+- MySQL: a FULLTEXT index over the text columns, ranked by MATCH() AGAINST().
+Any other backend, or SQLite built without FTS5, falls back to icontains
+filters ordered by id.
+
+Every term must match; the last one also matches as a prefix. Results are
+ordered by (key, id), where key is the negated relevance, and paginated with
+a keyset cursor over that pair, so deep pages cost the same as the first.
+
+Table rebuilds by later SQLite migrations of Question drop the triggers;
+run `manage.py rebuild_question_index` after such a migration.
+"""
+
+import base64
+import re
+
+from django.db import connection
+from django.db.models import Q
+from .models import Question
+
+FTS_TABLE = 'admin_actions_question_fts'
+TEXT_COLUMNS = ('question_text', 'option1', 'option2', 'option3', 'option4')
+MAX_TERMS = 10
+DEFAULT_SEARCH_SIZE = 20
+MAX_SEARCH_SIZE = 100
+
+_TERM = re.compile(r'\w+')
+_fts_tables = {}
+_columns = ', '.join(TEXT_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in TEXT_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in TEXT_COLUMNS)
+
+SQLITE_INDEX = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_columns}, "
+    f"content='admin_actions_question', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON admin_actions_question BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON admin_actions_question BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF {_columns} ON admin_actions_question BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def _pg_vector(prefix=''):
+    # The query must use the same expression as the index for the index to be used
+    return "to_tsvector('simple', " + " || ' ' || ".join(f'{prefix}{column}' for column in TEXT_COLUMNS) + ')'
+
+
+_PG_VECTOR = _pg_vector('q.')
+POSTGRESQL_INDEX = [
+    f'CREATE INDEX IF NOT EXISTS question_search_idx ON admin_actions_question USING GIN ({_pg_vector()})',
+]
+POSTGRESQL_DROP = ['DROP INDEX IF EXISTS question_search_idx']
+MYSQL_INDEX = [f'CREATE FULLTEXT INDEX question_search_idx ON admin_actions_question ({_columns})']
+MYSQL_DROP = ['DROP INDEX question_search_idx ON admin_actions_question']
+
+
+def _sqlite_has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def create_index(connection):
+    """Create (or repair) the full-text index of the backend and index the existing questions."""
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if not _sqlite_has_fts5(cursor):
+                return
+            statements = SQLITE_INDEX
+        elif connection.vendor == 'postgresql':
+            statements = POSTGRESQL_INDEX
+        elif connection.vendor == 'mysql':
+            statements = MYSQL_INDEX
+        else:
+            statements = []
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_index(connection):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP, 'mysql': MYSQL_DROP}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def parse_terms(query):
+    return _TERM.findall(query or '')[:MAX_TERMS]
+
+
+def encode_cursor(key, question_id):
+    return base64.urlsafe_b64encode(f'{key!r}:{question_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (key, question_id). Raises ValueError on a malformed cursor."""
+
+    try:
+        key, question_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':')
+        return float(key), int(question_id)
+    except (UnicodeDecodeError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def _has_fts_table():
+    # Looked up once per database; run rebuild_question_index and restart after creating it
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[name]
+
+
+def _match(terms):
+    """
+        (join, condition, key, condition params, key params) SQL fragments of
+        the backend's full-text index, None when there is none.
+    """
+
+    if connection.vendor == 'sqlite' and _has_fts_table():
+        expression = ' '.join(f'"{term}"' for term in terms) + '*'
+        return (
+            f'JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = q.id', f'{FTS_TABLE} MATCH %s',
+            f'bm25({FTS_TABLE})', [expression], [],
+        )
+    if connection.vendor == 'postgresql':
+        expression = ' & '.join(terms) + ':*'
+        return (
+            '', f"{_PG_VECTOR} @@ to_tsquery('simple', %s)",
+            f"-ts_rank({_PG_VECTOR}, to_tsquery('simple', %s))", [expression], [expression],
+        )
+    if connection.vendor == 'mysql':
+        expression = ' '.join(f'+{term}' for term in terms) + '*'
+        against = f'MATCH({", ".join(f"q.{column}" for column in TEXT_COLUMNS)}) AGAINST (%s IN BOOLEAN MODE)'
+        return '', against, f'-{against}', [expression], [expression]
+    return None
+
+
+def _fallback(terms, owner_id, filters, after, limit):
+    questions = Question.objects.filter(quiz__created_by_id=owner_id)
+    for term in terms:
+        condition = Q()
+        for column in TEXT_COLUMNS:
+            condition |= Q(**{f'{column}__icontains': term})
+        questions = questions.filter(condition)
+    if filters.get('quiz_id') is not None:
+        questions = questions.filter(quiz_id=filters['quiz_id'])
+    if filters.get('category_id') is not None:
+        questions = questions.filter(quiz__category_id=filters['category_id'])
+    if filters.get('is_active') is not None:
+        questions = questions.filter(is_active=filters['is_active'])
+    if after is not None:
+        questions = questions.filter(id__gt=after[1])
+    return [(question_id, quiz_id, 0.0) for question_id, quiz_id in questions.order_by('id').values_list('id', 'quiz_id')[:limit]]
+
+
+def search(terms, owner_id, filters, after=None, limit=DEFAULT_SEARCH_SIZE):
+    """
+        Return up to limit (question id, quiz id, key) rows matching every term
+        among the questions of the quizzes created by owner_id, best first.
+        filters may hold quiz_id, category_id and is_active; after is the
+        (key, id) of the last row of the previous page.
+    """
+
+    match = _match(terms)
+    if match is None:
+        return _fallback(terms, owner_id, filters, after, limit)
+    join, condition, key, match_params, key_params = match
+    join += ' JOIN admin_actions_quiz z ON z.id = q.quiz_id'
+    where, params = [condition, 'z.created_by_id = %s'], list(match_params) + [owner_id]
+    if filters.get('category_id') is not None:
+        where.append('z.category_id = %s')
+        params.append(filters['category_id'])
+    if filters.get('quiz_id') is not None:
+        where.append('q.quiz_id = %s')
+        params.append(filters['quiz_id'])
+    if filters.get('is_active') is not None:
+        where.append('q.is_active = %s')
+        params.append(filters['is_active'])
+    sql = (
+        f'SELECT id, quiz_id, search_key FROM (SELECT q.id AS id, q.quiz_id AS quiz_id, {key} AS search_key '
+        f'FROM admin_actions_question q {join} WHERE {" AND ".join(where)}) ranked'
+    )
+    params = key_params + params
+    if after is not None:
+        sql += ' WHERE search_key > %s OR (search_key = %s AND id > %s)'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY search_key, id LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(question_id, quiz_id, float(key)) for question_id, quiz_id, key in cursor.fetchall()]
@@ -1,6 +1,16 @@
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import *
 
+# DRF fields whose to_representation returns database values unchanged
+IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.BooleanField, serializers.CharField, serializers.EmailField,
+    serializers.ChoiceField, serializers.PrimaryKeyRelatedField, serializers.ReadOnlyField,
+)
+
 class CategorySerial(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -9,9 +19,17 @@ class CategorySerial(serializers.ModelSerializer):
 class AddQuizSerial(serializers.ModelSerializer):
     class Meta:
         model = Quiz
-        exclude = ['created_by', 'category']
+        exclude = ['created_by', 'category', 'version']
 
 class QuizSerial(serializers.ModelSerializer):
+    class Meta:
+        model = Quiz
+        fields = '__all__'
+        read_only_fields = ['version']
+
+class QuizListSerial(serializers.ModelSerializer):
+    question_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Quiz
         fields = '__all__'
@@ -21,6 +39,32 @@ class QuestionSerial(serializers.ModelSerializer):
         model = Question
         exclude = ['quiz']
 
+class QuestionDocumentSerial(serializers.ModelSerializer):
+    # The student view of a question: no answer
+    class Meta:
+        model = Question
+        exclude = ['quiz', 'answer']
+
+class QuestionBulkSerial(serializers.ListSerializer):
+    """
+        many=True validation for bulk question imports.
+        Each row is validated on its own: valid rows end up in validated_data
+        and invalid ones in row_errors (index -> errors) instead of failing
+        the whole list.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of questions']})
+        self.row_errors = {}
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                valid.append(self.child.run_validation(item))
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+        return valid
+
 class AddAttemptSerial(serializers.ModelSerializer):
     class Meta:
         model = QuizAttempt
@@ -29,4 +73,100 @@ class AddAttemptSerial(serializers.ModelSerializer):
 class AttemptSerial(serializers.ModelSerializer):
     class Meta:
         model = QuizAttempt
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['quiz_version', 'responses']
+
+def _iso_datetimes(field):
+    """
+        Converter factory for a DateTimeField rendered as ISO 8601: the same
+        output as field.to_representation for aware datetimes, with the
+        current timezone looked up once per list instead of once per value.
+    """
+
+    def factory():
+        field_timezone = timezone.get_current_timezone()
+
+        def convert(value):
+            if value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return convert
+    return factory
+
+def _converter_factory(field):
+    if (
+        type(field) is serializers.DateTimeField and settings.USE_TZ and not hasattr(field, 'timezone')
+        and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601
+    ):
+        return _iso_datetimes(field)
+    return lambda: field.to_representation
+
+class RowSerializer:
+    """
+        Read-only fast path of a ModelSerializer for large lists.
+
+        The serializer's fields are inspected once; rows are then read with
+        values_list() (or plain attribute access on loaded objects) and turned
+        into dicts with the same keys, order and values, so the rendered JSON
+        is byte-identical to serializer_class(..., many=True).data. Fields that
+        do not return database values as-is go through their DRF
+        to_representation, except ISO 8601 datetimes (see _iso_datetimes).
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._compiled = None
+
+    def _compile(self):
+        if self._compiled is None:
+            serializer = self.serializer_class()
+            model = serializer.Meta.model
+            names, sources, attributes, converters = [], [], [], []
+            for index, field in enumerate(field for field in serializer.fields.values() if not field.write_only):
+                names.append(field.field_name)
+                sources.append(field.source)
+                try:
+                    attributes.append(model._meta.get_field(field.source).attname)
+                except FieldDoesNotExist:
+                    attributes.append(field.source)
+                if type(field) not in IDENTITY_FIELDS:
+                    converters.append((index, _converter_factory(field)))
+            self._compiled = (tuple(names), sources, attributes, converters)
+        return self._compiled
+
+    def values(self, queryset):
+        """The queryset as values_list rows in field order."""
+
+        return queryset.values_list(*self._compile()[1])
+
+    def to_dicts(self, rows):
+        names, _, _, factories = self._compile()
+        if not factories:
+            return [dict(zip(names, row)) for row in rows]
+        converters = [(index, factory()) for index, factory in factories]
+        data = []
+        for row in rows:
+            row = list(row)
+            for index, convert in converters:
+                if row[index] is not None:
+                    row[index] = convert(row[index])
+            data.append(dict(zip(names, row)))
+        return data
+
+    def data(self, queryset):
+        return self.to_dicts(self.values(queryset))
+
+    def from_objects(self, objects):
+        """Serialize already loaded model instances."""
+
+        attributes = self._compile()[2]
+        return self.to_dicts([tuple(getattr(obj, attribute) for attribute in attributes) for obj in objects])
+
+CATEGORY_ROWS = RowSerializer(CategorySerial)
+QUIZ_ROWS = RowSerializer(QuizSerial)
+QUIZ_LIST_ROWS = RowSerializer(QuizListSerial)
+QUESTION_ROWS = RowSerializer(QuestionSerial)
+QUESTION_DOCUMENT_ROWS = RowSerializer(QuestionDocumentSerial)
+ATTEMPT_ROWS = RowSerializer(AttemptSerial)
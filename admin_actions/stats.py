@@ -0,0 +1,152 @@
+"""
+Incrementally maintained per-quiz score statistics (QuizStats).
+
+Scores are bucketed by their share of the total marks of the questions the
+student got: the whole quiz, or their draw from a pooled quiz. Changing QUIZ_STATS requires `python manage.py rebuild_quiz_stats`.
+
+Recording attempts adds their totals to the stats row and bucket rows with
+F() expressions in two UPDATEs, without reading them first, so concurrent
+attempts of a quiz only hold the rows for the rest of their own transaction
+instead of queueing on a SELECT ... FOR UPDATE.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+from .models import QuizAttempt, QuizStats, QuizStatsBucket
+
+_config = getattr(settings, 'QUIZ_STATS', {})
+PASS_PERCENT = _config.get('PASS_PERCENT', 40)
+BUCKETS = _config.get('BUCKETS', 10)
+
+
+def tally(results):
+    """Return (attempts per bucket, number of passing scores) of (score, total marks) pairs."""
+
+    buckets = Counter()
+    passed = 0
+    for score, total_marks in results:
+        percent = score * 100 / total_marks if total_marks > 0 else 0
+        buckets[min(max(int(percent * BUCKETS // 100), 0), BUCKETS - 1)] += 1
+        if percent >= PASS_PERCENT:
+            passed += 1
+    return buckets, passed
+
+
+def _create_stats(quiz_id):
+    # A concurrent first attempt may create them first
+    QuizStats.objects.bulk_create([QuizStats(quiz_id=quiz_id)], ignore_conflicts=True)
+    QuizStatsBucket.objects.bulk_create(
+        [QuizStatsBucket(stats_id=quiz_id, bucket=bucket) for bucket in range(BUCKETS)], ignore_conflicts=True,
+    )
+
+
+def record_scores(quiz_id, results):
+    """
+        Add newly recorded attempts to the quiz's stats, as (score, total
+        marks of the questions the student got) pairs. Call inside the
+        transaction that inserts the attempts, with the attempts that were
+        actually inserted.
+    """
+
+    if not results:
+        return
+    scores = [score for score, _ in results]
+    buckets, passed = tally(results)
+    low, high = Value(min(scores)), Value(max(scores))
+    counters = {
+        'attempt_count': F('attempt_count') + len(scores),
+        'score_sum': F('score_sum') + sum(scores),
+        'score_min': Coalesce(Least('score_min', low), low),
+        'score_max': Coalesce(Greatest('score_max', high), high),
+        'pass_count': F('pass_count') + passed,
+        'updated_at': timezone.now(),
+    }
+    if not QuizStats.objects.filter(quiz_id=quiz_id).update(**counters):
+        _create_stats(quiz_id)
+        QuizStats.objects.filter(quiz_id=quiz_id).update(**counters)
+    QuizStatsBucket.objects.filter(stats_id=quiz_id, bucket__in=buckets).update(count=F('count') + Case(
+        *(When(bucket=bucket, then=Value(count)) for bucket, count in buckets.items()),
+        output_field=IntegerField(),
+    ))
+
+
+def rebuild_stats(quiz_id, total_of, chunk_size=5000):
+    """
+        Recompute a quiz's stats from all of its attempts. total_of maps a
+        user id to the total marks of the questions the user got. Call inside
+        a transaction, after deleting the quiz's QuizStats row.
+    """
+
+    stats = QuizStats(quiz_id=quiz_id)
+    histogram = Counter()
+    rows = QuizAttempt.objects.filter(quiz_id=quiz_id).values_list('user_id', 'score').iterator(chunk_size=chunk_size)
+    chunk = []
+    for user_id, score in rows:
+        chunk.append((score, total_of(user_id)))
+        if len(chunk) == chunk_size:
+            _add_chunk(stats, histogram, chunk)
+            chunk = []
+    _add_chunk(stats, histogram, chunk)
+    stats.save()
+    QuizStatsBucket.objects.bulk_create(
+        QuizStatsBucket(stats_id=quiz_id, bucket=bucket, count=histogram[bucket]) for bucket in range(BUCKETS)
+    )
+    return stats
+
+
+def _add_chunk(stats, histogram, results):
+    if not results:
+        return
+    scores = [score for score, _ in results]
+    buckets, passed = tally(results)
+    histogram.update(buckets)
+    stats.attempt_count += len(scores)
+    stats.score_sum += sum(scores)
+    stats.score_min = min(scores) if stats.score_min is None else min(stats.score_min, *scores)
+    stats.score_max = max(scores) if stats.score_max is None else max(stats.score_max, *scores)
+    stats.pass_count += passed
+
+
+def _histogram(counts):
+    histogram = [0] * BUCKETS
+    for bucket, count in counts:
+        if bucket < BUCKETS:
+            histogram[bucket] = count
+    return histogram
+
+
+def load_stats(quiz_id):
+    """Return (stats, histogram) of a quiz, zeroed when nothing was recorded yet."""
+
+    stats = QuizStats.objects.filter(quiz_id=quiz_id).first() or QuizStats(quiz_id=int(quiz_id))
+    return stats, _histogram(QuizStatsBucket.objects.filter(stats_id=quiz_id).values_list('bucket', 'count'))
+
+
+async def aload_stats(quiz_id):
+    """See load_stats()."""
+
+    stats = await QuizStats.objects.filter(quiz_id=quiz_id).afirst() or QuizStats(quiz_id=int(quiz_id))
+    return stats, _histogram([row async for row in QuizStatsBucket.objects.filter(stats_id=quiz_id).values_list('bucket', 'count')])
+
+
+def stats_payload(stats, histogram):
+    count = stats.attempt_count
+    width = 100 / BUCKETS
+    return {
+        'status': True,
+        'quiz': stats.quiz_id,
+        'attempts': count,
+        'average': stats.score_sum / count if count else None,
+        'min': stats.score_min,
+        'max': stats.score_max,
+        'pass_rate': stats.pass_count / count if count else None,
+        'pass_percent': PASS_PERCENT,
+        'histogram': [
+            {'from_percent': round(index * width, 2), 'to_percent': round((index + 1) * width, 2), 'count': bucket}
+            for index, bucket in enumerate(histogram)
+        ],
+    }
@@ -1,3 +1,188 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from task_project.metrics import assert_query_budgets
+from user.authentication import token_cache
+from user_actions.cache import answer_key_cache
+from user_actions.draws import pack_ids
+from user_actions.leaderboard import leaderboards
+from user_actions.models import QuestionDraw
+from .models import Category, Quiz, Question, QuizStats
+from .stats import rebuild_stats, stats_payload, load_stats
+
+User = get_user_model()
+
+
+class AdminAPITestCase(TestCase):
+    """Two admins, one owning a quiz of four one-mark questions (option1 is right), and students."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin@x.com', email='admin@x.com', password='pw', role='admin')
+        cls.other_admin = User.objects.create_user(username='other@x.com', email='other@x.com', password='pw', role='admin')
+        cls.students = [
+            User.objects.create_user(username=f's{index}@x.com', email=f's{index}@x.com', password='pw', role='user')
+            for index in range(3)
+        ]
+        cls.category = Category.objects.create(name='Science', created_by=cls.admin)
+        cls.quiz = Quiz.objects.create(name='Biology', category=cls.category, created_by=cls.admin)
+        cls.questions = [
+            Question.objects.create(
+                quiz=cls.quiz, question_text=f'Question {index}', option1='a', option2='b', option3='c', option4='d',
+                answer=1, marks=1,
+            )
+            for index in range(4)
+        ]
+
+    def setUp(self):
+        # Process-local state outlives the test transactions
+        for local in (token_cache, answer_key_cache, leaderboards, cache):
+            local.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client
+
+    def attempt(self, student, correct):
+        answers = [
+            {'question': question.id, 'selected_option': 'a' if index < correct else 'b'}
+            for index, question in enumerate(self.questions)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(student).post('/api/attempt_quiz', {'quiz_id': self.quiz.id, 'answers': answers}, format='json')
+        self.assertTrue(response.json()['status'], response.json())
+
+
+class ImportQuestionsTests(AdminAPITestCase):
+    def test_bodies_without_questions_are_rejected(self):
+        client = self.client_for(self.admin)
+        for body in ('x', 5, None, {'questions': 'x'}):
+            with self.subTest(body=body):
+                response = client.post(f'/api/admin/import_questions?quiz_id={self.quiz.id}', body, format='json')
+                self.assertEqual(response.json(), {'status': False, 'message': 'Questions are required'})
+
+
+class UpdateQuestionTests(AdminAPITestCase):
+    def test_only_the_quiz_owner_can_edit_its_questions(self):
+        question = self.questions[0]
+        path = f'/api/admin/update_question?quiz_id={question.id}'
+        other = self.client_for(self.other_admin).patch(path, {'question_text': 'Changed'}, format='json')
+        self.assertEqual(other.json(), {'status': False, 'message': 'Question not found'})
+        owner = self.client_for(self.admin)
+        listing = owner.get('/api/admin/get_quiz')
+        self.assertTrue(owner.patch(path, {'question_text': 'Changed'}, format='json').json()['status'])
+        # The owner's catalogue is bumped, so a conditional read sees the new version
+        response = owner.get('/api/admin/get_quiz', HTTP_IF_NONE_MATCH=listing['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['version'], 2)
+
+
+class QuizStatsTests(AdminAPITestCase):
+    def test_attempts_are_added_to_the_stats(self):
+        for student, correct in zip(self.students, (4, 1, 3)):
+            self.attempt(student, correct)
+        response = self.client_for(self.admin).get('/api/admin/get_quiz_stats', {'quiz_id': self.quiz.id}).json()
+        self.assertEqual(
+            (response['attempts'], response['min'], response['max'], response['average'], response['pass_rate']),
+            (3, 1, 4, 8 / 3, 2 / 3),
+        )
+        self.assertEqual([bucket['count'] for bucket in response['histogram']], [0, 0, 1, 0, 0, 0, 0, 1, 0, 1])
+
+    def test_rebuild_matches_incremental_stats(self):
+        for student, correct in zip(self.students, (2, 0, 4)):
+            self.attempt(student, correct)
+        incremental = stats_payload(*load_stats(self.quiz.id))
+        with transaction.atomic():
+            QuizStats.objects.filter(quiz=self.quiz).delete()
+            rebuild_stats(self.quiz.id, lambda user_id: 4)
+        self.assertEqual(stats_payload(*load_stats(self.quiz.id)), incremental)
+
+    def test_pooled_attempts_are_scored_against_the_marks_drawn(self):
+        quiz = Quiz.objects.create(name='Pooled', category=self.category, created_by=self.admin, draw_count=1)
+        easy, hard = (
+            Question.objects.create(
+                quiz=quiz, question_text=f'Pooled {marks}', option1='a', option2='b', option3='c', option4='d',
+                answer=1, marks=marks,
+            )
+            for marks in (1, 3)
+        )
+        for student, question in zip(self.students, (easy, hard)):
+            QuestionDraw.objects.create(user=student, quiz=quiz, quiz_version=quiz.version, question_ids=pack_ids([question.id]))
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client_for(student).post('/api/attempt_quiz', {
+                    'quiz_id': quiz.id, 'answers': [{'question': question.id, 'selected_option': 'a'}],
+                }, format='json')
+            self.assertEqual(response.json()['score'], question.marks)
+        # Both students answered everything they got right
+        expected = [0] * 9 + [2]
+        response = self.client_for(self.admin).get('/api/admin/get_quiz_stats', {'quiz_id': quiz.id}).json()
+        self.assertEqual(([bucket['count'] for bucket in response['histogram']], response['pass_rate']), (expected, 1.0))
+        call_command('rebuild_quiz_stats', quiz=[quiz.id], stdout=StringIO())
+        self.assertEqual([bucket['count'] for bucket in stats_payload(*load_stats(quiz.id))['histogram']], expected)
+
+    def test_other_admins_quiz_is_not_found(self):
+        response = self.client_for(self.other_admin).get('/api/admin/get_quiz_stats', {'quiz_id': self.quiz.id})
+        self.assertEqual(response.json(), {'status': False, 'message': 'Quiz not found'})
+
+
+class SearchTests(AdminAPITestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Other', created_by=self.other_admin)
+        quiz = Quiz.objects.create(name='Other', category=category, created_by=self.other_admin)
+        self.other_question = Question.objects.create(
+            quiz=quiz, question_text='Question elsewhere', option1='a', option2='b', option3='c', option4='d', answer=1, marks=1,
+        )
+
+    def found(self, admin):
+        response = self.client_for(admin).get('/api/admin/search_questions', {'q': 'question'}).json()
+        return sorted(result['id'] for result in response['results'])
+
+    def test_results_are_scoped_to_the_admin(self):
+        self.assertEqual(self.found(self.admin), [question.id for question in self.questions])
+        self.assertEqual(self.found(self.other_admin), [self.other_question.id])
+
+    def test_fallback_is_scoped_to_the_admin(self):
+        with mock.patch('admin_actions.search._match', return_value=None):
+            self.assertEqual(self.found(self.admin), [question.id for question in self.questions])
+            self.assertEqual(self.found(self.other_admin), [self.other_question.id])
+
+
+class SubmissionFeedTests(AdminAPITestCase):
+    def test_only_the_quiz_owner_can_subscribe(self):
+        other = self.client_for(self.other_admin).get('/api/admin/async/submission_feed', {'quiz_id': self.quiz.id})
+        self.assertEqual(other.json(), {'status': False, 'message': 'Quiz not found'})
+        owner = self.client_for(self.admin).get('/api/admin/async/submission_feed', {'quiz_id': self.quiz.id})
+        self.assertEqual(owner['Content-Type'], 'text/event-stream')
+        owner.close()
+
+
+class QueryBudgetTests(AdminAPITestCase):
+    """An admin's hot paths stay within REQUEST_METRICS['QUERY_BUDGETS'], with cold caches."""
+
+    def cold_get(self, path, data=None):
+        for local in (token_cache, answer_key_cache, leaderboards, cache):
+            local.clear()
+        return self.client_for(self.admin).get(path, data).json()
 
-# Create your tests here.
+    def test_admin_hot_paths(self):
+        for student, correct in zip(self.students, (4, 2, 1)):
+            self.attempt(student, correct)
+        with assert_query_budgets():
+            self.assertEqual(len(self.cold_get('/api/admin/get_categories')), 1)
+            self.assertEqual(len(self.cold_get('/api/admin/get_quiz')), 1)
+            self.assertEqual(len(self.cold_get('/api/admin/get_question', {'quiz_id': self.quiz.id})), 4)
+            self.assertEqual(len(self.cold_get('/api/admin/search_questions', {'q': 'question'})['results']), 4)
+            self.assertEqual(len(self.cold_get('/api/admin/get_quiz_submissions', {'quiz_id': self.quiz.id})), 3)
+            self.assertEqual(len(self.cold_get('/api/admin/get_all_submissions')), 3)
+            self.assertEqual(self.cold_get('/api/admin/get_quiz_stats', {'quiz_id': self.quiz.id})['attempts'], 3)
+            top = self.cold_get('/api/get_leaderboard', {'quiz_id': self.quiz.id})['top']
+            self.assertEqual(top[0]['username'], self.students[0].username)
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from . import async_views
 
 urlpatterns = [
     path('add_categories', add_categories),
@@ -8,9 +9,17 @@ urlpatterns = [
     path('add_quiz', add_quiz),
     path('get_quiz', get_quiz),
     path('update_quiz', update_quiz),
+    path('publish_quiz', publish_quiz),
     path('add_question', add_question),
+    path('import_questions', import_questions),
     path('get_question', get_question),
+    path('search_questions', search_questions),
     path('update_question', update_question),
     path('get_all_submissions',get_all_submissions),
     path('get_quiz_submissions',get_quiz_submissions),
+    path('export_submissions', export_submissions),
+    path('async/submission_feed', async_views.submission_feed),
+    path('get_quiz_stats', get_quiz_stats),
+    path('get_item_analysis', get_item_analysis),
+    path('get_request_metrics', get_request_metrics),
 ]
\ No newline at end of file
@@ -1,15 +1,33 @@
+import csv
+import io
+import json
 from django.shortcuts import render
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import authenticate
 from rest_framework.response import Response
+from rest_framework.fields import DateTimeField
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.db.models import F
 from .models import *
 from .serializers import *
+from .stats import load_stats, stats_payload
+from .analysis import item_analysis
+from .catalogue import bump_catalogue, conditional_catalogue
+from .documents import publish, refresh as refresh_document
+from .search import DEFAULT_SEARCH_SIZE, MAX_SEARCH_SIZE, decode_cursor, encode_cursor, parse_terms, search
+from .pagination import dumps, keyset_rows
+from task_project.metrics import request_metrics
+from task_project.replicas import replica_reads
 
 User = get_user_model()
 
+IMPORT_BATCH_SIZE = 1000
+BOOLEAN_PARAMS = {'true': True, '1': True, 'false': False, '0': False}
+
 # Categories
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -42,19 +60,20 @@ def add_categories(request):
         if not Category.objects.filter(name=name, created_by=user).exists():
             category = Category.objects.create(name=name, created_by=user)
             category.save()
+            bump_catalogue(user.id)
             return Response({'status':True, 'message': 'Category added successfully'})
         return Response({'status':False, 'message': 'Category already exists'})
     return Response({'status':False, 'message': 'Name is required'})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+@conditional_catalogue('admin', scope='admin')
 def get_categories(request):
     user = request.user
     if user.role != 'admin':
         return Response({'status':False, 'message': 'You are not authorized to perform this action'})
-    categories = Category.objects.filter(created_by=user)
-    serializer = CategorySerial(categories, many=True)
-    return Response(serializer.data)
+    return Response(CATEGORY_ROWS.data(Category.objects.filter(created_by=user)))
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
@@ -70,6 +89,7 @@ def update_category(request):
         serializer = CategorySerial(category, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            bump_catalogue(user.id)
             return Response({'status':True, 'message': 'Category updated successfully'})
         return Response(serializer.errors)
     return Response({'status':False, 'message': 'Category not found'})
@@ -115,19 +135,20 @@ def add_quiz(request):
         serializer = AddQuizSerial(data=request.data)
         if serializer.is_valid():
             serializer.save(created_by=user, category_id=request.data.get('category_id'))
+            bump_catalogue(user.id)
             return Response({'status':True, 'message': 'Quiz added successfully'})
         return Response(serializer.errors)
     return Response({'status':False, 'message': 'Quiz already exists'})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+@conditional_catalogue('admin', scope='admin')
 def get_quiz(request):
     user = request.user
     if user.role != 'admin':
         return Response({'status':False, 'message': 'You are not authorized to perform this action'})
-    quizzes = Quiz.objects.filter(created_by=user)
-    serializer = QuizSerial(quizzes, many=True)
-    return Response(serializer.data)
+    return Response(QUIZ_ROWS.data(Quiz.objects.filter(created_by=user)))
 
 # Can be used to change is_active status of quiz
 @api_view(['PATCH'])
@@ -144,10 +165,46 @@ def update_quiz(request):
         serializer = QuizSerial(quiz, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            bump_catalogue(user.id)
+            refresh_document(quiz.id)
             return Response({'status':True, 'message': 'Quiz updated successfully'})
         return Response(serializer.errors)
     return Response({'status':False, 'message': 'Quiz not found'})
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def publish_quiz(request):
+    """
+        Compile a quiz into the precompiled document served by get_quiz_document.
+        Published quizzes are recompiled whenever the quiz or its questions change.
+
+        Query params:
+        - quiz_id (int, required): The ID of the quiz
+
+        Returns:
+        - {'status': True, 'message': 'Quiz published', 'etag': '...', 'questions': 500, 'size': 81234, 'compressed_size': 9876}
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    if not request.GET.get('quiz_id'):
+        return Response({'status':False, 'message': 'Quiz ID is required'})
+    try:
+        if not Quiz.objects.filter(id=int(request.GET.get('quiz_id')), created_by=user).exists():
+            return Response({'status':False, 'message': 'Quiz not found'})
+    except ValueError:
+        return Response({'status':False, 'message': 'Invalid query parameters'})
+    document = publish(int(request.GET.get('quiz_id')))
+    return Response({
+        'status': True,
+        'message': 'Quiz published',
+        'etag': document.etag,
+        'questions': len(document.question_ids) // 8,
+        'size': len(document.content),
+        'compressed_size': len(document.compressed),
+    })
+
 # Questions
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -202,13 +259,111 @@ def add_question(request):
             serializer = QuestionSerial(data=request.data)
             if serializer.is_valid():
                 serializer.save(quiz_id=quiz_id, is_active=True)
+                Quiz.objects.filter(id=quiz_id).update(version=F('version') + 1)
+                bump_catalogue(user.id)
+                refresh_document(quiz.id)
                 return Response({'status':True, 'message': 'Question added successfully'})
             return Response(serializer.errors)
         return Response({'status':False, 'message': 'Quiz not found'})
     return Response({'status':False, 'message': 'Quiz ID is required'})
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_questions(request):
+    """
+        Bulk import questions into a quiz (Admin only)
+        Rows are validated independently; valid rows are inserted in batches
+        inside one transaction and invalid rows are reported back.
+
+        Body (one of):
+        - A JSON array of questions, with quiz_id as a query param
+        - {"quiz_id": 1, "questions": [...]}
+        - multipart form with quiz_id and a file (.csv with a header row, or .jsonl)
+        Each question has the same fields as add_question.
+
+        Returns:
+        - {'status': True, 'message': 'Questions imported', 'created': 2, 'errors': [{'row': 3, 'errors': {...}}]}
+        - {'status': False, 'message': ...} if the quiz is not found or the payload cannot be read
+
+        Example:
+        POST /api/admin/import_questions?quiz_id=1
+        [
+            {"question_text": "2+2?", "option1": "1", "option2": "2", "option3": "3", "option4": "4", "answer": 4, "marks": 1}
+        ]
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    data = request.data if isinstance(request.data, dict) else {}
+    quiz_id = request.GET.get('quiz_id') or data.get('quiz_id')
+    if not quiz_id:
+        return Response({'status':False, 'message': 'Quiz ID is required'})
+    if not Quiz.objects.filter(id=quiz_id, created_by=user).exists():
+        return Response({'status':False, 'message': 'Quiz not found'})
+    try:
+        rows, errors = _read_import_rows(request)
+    except ValueError as exc:
+        return Response({'status':False, 'message': str(exc)})
+    serializer = QuestionBulkSerial(child=QuestionSerial(), data=rows)
+    if not serializer.is_valid():
+        return Response(serializer.errors)
+    valid_rows = serializer.validated_data
+    with transaction.atomic():
+        Question.objects.bulk_create(
+            (Question(quiz_id=quiz_id, **dict(row, is_active=True)) for row in valid_rows),
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        if valid_rows:
+            Quiz.objects.filter(id=quiz_id).update(version=F('version') + 1)
+    if valid_rows:
+        bump_catalogue(user.id)
+        refresh_document(quiz_id)
+    errors = {**serializer.row_errors, **errors}
+    return Response({
+        'status': True,
+        'message': 'Questions imported',
+        'created': len(valid_rows),
+        'errors': [{'row': index + 1, 'errors': errors[index]} for index in sorted(errors)],
+    })
+
+def _read_import_rows(request):
+    """
+        Read import rows from the request. Returns (rows, errors) where errors
+        maps a row index to a parse error; such rows are passed on as None so
+        row numbers stay aligned with the input.
+    """
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        if isinstance(request.data, list):
+            rows = request.data
+        else:
+            rows = request.data.get('questions') if isinstance(request.data, dict) else None
+        if not isinstance(rows, list):
+            raise ValueError('Questions are required')
+        return rows, {}
+    name = upload.name.lower()
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig')
+    if name.endswith('.csv'):
+        return list(csv.DictReader(stream)), {}
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        rows, errors = [], {}
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as exc:
+                errors[len(rows)] = {'non_field_errors': [f'Invalid JSON: {exc}']}
+                rows.append(None)
+        return rows, errors
+    raise ValueError('File must be .csv or .jsonl')
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+@conditional_catalogue('admin')
 def get_question(request):
     user = request.user
     if user.role != 'admin':
@@ -216,12 +371,53 @@ def get_question(request):
     if request.GET.get('quiz_id'):
         quiz_id = request.GET.get('quiz_id')
         if Quiz.objects.filter(id=quiz_id).exists():
-            questions = Question.objects.filter(quiz_id=quiz_id)
-            serializer = QuestionSerial(questions, many=True)
-            return Response(serializer.data)
+            return Response(QUESTION_ROWS.data(Question.objects.filter(quiz_id=quiz_id)))
         return Response({'status':False, 'message': 'Quiz not found'})
     return Response({'status':False, 'message': 'Quiz ID is required'})
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_questions(request):
+    """
+        Full-text search over question_text and the options of the questions of the admin's quizzes (Admin only).
+        Every term must match, the last one also as a prefix; best matches first.
+
+        Query params:
+        - q (string, required): The search terms
+        - quiz_id (int, optional): Only questions of this quiz
+        - category_id (int, optional): Only questions of quizzes in this category
+        - is_active (bool, optional): Only active (true) or inactive (false) questions
+        - cursor (string, optional): The next_cursor returned by the previous page
+        - limit (int, optional): Results per page (default 20, max 100)
+
+        Returns:
+        - {'status': True, 'results': [{...question, 'quiz': 1, 'score': 7.21}, ...], 'next_cursor': '...' or null}
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    terms = parse_terms(request.GET.get('q'))
+    if not terms:
+        return Response({'status':False, 'message': 'Search query is required'})
+    try:
+        filters = {
+            'quiz_id': int(request.GET['quiz_id']) if request.GET.get('quiz_id') else None,
+            'category_id': int(request.GET['category_id']) if request.GET.get('category_id') else None,
+            'is_active': BOOLEAN_PARAMS[request.GET['is_active'].lower()] if request.GET.get('is_active') else None,
+        }
+        limit = min(max(int(request.GET.get('limit', DEFAULT_SEARCH_SIZE)), 1), MAX_SEARCH_SIZE)
+        after = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    except (KeyError, ValueError):
+        return Response({'status':False, 'message': 'Invalid query parameters'})
+    rows = search(terms, user.id, filters, after, limit + 1)
+    page = rows[:limit]
+    questions = {row['id']: row for row in QUESTION_ROWS.data(Question.objects.filter(id__in=[row[0] for row in page]))}
+    # Keys are negated relevances
+    results = [{**questions[question_id], 'quiz': quiz_id, 'score': round(abs(key), 6)} for question_id, quiz_id, key in page if question_id in questions]
+    next_cursor = encode_cursor(page[-1][2], page[-1][0]) if len(rows) > limit else None
+    return Response({'status': True, 'results': results, 'next_cursor': next_cursor})
+
 # Can be used to change is_active status of question
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
@@ -232,11 +428,15 @@ def update_question(request):
     if not request.GET.get('quiz_id'):
         return Response({'status':False, 'message': 'Quiz ID is required'})
     id = request.GET.get('quiz_id')
-    if Question.objects.filter(id=id).exists():
-        question = Question.objects.get(id=id)
+    # Only questions of the admin's own quizzes, like add_question
+    question = Question.objects.filter(id=id, quiz__created_by=user).first()
+    if question is not None:
         serializer = QuestionSerial(question, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            Quiz.objects.filter(id=question.quiz_id).update(version=F('version') + 1)
+            bump_catalogue(user.id)
+            refresh_document(question.quiz_id)
             return Response({'status':True, 'message': 'Question updated successfully'})
         return Response(serializer.errors)
     return Response({'status':False, 'message': 'Question not found'})
@@ -244,6 +444,7 @@ def update_question(request):
 # Submissions
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_quiz_submissions(request):
     user = request.user
     if user.role != 'admin':
@@ -251,18 +452,144 @@ def get_quiz_submissions(request):
     if request.GET.get('quiz_id'):
         quiz_id = request.GET.get('quiz_id')
         if Quiz.objects.filter(id=quiz_id).exists():
-            submissions = QuizAttempt.objects.filter(quiz_id=quiz_id)
-            serializer = AttemptSerial(submissions, many=True)
-            return Response(serializer.data)
+            return Response(ATTEMPT_ROWS.data(QuizAttempt.objects.filter(quiz_id=quiz_id)))
         return Response({'status':False, 'message': 'Quiz not found'})
     return Response({'status':False, 'message': 'Quiz ID is required'})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_all_submissions(request):
     user = request.user
     if user.role != 'admin':
         return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    return Response(ATTEMPT_ROWS.data(QuizAttempt.objects.filter(quiz__created_by=user)))
+
+EXPORT_FIELDS = ['id', 'user_id', 'user__username', 'quiz_id', 'quiz__name', 'score', 'attempted_at']
+EXPORT_COLUMNS = ['id', 'user', 'username', 'quiz', 'quiz_name', 'score', 'attempted_at']
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_submissions(request):
+    """
+        Stream submissions of the admin's quizzes as CSV or JSONL (Admin only)
+        Rows are read in id order with keyset pagination and written as they are
+        read, so memory use stays flat however many attempts there are.
+
+        Query params:
+        - output (string, optional): 'csv' (default) or 'jsonl'
+        - quiz_id (int, optional): Only export this quiz
+
+        Columns: id, user, username, quiz, quiz_name, score, attempted_at
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    output = request.GET.get('output', 'csv')
+    if output not in ('csv', 'jsonl'):
+        return Response({'status':False, 'message': 'Output must be csv or jsonl'})
     submissions = QuizAttempt.objects.filter(quiz__created_by=user)
-    serializer = AttemptSerial(submissions, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    if request.GET.get('quiz_id'):
+        quiz_id = request.GET.get('quiz_id')
+        if not Quiz.objects.filter(id=quiz_id, created_by=user).exists():
+            return Response({'status':False, 'message': 'Quiz not found'})
+        submissions = submissions.filter(quiz_id=quiz_id)
+    rows = keyset_rows(submissions, EXPORT_FIELDS)
+    if output == 'csv':
+        content, content_type = _csv_lines(rows), 'text/csv'
+    else:
+        content, content_type = _jsonl_lines(rows), 'application/x-ndjson'
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="submissions.{output}"'
+    return response
+
+class _Echo:
+    # File-like object for csv.writer that hands back each written line
+    def write(self, value):
+        return value
+
+def _csv_lines(rows):
+    # Timestamps are formatted the same way as in the JSON endpoints
+    attempted_at = DateTimeField()
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row[:-1] + (attempted_at.to_representation(row[-1]),))
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n'
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_quiz_stats(request):
+    """
+        Score statistics of a quiz (Admin only)
+        Served from the precomputed QuizStats rows, so the cost does not grow with the number of attempts.
+
+        Query params:
+        - quiz_id (int, required): The ID of the quiz
+
+        Returns:
+        - {'status': True, 'quiz': 1, 'attempts': 120, 'average': 7.5, 'min': 0, 'max': 10,
+           'pass_rate': 0.8, 'pass_percent': 40, 'histogram': [{'from_percent': 0, 'to_percent': 10, 'count': 3}, ...]}
+        - {'status': False, 'message': 'Quiz not found'} if the quiz does not exist or belongs to another admin
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    if not request.GET.get('quiz_id'):
+        return Response({'status':False, 'message': 'Quiz ID is required'})
+    quiz_id = request.GET.get('quiz_id')
+    if not Quiz.objects.filter(id=quiz_id, created_by=user).exists():
+        return Response({'status':False, 'message': 'Quiz not found'})
+    return Response(stats_payload(*load_stats(quiz_id)))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_item_analysis(request):
+    """
+        Per-question item analysis of a quiz (Admin only)
+        Computed from the selected options stored with each attempt.
+
+        Query params:
+        - quiz_id (int, required): The ID of the quiz
+
+        Returns:
+        - {'status': True, 'quiz': 1, 'questions': [
+            {'question': 3, 'correct_option': 2, 'responses': 120, 'difficulty': 0.65, 'discrimination': 0.4,
+             'options': {'1': 10, '2': 78, '3': 20, '4': 8}, 'unanswered': 4, 'other': 0}, ...]}
+        - {'status': False, 'message': 'Quiz not found'} if the quiz does not exist or belongs to another admin
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    if not request.GET.get('quiz_id'):
+        return Response({'status':False, 'message': 'Quiz ID is required'})
+    quiz_id = request.GET.get('quiz_id')
+    if not Quiz.objects.filter(id=quiz_id, created_by=user).exists():
+        return Response({'status':False, 'message': 'Quiz not found'})
+    return Response({'status':True, 'quiz': int(quiz_id), 'questions': item_analysis(quiz_id)})
+
+# Monitoring
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_request_metrics(request):
+    """
+        Per-endpoint request metrics of this server process over the last few minutes (Admin only)
+
+        Returns:
+        - {'status': True, 'window_seconds': 300, 'endpoints': {'user_actions.views.attempt_quiz': {
+            'requests': 120, 'errors': 0, 'query_budget': 7, 'over_budget': 0, 'queries_per_request': 6.0,
+            'max_queries': 6, 'db_ms_per_request': 1.2, 'render_ms_per_request': 0.1, 'wall_ms_per_request': 8.4,
+            'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 50, 'latency_ms': {'<=1': 0, ...}, 'queries': {'<=0': 0, ...}}, ...}}
+        Percentiles are the upper bounds of the histogram buckets they fall in.
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    return Response({'status':True, 'window_seconds': request_metrics.window, 'endpoints': request_metrics.snapshot()})
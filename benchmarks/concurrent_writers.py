@@ -0,0 +1,70 @@
+"""
+Compare attempt_quiz throughput under concurrent writers with Django's stock
+SQLite options and with the tuned profile from settings.py (WAL,
+synchronous=NORMAL, IMMEDIATE transactions, busy timeout, mmap).
+
+Each profile runs load_test.py in a subprocess on a fresh database, with
+SQLITE_TUNING=0 or 1, and the two reports are combined into one JSON
+document.
+
+Usage:
+    python benchmarks/concurrent_writers.py [--clients 16] [--requests 2000] [--output writers.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROFILES = {'stock': '0', 'tuned': '1'}
+
+
+def run_profile(tuning, args, workdir):
+    output = os.path.join(workdir, f'writers-{tuning}.json')
+    command = [
+        sys.executable, os.path.join(HERE, 'load_test.py'),
+        '--endpoints', 'attempt_quiz',
+        '--users', str(args.users),
+        '--quizzes', str(args.quizzes),
+        '--attempts-per-user', '0',
+        '--clients', str(args.clients),
+        '--requests', str(args.requests),
+        '--db', os.path.join(workdir, f'writers-{tuning}.sqlite3'),
+        '--output', output,
+    ]
+    subprocess.run(command, check=True, env={**os.environ, 'DB_ENGINE': 'sqlite', 'SQLITE_TUNING': tuning, 'DB_STARTUP_CHECK': '0'})
+    with open(output) as report:
+        return json.load(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--quizzes', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent writers')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--output', help='write the JSON report to this file (default: stdout)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    report = {'config': vars(args), 'profiles': {}}
+    for name, tuning in PROFILES.items():
+        print(f'{name}:', file=sys.stderr)
+        result = run_profile(tuning, args, workdir)
+        report['revision'] = result['revision']
+        report['profiles'][name] = {
+            'database_options': result['database_options'],
+            **result['endpoints']['attempt_quiz'],
+        }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Seed a throwaway database and load-test the quiz API in-process.
+
+Each endpoint is driven by `--clients` concurrent Django test clients (one
+thread each) for `--requests` requests, and the report gives p50/p95/p99
+latency, requests per second, errors and SQL queries per request. The full
+report is written as JSON (`--output`) so runs of different revisions can be
+compared; a summary table is printed as well.
+
+By default a temporary SQLite file is used. `--settings-db` runs against the
+database configured in DATABASES instead (e.g. a local PostgreSQL), which
+must be empty: the script migrates and seeds it.
+
+Usage:
+    python benchmarks/load_test.py [--users 1000] [--quizzes 50] [--clients 8]
+        [--requests 400] [--output results.json] [--endpoints get_all_quiz,attempt_quiz]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_project.settings')
+
+PASSWORD = 'benchmark-password'
+
+
+def seed(args):
+    """Create admins, quizzes, questions, students with tokens and past attempts in bulk."""
+
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+    from rest_framework.authtoken.models import Token
+    from django.utils import timezone
+    from admin_actions.models import Category, Quiz, Question, QuizAttempt
+    from user_actions.models import AttemptSession
+
+    User = get_user_model()
+    # Hashing once keeps seeding fast; logins still pay the full hasher cost
+    password = make_password(PASSWORD)
+    with transaction.atomic():
+        admins = User.objects.bulk_create([
+            User(username=f'admin{i}@example.com', email=f'admin{i}@example.com', password=password, role='admin')
+            for i in range(args.admins)
+        ])
+        students = User.objects.bulk_create([
+            User(username=f'user{i}@example.com', email=f'user{i}@example.com', password=password, role='user')
+            for i in range(args.users)
+        ], batch_size=1000)
+        Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in admins + students], batch_size=1000)
+        categories = Category.objects.bulk_create([
+            Category(name=f'category {i}', created_by=admins[i % len(admins)]) for i in range(len(admins))
+        ])
+        quizzes = Quiz.objects.bulk_create([
+            Quiz(name=f'quiz {i}', category=categories[i % len(categories)], created_by=categories[i % len(categories)].created_by)
+            for i in range(args.quizzes)
+        ])
+        Question.objects.bulk_create([
+            Question(quiz=quiz, question_text=f'question {j}', option1='a', option2='b', option3='c', option4='d', answer=j % 4 + 1, marks=1)
+            for quiz in quizzes for j in range(args.questions)
+        ], batch_size=1000)
+        # The first attempts_per_user quizzes are taken by every student, leaving the rest for attempt_quiz
+        QuizAttempt.objects.bulk_create([
+            QuizAttempt(user=user, quiz=quiz, score=(user.id * quiz.id) % (args.questions + 1), quiz_version=quiz.version)
+            for user in students for quiz in quizzes[:args.attempts_per_user]
+        ], batch_size=1000)
+        # Every student has an open timed session on the last quiz for save_answers
+        sessions = AttemptSession.objects.bulk_create([
+            AttemptSession(user=user, quiz=quizzes[-1], deadline=timezone.now() + timezone.timedelta(days=1))
+            for user in students
+        ], batch_size=1000)
+    tokens = dict(Token.objects.values_list('user_id', 'key'))
+    return {
+        'admins': [(admin, tokens[admin.id]) for admin in admins],
+        'students': [(student, tokens[student.id]) for student in students],
+        'quizzes': quizzes,
+        'open_quizzes': quizzes[args.attempts_per_user:],
+        'sessions': {session.user_id: session.id for session in sessions},
+        'questions': {quiz.id: list(Question.objects.filter(quiz=quiz).values_list('id', 'answer', 'option1', 'option2', 'option3', 'option4')) for quiz in quizzes},
+    }
+
+
+def scenarios(data):
+    """Map endpoint name -> function(index) returning (method, path, body, token)."""
+
+    admins, students, quizzes = data['admins'], data['students'], data['quizzes']
+    admin_tokens = {admin.id: token for admin, token in admins}
+    # Every (student, open quiz) pair is attempted at most once
+    pairs = itertools.product(data['open_quizzes'], students)
+    pairs_lock = threading.Lock()
+
+    def attempt(index):
+        with pairs_lock:
+            quiz, (student, token) = next(pairs)
+        # Roughly two answers in three are correct
+        answers = [
+            {'question': question_id, 'selected_option': options[answer - 1 if (student.id + question_id) % 3 else answer % 4]}
+            for question_id, answer, *options in data['questions'][quiz.id]
+        ]
+        return 'post', '/api/attempt_quiz', {'quiz_id': quiz.id, 'answers': answers}, token
+
+    def save(index):
+        student, token = students[index % len(students)]
+        question_id, answer, *options = data['questions'][quizzes[-1].id][index % len(data['questions'][quizzes[-1].id])]
+        body = {'session_id': data['sessions'][student.id], 'answers': [{'question': question_id, 'selected_option': options[index % 4]}]}
+        return 'post', '/api/save_answers', body, token
+
+    return {
+        'login': lambda i: ('post', '/api/user/login', {'username': students[i % len(students)][0].username, 'password': PASSWORD}, None),
+        'get_all_quiz': lambda i: ('get', '/api/get_all_quiz', None, students[i % len(students)][1]),
+        'get_all_quiz_list': lambda i: ('get', '/api/get_all_quiz?mode=list', None, students[i % len(students)][1]),
+        'attempt_quiz': attempt,
+        'save_answers': save,
+        'get_quiz_attempts': lambda i: ('get', '/api/get_quiz_attempts', None, students[i % len(students)][1]),
+        'get_quiz_submissions': lambda i: ('get', f'/api/admin/get_quiz_submissions?quiz_id={quizzes[i % len(quizzes)].id}', None, admin_tokens[quizzes[i % len(quizzes)].created_by_id]),
+        'get_all_submissions': lambda i: ('get', '/api/admin/get_all_submissions', None, admins[i % len(admins)][1]),
+    }
+
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    index = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def run_endpoint(make_request, requests, clients):
+    """Issue `requests` requests from `clients` threads and summarize them."""
+
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    counter = itertools.count()
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        client = Client()
+        while True:
+            index = next(counter)
+            if index >= requests:
+                break
+            try:
+                method, path, body, token = make_request(index)
+            except StopIteration:
+                break
+            headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                if method == 'get':
+                    response = client.get(path, **headers)
+                else:
+                    response = client.post(path, body, content_type='application/json', **headers)
+                content = response.getvalue() if response.streaming else response.content
+            elapsed = (time.perf_counter() - start) * 1000
+            failed = response.status_code >= 400 or b'"status":false' in content
+            with lock:
+                latencies.append(elapsed)
+                queries.append(len(captured.captured_queries))
+                if failed:
+                    errors.append(f'{response.status_code} {content[:200].decode(errors="replace")}')
+        connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for future in [executor.submit(worker) for _ in range(clients)]:
+            future.result()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'seconds': round(wall, 3),
+        'rps': round(len(latencies) / wall, 1) if wall else None,
+        'p50_ms': _round(percentile(latencies, 50)),
+        'p95_ms': _round(percentile(latencies, 95)),
+        'p99_ms': _round(percentile(latencies, 99)),
+        'mean_ms': _round(statistics.fmean(latencies)) if latencies else None,
+        'max_ms': _round(latencies[-1]) if latencies else None,
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--quizzes', type=int, default=50)
+    parser.add_argument('--questions', type=int, default=20, help='questions per quiz')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--attempts-per-user', type=int, default=10, help='quizzes already attempted by every student')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=400, help='requests per endpoint')
+    parser.add_argument('--endpoints', help='comma-separated subset of endpoints to run')
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--settings-db', action='store_true', help='use the DATABASES setting instead of SQLite')
+    parser.add_argument('--output', help='write the JSON report to this file (default: stdout)')
+    args = parser.parse_args()
+    if args.attempts_per_user > args.quizzes:
+        parser.error('--attempts-per-user cannot exceed --quizzes')
+
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+    if not args.settings_db:
+        path = args.db or os.path.join(tempfile.mkdtemp(), 'load_test.sqlite3')
+        settings.DATABASES['default']['NAME'] = path
+        from django.db import connection
+        connection.settings_dict['NAME'] = path
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('migrate', verbosity=0)
+    start = time.perf_counter()
+    data = seed(args)
+    seed_seconds = time.perf_counter() - start
+    connection.close()
+
+    available = scenarios(data)
+    names = args.endpoints.split(',') if args.endpoints else list(available)
+    unknown = set(names) - set(available)
+    if unknown:
+        parser.error(f'unknown endpoints: {", ".join(sorted(unknown))}')
+    results = {}
+    for name in names:
+        requests = args.requests
+        if name == 'attempt_quiz':
+            requests = min(requests, len(data['open_quizzes']) * len(data['students']))
+        results[name] = run_endpoint(available[name], requests, args.clients)
+
+    report = {
+        'revision': revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'database_options': connection.settings_dict['OPTIONS'],
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'db')},
+        'seed_seconds': round(seed_seconds, 3),
+        'endpoints': results,
+    }
+    for name, result in results.items():
+        print(
+            f'{name:22} {result["rps"]:>8} rps  p50 {result["p50_ms"]:>9} ms  p95 {result["p95_ms"]:>9} ms  '
+            f'p99 {result["p99_ms"]:>9} ms  {result["queries_per_request"]:>6} queries  {result["errors"]} errors',
+            file=sys.stderr,
+        )
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Show SQLite query plans and timings of the quiz hot-path lookups before and
+after the 0004_hot_path_indexes migration.
+
+A throwaway database is seeded with `--users` x `--quizzes` attempts
+(1,000,000 by default), migrated to 0003, measured, then migrated to 0004
+and measured again.
+
+Usage:
+    python benchmarks/query_plans.py [--users 10000] [--quizzes 100] [--db path]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_project.settings')
+
+QUERIES = [
+    ('Quiz(created_by, name)', 'SELECT 1 FROM admin_actions_quiz WHERE created_by_id = %s AND name = %s LIMIT 1', lambda a: [1, 'quiz 50']),
+    ('Category(created_by, name)', 'SELECT 1 FROM admin_actions_category WHERE created_by_id = %s AND name = %s LIMIT 1', lambda a: [1, 'category 5']),
+    ('Question(quiz, is_active)', 'SELECT id, answer, marks FROM admin_actions_question WHERE quiz_id = %s AND is_active = %s', lambda a: [a.quizzes // 2, True]),
+    # How the ORM renders filter(is_active=True) on SQLite: a bare column, which only uses the quiz_id prefix
+    ('Question(quiz) + bare is_active', 'SELECT id, answer, marks FROM admin_actions_question WHERE is_active AND quiz_id = %s', lambda a: [a.quizzes // 2]),
+    ('QuizAttempt(user, quiz)', 'SELECT 1 FROM admin_actions_quizattempt WHERE user_id = %s AND quiz_id = %s LIMIT 1', lambda a: [a.users // 2, a.quizzes // 2]),
+    ('Quiz(is_active) page', 'SELECT id FROM admin_actions_quiz WHERE is_active AND id > %s ORDER BY id LIMIT 50', lambda a: [0]),
+    ('QuizAttempt by attempted_at', 'SELECT id FROM admin_actions_quizattempt ORDER BY attempted_at DESC LIMIT 50', lambda a: []),
+]
+
+
+def seed(cursor, users, quizzes, questions_per_quiz=20):
+    now = '2025-01-01 00:00:00'
+    cursor.executemany(
+        "INSERT INTO user_user (id, password, is_superuser, username, first_name, last_name, email, is_staff, is_active, date_joined, role) "
+        "VALUES (%s, '', 0, %s, '', '', %s, 0, 1, %s, %s)",
+        [(i, f'user{i}', f'user{i}@example.com', now, 'admin' if i == 1 else 'user') for i in range(1, users + 1)],
+    )
+    cursor.executemany(
+        'INSERT INTO admin_actions_category (id, name, created_at, created_by_id) VALUES (%s, %s, %s, 1)',
+        [(i, f'category {i}', now) for i in range(1, 11)],
+    )
+    cursor.executemany(
+        'INSERT INTO admin_actions_quiz (id, name, is_active, created_at, version, category_id, created_by_id) VALUES (%s, %s, %s, %s, 1, %s, 1)',
+        [(i, f'quiz {i}', i % 5 != 0, now, i % 10 + 1) for i in range(1, quizzes + 1)],
+    )
+    cursor.executemany(
+        "INSERT INTO admin_actions_question (quiz_id, question_text, option1, option2, option3, option4, answer, marks, is_active, created_at) "
+        "VALUES (%s, 'question', 'a', 'b', 'c', 'd', 1, 1, 1, %s)",
+        [(q, now) for q in range(1, quizzes + 1) for _ in range(questions_per_quiz)],
+    )
+    batch = []
+    for user in range(1, users + 1):
+        for quiz in range(1, quizzes + 1):
+            batch.append((user, quiz, (user * quiz) % 100, f'2025-01-01 {user % 24:02d}:{quiz % 60:02d}:00'))
+        if len(batch) >= 50000:
+            cursor.executemany('INSERT INTO admin_actions_quizattempt (user_id, quiz_id, score, attempted_at) VALUES (%s, %s, %s, %s)', batch)
+            batch = []
+    if batch:
+        cursor.executemany('INSERT INTO admin_actions_quizattempt (user_id, quiz_id, score, attempted_at) VALUES (%s, %s, %s, %s)', batch)
+
+
+def measure(cursor, args, repeat=20):
+    results = {}
+    for label, sql, params in QUERIES:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params(args))
+        plan = '; '.join(row[-1] for row in cursor.fetchall())
+        start = time.perf_counter()
+        for _ in range(repeat):
+            cursor.execute(sql, params(args))
+            cursor.fetchall()
+        results[label] = (plan, (time.perf_counter() - start) / repeat * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--quizzes', type=int, default=100)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'query_plans.sqlite3')
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.DATABASES['default']['NAME'] = path
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    connection.settings_dict['NAME'] = path
+
+    call_command('migrate', verbosity=0)
+    call_command('migrate', 'admin_actions', '0003', verbosity=0)
+    start = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        seed(cursor, args.users, args.quizzes)
+    print(f'Seeded {args.users * args.quizzes} attempts in {time.perf_counter() - start:.1f}s ({path})')
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        before = measure(cursor, args)
+    start = time.perf_counter()
+    call_command('migrate', 'admin_actions', '0004', verbosity=0)
+    print(f'Applied 0004_hot_path_indexes in {time.perf_counter() - start:.1f}s')
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        after = measure(cursor, args)
+
+    for label, _, _ in QUERIES:
+        print(f'\n{label}')
+        print(f'  before: {before[label][1]:9.3f} ms  {before[label][0]}')
+        print(f'  after:  {after[label][1]:9.3f} ms  {after[label][0]}')
+
+
+if __name__ == '__main__':
+    main()
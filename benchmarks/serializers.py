@@ -0,0 +1,104 @@
+"""
+Compare the ModelSerializer list path with the RowSerializer fast path on
+large lists, and check that both render byte-identical JSON.
+
+A throwaway SQLite database is seeded with `--rows` questions and attempts.
+Each case is timed end to end: query, serialization and JSON rendering.
+
+Usage:
+    python benchmarks/serializers.py [--rows 20000] [--repeat 3] [--output serializers.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_project.settings')
+
+
+def seed(rows):
+    from django.contrib.auth import get_user_model
+    from django.db import transaction
+    from admin_actions.models import Category, Quiz, Question, QuizAttempt
+
+    User = get_user_model()
+    with transaction.atomic():
+        admin = User.objects.create(username='admin@example.com', role='admin')
+        category = Category.objects.create(name='category', created_by=admin)
+        quiz = Quiz.objects.create(name='quiz', category=category, created_by=admin)
+        Question.objects.bulk_create([
+            Question(quiz=quiz, question_text=f'question {i}', option1='a', option2='b', option3='c', option4='d', answer=i % 4 + 1, marks=1)
+            for i in range(rows)
+        ], batch_size=1000)
+        users = User.objects.bulk_create([User(username=f'user{i}@example.com', role='user') for i in range(rows)], batch_size=1000)
+        QuizAttempt.objects.bulk_create([QuizAttempt(user=user, quiz=quiz, score=user.id % 10) for user in users], batch_size=1000)
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON report to this file (default: stdout)')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'serializers.sqlite3')
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.DATABASES['default']['NAME'] = path
+    from django.core.management import call_command
+    from django.db import connection
+    connection.settings_dict['NAME'] = path
+    call_command('migrate', verbosity=0)
+    seed(args.rows)
+
+    from admin_actions.models import Question, QuizAttempt
+    from admin_actions.pagination import dumps
+    from admin_actions.serializers import AttemptSerial, QuestionSerial, ATTEMPT_ROWS, QUESTION_ROWS
+
+    cases = [
+        ('questions', Question.objects.all, QuestionSerial, QUESTION_ROWS),
+        ('attempts', QuizAttempt.objects.all, AttemptSerial, ATTEMPT_ROWS),
+    ]
+    results = {}
+    for name, queryset, serializer_class, rows in cases:
+        model_ms, expected = best_of(args.repeat, lambda: dumps(serializer_class(queryset(), many=True).data))
+        values_ms, values_body = best_of(args.repeat, lambda: dumps(rows.data(queryset())))
+        objects_ms, objects_body = best_of(args.repeat, lambda: dumps(rows.from_objects(list(queryset()))))
+        results[name] = {
+            'rows': args.rows,
+            'model_serializer_ms': round(model_ms, 1),
+            'row_serializer_values_ms': round(values_ms, 1),
+            'row_serializer_objects_ms': round(objects_ms, 1),
+            'speedup_values': round(model_ms / values_ms, 2),
+            'speedup_objects': round(model_ms / objects_ms, 2),
+            'identical': expected == values_body == objects_body,
+        }
+        print(
+            f'{name:10} ModelSerializer {model_ms:8.1f} ms  values {values_ms:8.1f} ms  objects {objects_ms:8.1f} ms  '
+            f'x{model_ms / values_ms:.1f}  identical={results[name]["identical"]}',
+            file=sys.stderr,
+        )
+    report = {'cases': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
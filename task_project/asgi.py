@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_project.settings')
 
 application = get_asgi_application()
+
+if os.environ.get('DB_STARTUP_CHECK', '1') != '0':
+    from .health import startup_check
+
+    startup_check()
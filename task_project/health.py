@@ -0,0 +1,83 @@
+"""
+Database health checks, run by `manage.py check --database default` and at
+server start by wsgi.py/asgi.py (set DB_STARTUP_CHECK=0 to skip them there),
+and a check of the read replica settings, run by every `manage.py check`.
+"""
+
+import logging
+
+from django.core.checks import Error, Tags, Warning, register
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def check_database(alias='default', migrations=True):
+    """
+        Return the check messages for one database. migrations=False skips the
+        unapplied migrations check, which `manage.py migrate` would trip over.
+    """
+
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            journal_mode = None
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+        unapplied = []
+        if migrations:
+            executor = MigrationExecutor(connection)
+            unapplied = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except DatabaseError as exc:
+        return [Error(f'Cannot query database {alias!r}: {exc}', id='task_project.E001')]
+    messages = []
+    if journal_mode not in (None, 'wal', 'memory'):
+        messages.append(Warning(
+            f'SQLite database {alias!r} uses the {journal_mode} journal, so concurrent writes may fail with "database is locked"',
+            hint='Unset SQLITE_TUNING=0 to enable WAL mode.',
+            id='task_project.W001',
+        ))
+    if unapplied:
+        messages.append(Warning(
+            f'Database {alias!r} has {len(unapplied)} unapplied migration(s)',
+            hint='Run manage.py migrate.',
+            id='task_project.W002',
+        ))
+    return messages
+
+
+@register(Tags.database)
+def check_databases(app_configs=None, databases=None, **kwargs):
+    messages = []
+    for alias in databases or []:
+        messages.extend(check_database(alias, migrations=False))
+    return messages
+
+
+@register()
+def check_replicas(app_configs=None, **kwargs):
+    from .replicas import REPLICAS, sticky_primary
+    if REPLICAS and not sticky_primary.backend:
+        return [Warning(
+            "Read replicas are enabled without DATABASE_REPLICAS['BACKEND'], so primary pins are per process",
+            hint='Set CACHE_URL, or BACKEND to a shared CACHES alias, when running several workers.',
+            id='task_project.W003',
+        )]
+    return []
+
+
+def startup_check(alias='default'):
+    """Fail fast if the database is unreachable; log the other problems."""
+
+    try:
+        for message in check_database(alias):
+            if message.is_serious():
+                raise ImproperlyConfigured(str(message))
+            logger.warning('%s', message)
+    finally:
+        # The server's request threads open their own connections
+        connections[alias].close()
@@ -0,0 +1,295 @@
+"""
+Per-request instrumentation.
+
+RequestMetricsMiddleware records, for every request, the number of SQL
+queries and the time spent in them, the time spent rendering the response
+and the wall time. Queries are counted by a database execute wrapper that
+reports into a context variable, so it works for sync views, async views
+(whose ORM calls run in sync_to_async threads) and without DEBUG.
+
+The numbers are added to rolling per-endpoint histograms (see
+request_metrics.snapshot()), optionally returned as a Server-Timing header,
+and checked against the per-endpoint QUERY_BUDGETS. Endpoints are keyed by
+view name, e.g. 'user_actions.views.attempt_quiz'.
+
+In tests, assert_query_budgets() fails when a request made inside the block
+goes over its budget.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'REQUEST_METRICS', {})
+HEADERS = _config.get('HEADERS', settings.DEBUG)
+WINDOW = _config.get('WINDOW', 300)
+QUERY_BUDGETS = _config.get('QUERY_BUDGETS', {})
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_metrics', default=None)
+_listeners = []
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'render_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class Histogram:
+    """Counts of values per bucket; bucket i holds values <= bounds[i], the last one the rest."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile, None if above the last bound."""
+
+        total = sum(self.counts)
+        if not total:
+            return None
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * total:
+                return self.bounds[index] if index < len(self.bounds) else None
+        return None
+
+    def payload(self):
+        labels = [f'<={bound}' for bound in self.bounds] + [f'>{self.bounds[-1]}']
+        return dict(zip(labels, self.counts))
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.over_budget = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.wall_time = 0.0
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.query_counts = Histogram(QUERY_BUCKETS)
+
+    def add(self, metrics, wall_time, status, over_budget):
+        self.requests += 1
+        self.errors += status >= 500
+        self.over_budget += over_budget
+        self.queries += metrics.queries
+        self.max_queries = max(self.max_queries, metrics.queries)
+        self.db_time += metrics.db_time
+        self.render_time += metrics.render_time
+        self.wall_time += wall_time
+        self.latency.add(wall_time * 1000)
+        self.query_counts.add(metrics.queries)
+
+    def merge(self, other):
+        for field in ('requests', 'errors', 'over_budget', 'queries', 'db_time', 'render_time', 'wall_time'):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        self.max_queries = max(self.max_queries, other.max_queries)
+        self.latency.merge(other.latency)
+        self.query_counts.merge(other.query_counts)
+
+    def payload(self, budget):
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'query_budget': budget,
+            'over_budget': self.over_budget,
+            'queries_per_request': round(self.queries / requests, 2),
+            'max_queries': self.max_queries,
+            'db_ms_per_request': round(self.db_time * 1000 / requests, 3),
+            'render_ms_per_request': round(self.render_time * 1000 / requests, 3),
+            'wall_ms_per_request': round(self.wall_time * 1000 / requests, 3),
+            'p50_ms': self.latency.quantile(0.5),
+            'p95_ms': self.latency.quantile(0.95),
+            'p99_ms': self.latency.quantile(0.99),
+            'latency_ms': self.latency.payload(),
+            'queries': self.query_counts.payload(),
+        }
+
+
+class MetricsRegistry:
+    """
+        Per-endpoint stats over a rolling window.
+
+        Stats go into the current window; once it is `window` seconds old it
+        becomes the previous window and the one before is dropped, so
+        snapshot() covers between `window` and twice `window` seconds.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._current = {}
+        self._previous = {}
+        self._started = time.monotonic()
+
+    def _rotate(self, now):
+        if now - self._started >= self.window:
+            self._previous = self._current if now - self._started < 2 * self.window else {}
+            self._current = {}
+            self._started = now
+
+    def record(self, endpoint, metrics, wall_time, status, over_budget=False):
+        with self._lock:
+            self._rotate(time.monotonic())
+            stats = self._current.get(endpoint)
+            if stats is None:
+                stats = self._current[endpoint] = EndpointStats()
+            stats.add(metrics, wall_time, status, over_budget)
+
+    def snapshot(self):
+        with self._lock:
+            self._rotate(time.monotonic())
+            merged = {}
+            for window in (self._previous, self._current):
+                for endpoint, stats in window.items():
+                    merged.setdefault(endpoint, EndpointStats()).merge(stats)
+        return {endpoint: stats.payload(QUERY_BUDGETS.get(endpoint)) for endpoint, stats in sorted(merged.items())}
+
+    def clear(self):
+        with self._lock:
+            self._current = {}
+            self._previous = {}
+            self._started = time.monotonic()
+
+
+request_metrics = MetricsRegistry()
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns
+        metrics = _current.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _finish(self, request, response, metrics, wall_time):
+        endpoint = endpoint_name(request)
+        budget = QUERY_BUDGETS.get(endpoint)
+        over_budget = budget is not None and metrics.queries > budget
+        if over_budget:
+            logger.warning('%s ran %d queries, over its budget of %d', endpoint, metrics.queries, budget)
+        request_metrics.record(endpoint, metrics, wall_time, response.status_code, over_budget)
+        for listener in list(_listeners):
+            listener(endpoint, metrics)
+        if HEADERS:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.3f};desc="{metrics.queries} queries", '
+                f'render;dur={metrics.render_time * 1000:.3f}, total;dur={wall_time * 1000:.3f}'
+            )
+            response['X-Query-Count'] = str(metrics.queries)
+        return response
+
+
+@contextmanager
+def assert_query_budgets(budgets=None):
+    """
+        Fail if a request made inside the block runs more queries than its
+        endpoint's budget. budgets overrides or extends QUERY_BUDGETS.
+
+        with assert_query_budgets({'user_actions.views.attempt_quiz': 6}):
+            client.post('/api/attempt_quiz', ...)
+    """
+
+    limits = {**QUERY_BUDGETS, **(budgets or {})}
+    exceeded = []
+
+    def check(endpoint, metrics):
+        if endpoint in limits and metrics.queries > limits[endpoint]:
+            exceeded.append(f'{endpoint}: {metrics.queries} queries (budget {limits[endpoint]})')
+
+    _listeners.append(check)
+    try:
+        yield exceeded
+    finally:
+        _listeners.remove(check)
+    if exceeded:
+        raise AssertionError('Query budget exceeded:\n' + '\n'.join(exceeded))
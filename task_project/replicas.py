@@ -0,0 +1,296 @@
+"""
+Read replicas.
+
+DB_REPLICAS (see settings.py) adds the replica databases to DATABASES as
+replica1, replica2, ... Views decorated with @replica_reads run their
+queries against one replica, picked round-robin per request so a request
+sees a single snapshot; everything else, and every write, goes to default.
+
+Replicas lag behind the primary, so a user must not be sent to one right
+after writing: ReplicaRoutingMiddleware notes the requests that ran an
+INSERT, UPDATE or DELETE and pins their user to the primary for
+STICKY_SECONDS. Reads that follow a write in the same request use the
+primary too. The pins are shared between workers through BACKEND, a CACHES
+alias (the shared cache by default); without one a user pinned by one
+worker can still be sent to a replica by another.
+
+Streaming responses are rendered after the view returns and read from the
+primary.
+"""
+
+import itertools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject
+
+_config = getattr(settings, 'DATABASE_REPLICAS', {})
+STICKY_SECONDS = _config.get('STICKY_SECONDS', 10)
+MAX_STICKY_USERS = _config.get('MAX_STICKY_USERS', 100000)
+BACKEND = _config.get('BACKEND')
+
+REPLICAS = [alias for alias, database in settings.DATABASES.items() if database.get('TEST', {}).get('MIRROR') == DEFAULT_DB_ALIAS]
+
+_state = ContextVar('database_routing', default=None)
+
+
+class RoutingState:
+    """Routing of the current request: the replica its reads may use, and whether it wrote."""
+
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+class StickyPrimary:
+    """
+        Users pinned to the primary database, with the time their pin ends.
+        When a shared backend (a CACHES alias) is configured, pins are also
+        stored there, so they hold whichever worker serves the next request.
+    """
+
+    def __init__(self, seconds=STICKY_SECONDS, max_entries=MAX_STICKY_USERS, backend=BACKEND):
+        self.seconds = seconds
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        if self.backend:
+            return caches[self.backend]
+        return None
+
+    def _pin_local(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[user_id] = now + self.seconds
+            self._entries.move_to_end(user_id)
+            # Pins are kept in expiry order, so the expired ones are at the front
+            while self._entries and (len(self._entries) > self.max_entries or next(iter(self._entries.values())) <= now):
+                self._entries.popitem(last=False)
+
+    def _pinned_local(self, user_id):
+        with self._lock:
+            until = self._entries.get(user_id)
+            return until is not None and until > time.monotonic()
+
+    def pin(self, user_id):
+        self._pin_local(user_id)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(f'primary_pin:{user_id}', True, self.seconds)
+
+    async def apin(self, user_id):
+        """See pin()."""
+
+        self._pin_local(user_id)
+        shared = self._shared()
+        if shared is not None:
+            await shared.aset(f'primary_pin:{user_id}', True, self.seconds)
+
+    def is_pinned(self, user_id):
+        if self._pinned_local(user_id):
+            return True
+        shared = self._shared()
+        return shared is not None and shared.get(f'primary_pin:{user_id}') is not None
+
+    async def ais_pinned(self, user_id):
+        """See is_pinned()."""
+
+        if self._pinned_local(user_id):
+            return True
+        shared = self._shared()
+        return shared is not None and await shared.aget(f'primary_pin:{user_id}') is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+sticky_primary = StickyPrimary()
+_next_replica = itertools.count()
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'MERGE')
+
+
+def _record_write(execute, sql, params, many, context):
+    # db_for_write() is also asked when assigning related objects, so writes
+    # are told apart by the statements actually run
+    state = _state.get()
+    if state is not None and not state.wrote and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def install_write_recorder(sender=None, connection=None, **kwargs):
+    if _record_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_write)
+
+
+def next_replica():
+    """The replica for the next request, round-robin; None without replicas."""
+
+    if not REPLICAS:
+        return None
+    return REPLICAS[next(_next_replica) % len(REPLICAS)]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica is not None and not state.wrote:
+            return state.replica
+        # Explicit, so that instances read from a replica are not followed back to it
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in REPLICAS:
+            return False
+        return None
+
+
+def _enter(replica):
+    state = _state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = _state.set(state)
+    previous, state.replica = state.replica, replica
+    return state, previous, token
+
+
+def _leave(state, previous, token):
+    state.replica = previous
+    if token is not None:
+        _state.reset(token)
+
+
+def replica_reads(view):
+    """
+        Run a read-only view against a replica, unless the requesting user
+        is pinned to the primary. Put it under @api_view / @async_api_view,
+        so that request.user is authenticated.
+    """
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            replica = next_replica()
+            if replica is None or await sticky_primary.ais_pinned(request.user.id):
+                return await view(request, *args, **kwargs)
+            entered = _enter(replica)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _leave(*entered)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replica = next_replica()
+        if replica is None or sticky_primary.is_pinned(request.user.id):
+            return view(request, *args, **kwargs)
+        entered = _enter(replica)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _leave(*entered)
+    return wrapper
+
+
+def _writer_id(user):
+    return user.id if user is not None and user.is_authenticated else None
+
+
+class ReplicaRoutingMiddleware:
+    """Pin the users whose request wrote to the database to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_write_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_write_recorder(connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and REPLICAS:
+            # DRF sets request.user once it has authenticated the request
+            user_id = _writer_id(getattr(request, 'user', None))
+            if user_id is not None:
+                sticky_primary.pin(user_id)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and REPLICAS:
+            user = getattr(request, 'user', None)
+            if isinstance(user, SimpleLazyObject):
+                # Not set by @async_api_view; resolve the session user without blocking
+                user = await request.auser()
+            user_id = _writer_id(user)
+            if user_id is not None:
+                await sticky_primary.apin(user_id)
+        return response
+
+
+def copy_sqlite_primary():
+    """
+        Copy the SQLite primary into every SQLite replica, standing in for
+        replication when trying replicas locally. Returns the aliases copied.
+    """
+
+    primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+    if primary['ENGINE'] != 'django.db.backends.sqlite3':
+        return []
+    copied = []
+    source = sqlite3.connect(primary['NAME'])
+    try:
+        for alias in REPLICAS:
+            destination = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            try:
+                source.backup(destination)
+            finally:
+                destination.close()
+            copied.append(alias)
+    finally:
+        source.close()
+    return copied
@@ -1,3 +1,5 @@
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -33,11 +35,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'task_project.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'task_project.replicas.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -47,7 +51,7 @@ ROOT_URLCONF = 'task_project.urls'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'user.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': [
@@ -56,7 +60,146 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    # Used by the login throttles in user/throttling.py. The per-IP rate is
+    # high because a whole exam room may log in from behind one NAT address.
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '300/min',
+        'login_user': '10/min',
+    },
+}
+
+# 'default' is per process. CACHE_URL (redis://host:port/db, needs the redis
+# package) adds a 'shared' cache seen by every worker; the caches below that
+# must agree between workers use it when it is configured.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+SHARED_CACHE = None
+if os.environ.get('CACHE_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_URL'],
+    }
+    SHARED_CACHE = 'shared'
+
+# Token -> user (id, role) snapshots used by CachedTokenAuthentication.
+# With a shared BACKEND, deactivating a user or deleting a token applies to
+# every worker at once. Without one, snapshots are cached per process and
+# such changes take up to TTL seconds to reach the other workers.
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 30,
+    'BACKEND': SHARED_CACHE,
+}
+
+# Answer keys used to grade quiz attempts are cached per (quiz, version).
+# Set BACKEND to an alias from CACHES to share them between workers.
+ANSWER_KEY_CACHE = {
+    'MAX_ENTRIES': 1024,
+    'BACKEND': None,
+}
+
+# Queued grading (submit_quiz + the grade_submissions command).
+# RECLAIM_AFTER and the get_submission waits are in seconds: MAX_WAIT for
+# the async view, MAX_SYNC_WAIT for the sync one, which holds a thread.
+GRADING_QUEUE = {
+    'BATCH_SIZE': 200,
+    'POLL_INTERVAL': 1.0,
+    'RECLAIM_AFTER': 300,
+    'MAX_WAIT': 30,
+    'MAX_SYNC_WAIT': 2,
+}
+
+# Per-quiz score statistics. Scores are bucketed by percentage of the quiz's
+# total marks; run `manage.py rebuild_quiz_stats` after changing these.
+QUIZ_STATS = {
+    'PASS_PERCENT': 40,
+    'BUCKETS': 10,
+}
+
+# Timed attempt sessions (start_attempt). Autosaves are buffered per process
+# and the saves arriving during a write are written together by the next one;
+# async saves also gather for up to FLUSH_INTERVAL seconds first. A save waits
+# up to SAVE_TIMEOUT for its write.
+# Late saves and finishes are rejected GRACE seconds after the deadline, and
+# the sweep_attempt_sessions command grades the sessions left open.
+ATTEMPT_SESSIONS = {
+    'DEFAULT_TIME_LIMIT': 3600,
+    'GRACE': 5,
+    'FLUSH_INTERVAL': 2.0,
+    'BATCH_SIZE': 500,
+    'SAVE_TIMEOUT': 10.0,
+    'POLL_INTERVAL': 1.0,
+    'SETTLE_POLLS': 3,
+    'MAX_CACHED_DEADLINES': 50000,
+}
+
+LEADERBOARD = {
+    'MAX_QUIZ_BOARDS': 256,
+    'REFRESH_INTERVAL': 1.0,
+    'SETTLE_SECONDS': 10.0,
+}
+
+# Rendered catalogue listings, keyed by catalogue version (admin_actions.catalogue).
+CATALOGUE_CACHE = {
+    'BACKEND': 'default',
+    'TIMEOUT': 300,
+}
+
+# Live submission feeds (admin_actions.feed). Each watched quiz is polled
+# every POLL_INTERVAL seconds per process; attempts recorded in the same
+# process are pushed at once. Subscribers more than QUEUE_SIZE events behind
+# are disconnected and resume with Last-Event-ID.
+SUBMISSION_FEED = {
+    'POLL_INTERVAL': 1.0,
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 1000,
+    'BATCH_SIZE': 500,
+    'SETTLE_POLLS': 3,
+    'RETRY_MS': 3000,
+}
+
+# Precompiled quiz documents served by get_quiz_document (admin_actions.documents).
+# MAX_CACHED is the number of document blobs kept in memory per process.
+QUIZ_DOCUMENTS = {
+    'COMPRESS_LEVEL': 6,
+    'MAX_CACHED': 64,
+}
+
+# Per-request query/timing metrics (task_project.metrics). QUERY_BUDGETS are
+# the most queries a request may run, with cold caches, before it is logged
+# as over budget and fails assert_query_budgets() in tests. login creates the
+# token on a user's first login; get_submission reads the submission once per
+# poll of its MAX_SYNC_WAIT long-poll; save_answers includes the write of the
+# autosave batch it leads; start_attempt includes the first draw of a pooled
+# quiz.
+REQUEST_METRICS = {
+    'HEADERS': DEBUG,
+    'WINDOW': 300,
+    'QUERY_BUDGETS': {
+        'user.views.login': 6,
+        'user_actions.views.get_all_quiz': 4,
+        'user_actions.views.get_quiz_questions': 7,
+        'user_actions.views.get_quiz_document': 8,
+        'user_actions.views.attempt_quiz': 15,
+        'user_actions.views.submit_quiz': 6,
+        'user_actions.views.start_attempt': 10,
+        'user_actions.views.save_answers': 6,
+        'user_actions.views.finish_attempt': 16,
+        'user_actions.views.get_submission': 10,
+        'user_actions.views.get_quiz_attempts': 2,
+        'user_actions.views.get_leaderboard': 4,
+        'admin_actions.views.get_categories': 3,
+        'admin_actions.views.get_quiz': 3,
+        'admin_actions.views.get_question': 4,
+        'admin_actions.views.search_questions': 4,
+        'admin_actions.views.get_quiz_submissions': 3,
+        'admin_actions.views.get_all_submissions': 2,
+        'admin_actions.views.get_quiz_stats': 4,
+    },
 }
 
 TEMPLATES = [
@@ -81,11 +224,81 @@ WSGI_APPLICATION = 'task_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects the profile: 'sqlite' (default), 'postgresql' or 'mysql'.
+# Server databases read DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            # WAL lets reads run alongside the single writer. IMMEDIATE
+            # transactions take the write lock at BEGIN, so concurrent writers
+            # wait up to `timeout` seconds instead of failing with "database is
+            # locked" when a read lock cannot be upgraded.
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; '
+                    'PRAGMA mmap_size=268435456; PRAGMA cache_size=-20000'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
     }
+    # SQLITE_TUNING=0 restores Django's stock SQLite options, for comparison
+    if os.environ.get('SQLITE_TUNING', '1') == '0':
+        DATABASES['default'].update(CONN_MAX_AGE=0, OPTIONS={})
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.environ.get('DB_NAME', 'quiz'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    # DB_POOL_SIZE enables psycopg's connection pool (needs psycopg[pool]);
+    # pooled connections replace persistent ones, so CONN_MAX_AGE must be 0.
+    if DB_ENGINE == 'postgresql' and os.environ.get('DB_POOL_SIZE'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': 2,
+            'max_size': int(os.environ['DB_POOL_SIZE']),
+            'timeout': 10,
+        }
+
+# DB_REPLICAS lists read replicas, comma-separated: SQLite files for the
+# sqlite profile, host[:port] for the others. They are added as replica1,
+# replica2, ... with the other settings of 'default', and serve the views
+# decorated with @replica_reads (task_project.replicas).
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DB_ENGINE == 'sqlite':
+        DATABASES[f'replica{index}']['NAME'] = replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[f'replica{index}'].update(HOST=host, PORT=port or DATABASES['default']['PORT'])
+
+DATABASE_ROUTERS = ['task_project.replicas.ReplicaRouter']
+
+# Users whose request wrote read from the primary for STICKY_SECONDS, so
+# they see their writes despite replication lag. The pins are shared between
+# workers through BACKEND, the shared cache when CACHE_URL is set; without
+# one they are per process, and `manage.py check` warns when replicas are
+# enabled.
+DATABASE_REPLICAS = {
+    'STICKY_SECONDS': 10,
+    'MAX_STICKY_USERS': 100000,
+    'BACKEND': SHARED_CACHE,
 }
 
 
@@ -107,6 +320,45 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first hasher is used for new passwords; hashes made by the others are
+# upgraded to it on the next successful login. Argon2 is preferred when
+# argon2-cffi is installed, scrypt (stdlib only) otherwise.
+PASSWORD_HASHERS = [
+    'user.hashers.ScryptPasswordHasher',
+    'user.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if find_spec('argon2'):
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+# Costs of the hashers above, and the pool bounding login password checks.
+# At most WORKERS hashes run at once (async logins on the pool's threads, sync
+# ones on their request thread); logins beyond WORKERS + MAX_PENDING get a 503
+# instead of queueing.
+PASSWORD_HASHING = {
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 19456,
+    'ARGON2_PARALLELISM': 1,
+    'SCRYPT_WORK_FACTOR': 2**14,
+    'SCRYPT_BLOCK_SIZE': 8,
+    'SCRYPT_PARALLELISM': 1,
+    'WORKERS': 4,
+    'MAX_PENDING': 64,
+}
+
+# Bulk enrollment (enroll_users). Passwords are hashed on WORKERS processes
+# (None: one per CPU), started once per server process and shared by at
+# most MAX_CONCURRENT enrollments at a time; rosters under MIN_POOL_ROWS are
+# hashed in-process.
+BULK_ENROLLMENT = {
+    'WORKERS': None,
+    'BATCH_SIZE': 1000,
+    'MIN_POOL_ROWS': 50,
+    'MAX_REQUEST_ROWS': 10000,
+    'MAX_CONCURRENT': 2,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
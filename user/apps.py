@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        from . import signals
+        # Project-wide database checks (manage.py check --database default)
+        from task_project import health
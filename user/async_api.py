@@ -0,0 +1,87 @@
+"""
+Minimal plumbing for ASGI-native views. DRF's @api_view only supports sync
+functions, so async views use this decorator for method checks, token
+authentication and JSON parsing, and render with the same encoding as
+DRF's JSONRenderer.
+"""
+
+import json
+import math
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from admin_actions.pagination import dumps
+from .authentication import aauthenticate_credentials
+
+
+def json_response(payload, status=200):
+    return HttpResponse(dumps(payload), status=status, content_type='application/json')
+
+
+async def aauthenticate_token(request):
+    """Resolve an 'Authorization: Token <key>' header to a user, or None."""
+
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    try:
+        return await aauthenticate_credentials(header[1])
+    except AuthenticationFailed:
+        return None
+
+
+def parse_body(request):
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+async def athrottled(request, throttles):
+    """Return a 429 response if any of the DRF throttle classes rejects the request."""
+
+    waits = []
+    for throttle_class in throttles:
+        throttle = throttle_class()
+        # Throttles use the sync cache API
+        if not await sync_to_async(throttle.allow_request)(request, None):
+            waits.append(throttle.wait())
+    if not waits:
+        return None
+    wait = max((wait for wait in waits if wait is not None), default=None)
+    response = json_response({'detail': Throttled(wait).detail}, status=429)
+    if wait is not None:
+        response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def async_api_view(methods, authenticated=True, throttles=()):
+    """
+        Async counterpart of @api_view(methods) + @permission_classes([IsAuthenticated])
+        (+ @throttle_classes(throttles)).
+        Sets request.user and request.data before calling the view.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            if authenticated:
+                user = await aauthenticate_token(request)
+                if user is None:
+                    return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+                request.user = user
+            try:
+                request.data = parse_body(request) if request.method in ('POST', 'PUT', 'PATCH') else {}
+            except ValueError as exc:
+                return json_response({'detail': f'JSON parse error - {exc}'}, status=400)
+            if throttles:
+                response = await athrottled(request, throttles)
+                if response is not None:
+                    return response
+            return await view(request, *args, **kwargs)
+        return csrf_exempt(wrapper)
+    return decorator
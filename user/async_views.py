@@ -0,0 +1,13 @@
+from .async_api import async_api_view, json_response
+from .services import LOGIN_BUSY, alogin
+from .throttling import LOGIN_THROTTLES
+
+
+@async_api_view(['POST'], authenticated=False, throttles=LOGIN_THROTTLES)
+async def login(request):
+    payload = await alogin(request, request.data)
+    if payload is LOGIN_BUSY:
+        response = json_response(payload, status=503)
+        response['Retry-After'] = '1'
+        return response
+    return json_response(payload)
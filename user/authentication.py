@@ -0,0 +1,209 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+# Fields loaded on the cached user; everything else is deferred and fetched on access
+SNAPSHOT_FIELDS = ['id', 'role', 'is_active']
+
+
+class TokenCache:
+    """
+        Cache of token key -> user snapshot (id, role, is_active).
+
+        Without a backend, snapshots are kept in a bounded in-process TTL
+        cache, and a user saved through another worker keeps their old
+        snapshot there for up to `ttl` seconds.
+
+        With a shared backend (a CACHES alias), snapshots are only kept there,
+        next to a version per token. get() returns the version with the
+        snapshot; a snapshot loaded after a miss is stored with the version
+        read before loading it, and invalidate() replaces the version, so
+        snapshots stored before an invalidation are never served again, on
+        any worker.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _shared(self):
+        if self.backend:
+            return caches[self.backend]
+        return None
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def _put_local(self, key, snapshot):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _check_shared(self, key, values):
+        entry, version = values.get(f'auth_token:{key}'), values.get(f'auth_version:{key}')
+        snapshot = entry[0] if entry is not None and entry[1] == version else None
+        self._count(snapshot is not None)
+        return snapshot, version
+
+    def get(self, key):
+        """Return (snapshot or None, version to pass to set())."""
+
+        shared = self._shared()
+        if shared is None:
+            return self._get_local(key), None
+        return self._check_shared(key, shared.get_many([f'auth_token:{key}', f'auth_version:{key}']))
+
+    async def aget(self, key):
+        """See get()."""
+
+        shared = self._shared()
+        if shared is None:
+            return self._get_local(key), None
+        return self._check_shared(key, await shared.aget_many([f'auth_token:{key}', f'auth_version:{key}']))
+
+    def set(self, key, snapshot, version=None):
+        shared = self._shared()
+        if shared is None:
+            self._put_local(key, snapshot)
+        else:
+            shared.set(f'auth_token:{key}', (snapshot, version), self.ttl)
+
+    async def aset(self, key, snapshot, version=None):
+        """See set()."""
+
+        shared = self._shared()
+        if shared is None:
+            self._put_local(key, snapshot)
+        else:
+            await shared.aset(f'auth_token:{key}', (snapshot, version), self.ttl)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self._shared()
+        if shared is not None and keys:
+            # Snapshots stored under an old version expire within ttl, so the new one need not outlive it
+            shared.set_many({f'auth_version:{key}': secrets.token_hex(8) for key in keys}, self.ttl)
+            shared.delete_many([f'auth_token:{key}' for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_config = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+token_cache = TokenCache(
+    max_entries=_config.get('MAX_ENTRIES', 10000),
+    ttl=_config.get('TTL', 30),
+    backend=_config.get('BACKEND'),
+)
+
+
+def invalidate_user_tokens(user_id):
+    """
+        Drop the cached snapshots of a user's tokens once the current
+        transaction commits. Saving or deleting a user does this through
+        signals; call it after changing users with QuerySet.update().
+    """
+
+    keys = list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+    if keys:
+        # After the commit, so a snapshot reloaded in the meantime is not cached under the new version
+        transaction.on_commit(lambda: token_cache.invalidate(*keys))
+
+
+def snapshot_of(user):
+    return tuple(getattr(user, field) for field in SNAPSHOT_FIELDS)
+
+
+def user_from_snapshot(snapshot):
+    # A regular User instance with only the snapshot fields loaded, so it can
+    # still be used in queries and for FK assignment
+    values = dict(zip(SNAPSHOT_FIELDS, snapshot))
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in values]
+    return User.from_db('default', field_names, [values[name] for name in field_names])
+
+
+def _token_query(key):
+    return Token.objects.select_related('user').filter(key=key)
+
+
+def _check_token(token):
+    if token is None:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return snapshot_of(token.user)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+        TokenAuthentication that resolves tokens through token_cache instead
+        of a Token + User query on every request. Entries are dropped when
+        the token is deleted or the user is saved or deleted (see signals.py).
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot, version = token_cache.get(key)
+        if snapshot is None:
+            snapshot = _check_token(_token_query(key).first())
+            token_cache.set(key, snapshot, version)
+        user = user_from_snapshot(snapshot)
+        return (user, Token(key=key, user=user))
+
+
+async def aauthenticate_credentials(key):
+    """Async counterpart of CachedTokenAuthentication.authenticate_credentials()."""
+
+    snapshot, version = await token_cache.aget(key)
+    if snapshot is None:
+        snapshot = _check_token(await _token_query(key).afirst())
+        await token_cache.aset(key, snapshot, version)
+    return user_from_snapshot(snapshot)
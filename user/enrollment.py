@@ -0,0 +1,265 @@
+"""
+Bulk enrollment of users from a roster (the enroll_users view and command).
+
+Password hashing is CPU-bound and dominates enrollment, so passwords are
+hashed on a pool of processes while the main process writes the accounts:
+each batch of BATCH_SIZE users and their tokens is inserted with two
+bulk_create calls, in one transaction, while the next batch is hashed.
+Existing accounts are found with one IN lookup per batch instead of a query
+per row, matching emails case-insensitively like the duplicate check within
+the roster. Rows without a password get a generated one, returned with the
+tokens.
+
+The hashing processes are started once per server process and shared by
+its enrollments (HashingProcesses); at most MAX_CONCURRENT enrollments use
+them at once, and the others are refused with EnrollmentBusy.
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+_config = getattr(settings, 'BULK_ENROLLMENT', {})
+WORKERS = _config.get('WORKERS')
+BATCH_SIZE = _config.get('BATCH_SIZE', 1000)
+MIN_POOL_ROWS = _config.get('MIN_POOL_ROWS', 50)
+MAX_REQUEST_ROWS = _config.get('MAX_REQUEST_ROWS', 10000)
+MAX_CONCURRENT = _config.get('MAX_CONCURRENT', 2)
+HASH_CHUNK = 16
+
+RESULT_COLUMNS = ['row', 'email', 'status', 'token', 'password', 'message']
+
+EMAIL_EXISTS = 'Email already exists'
+DUPLICATE_EMAIL = 'Email appears earlier in the roster'
+
+
+def read_roster(stream, name):
+    """
+        Read roster rows (dicts with email and an optional password) from a
+        binary file. Returns (rows, errors) where errors maps a row index to
+        a parse error; such rows are passed on as None so row numbers stay
+        aligned with the input.
+    """
+
+    name = name.lower()
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    if name.endswith('.csv'):
+        return list(csv.DictReader(text)), {}
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        rows, errors = [], {}
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as exc:
+                errors[len(rows)] = f'Invalid JSON: {exc}'
+                rows.append(None)
+        return rows, errors
+    raise ValueError('File must be .csv or .jsonl')
+
+
+def _row_error(row):
+    if not isinstance(row, dict):
+        return 'Row must be an object with an email'
+    email, password = row.get('email'), row.get('password')
+    if not isinstance(email, str) or not email.strip():
+        return 'Email is required'
+    try:
+        validate_email(email.strip())
+    except ValidationError:
+        return 'Enter a valid email address'
+    if password is not None and not isinstance(password, str):
+        return 'Password must be a string'
+    return None
+
+
+def _existing_emails(emails):
+    """The lowercased usernames and emails of the accounts matching emails, ignoring case."""
+
+    lowered = [email.lower() for email in emails]
+    existing = set()
+    accounts = User.objects.annotate(username_lower=Lower('username'), email_lower=Lower('email')).filter(
+        Q(username_lower__in=lowered) | Q(email_lower__in=lowered),
+    )
+    for username, email in accounts.values_list('username_lower', 'email_lower'):
+        existing.update((username, email))
+    return existing
+
+
+class EnrollmentBusy(Exception):
+    pass
+
+
+class HashingProcesses:
+    """
+        Long-lived pool of `workers` password hashing processes, started on
+        first use, that at most `max_concurrent` enrollments use at once.
+    """
+
+    def __init__(self, workers, max_concurrent=MAX_CONCURRENT):
+        self.workers = workers or multiprocessing.cpu_count()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self):
+        """Return the executor for one enrollment; release() it when done. Raises EnrollmentBusy."""
+
+        if not self._slots.acquire(blocking=False):
+            raise EnrollmentBusy
+        try:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a threaded server process could copy a held lock into the workers
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+                    )
+                return self._executor
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self):
+        self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+hashing_processes = HashingProcesses(WORKERS)
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def _submit(executor, batch):
+    passwords = [password for _, _, password, _ in batch]
+    return [executor.submit(_hash_passwords, passwords[start:start + HASH_CHUNK]) for start in range(0, len(passwords), HASH_CHUNK)]
+
+
+def _insert(batch, hashes, role):
+    """Create the users of batch and their tokens. Returns {position in batch: token key} of the users created."""
+
+    users = [
+        User(username=email, email=email, password=encoded, role=role)
+        for (_, email, _, _), encoded in zip(batch, hashes)
+    ]
+    ours = set(hashes)
+    with transaction.atomic():
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        # Ids are not returned on every backend, and rows taken by concurrent
+        # registrations were skipped; the salted hash tells our rows apart
+        created = {
+            username: user_id for username, user_id, encoded
+            in User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id', 'password')
+            if encoded in ours
+        }
+        tokens = {username: Token.generate_key() for username in created}
+        Token.objects.bulk_create([Token(key=tokens[username], user_id=user_id) for username, user_id in created.items()])
+    return {position: tokens[email] for position, (_, email, _, _) in enumerate(batch) if email in created}
+
+
+def enroll(rows, role='user', errors=None, processes=hashing_processes, batch_size=BATCH_SIZE):
+    """
+        Create an account with a token for every valid roster row whose email
+        is not taken, hashing on processes (a HashingProcesses) unless there
+        are fewer than MIN_POOL_ROWS accounts to create. errors maps row
+        indices that could not be parsed to a message. Raises EnrollmentBusy
+        when processes is in use by MAX_CONCURRENT enrollments. Returns one
+        result per row, in roster order:
+        {'row', 'email', 'status': 'created' | 'skipped' | 'invalid', 'token',
+        'password' (only when generated), 'message'}.
+    """
+
+    errors = errors or {}
+    results = [None] * len(rows)
+    pending = []
+    seen = set()
+    for index, row in enumerate(rows):
+        message = errors.get(index) or _row_error(row)
+        if message is None and row['email'].strip().lower() in seen:
+            message = DUPLICATE_EMAIL
+        if message is not None:
+            email = row.get('email') if isinstance(row, dict) else None
+            results[index] = {'row': index + 1, 'email': email, 'status': 'invalid', 'message': message}
+            continue
+        email = row['email'].strip()
+        seen.add(email.lower())
+        password = row.get('password') or None
+        pending.append((index, email, password or secrets.token_urlsafe(12), password is None))
+
+    candidates = []
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        existing = _existing_emails([email for _, email, _, _ in batch])
+        for entry in batch:
+            if entry[1].lower() in existing:
+                results[entry[0]] = {'row': entry[0] + 1, 'email': entry[1], 'status': 'skipped', 'message': EMAIL_EXISTS}
+            else:
+                candidates.append(entry)
+
+    batches = [candidates[start:start + batch_size] for start in range(0, len(candidates), batch_size)]
+    executor = processes.acquire() if len(candidates) >= MIN_POOL_ROWS and processes.workers >= 2 else None
+    ahead = []
+    try:
+        if executor is not None and batches:
+            ahead = _submit(executor, batches[0])
+        for number, batch in enumerate(batches):
+            if executor is None:
+                hashes = _hash_passwords([password for _, _, password, _ in batch])
+            else:
+                # The next batch is hashed while this one is written
+                hashing, ahead = ahead, (_submit(executor, batches[number + 1]) if number + 1 < len(batches) else [])
+                hashes = [encoded for future in hashing for encoded in future.result()]
+            tokens = _insert(batch, hashes, role)
+            for position, (index, email, password, generated) in enumerate(batch):
+                if position in tokens:
+                    result = {'row': index + 1, 'email': email, 'status': 'created', 'token': tokens[position]}
+                    if generated:
+                        result['password'] = password
+                else:
+                    result = {'row': index + 1, 'email': email, 'status': 'skipped', 'message': EMAIL_EXISTS}
+                results[index] = result
+    finally:
+        if executor is not None:
+            for future in ahead:
+                future.cancel()
+            processes.release()
+    return results
+
+
+def summary(results):
+    counts = {'created': 0, 'skipped': 0, 'invalid': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return counts
+
+
+def write_results(results, stream):
+    """Write results as CSV, one line per roster row."""
+
+    writer = csv.DictWriter(stream, RESULT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(results)
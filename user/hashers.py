@@ -0,0 +1,31 @@
+"""
+Password hashers tuned for login throughput.
+
+Django's defaults are sized for a single interactive login: PBKDF2 with a
+million iterations, Argon2 with 100 MiB and 8 lanes, scrypt with 5 lanes.
+These subclasses keep the memory-hard algorithms but use the OWASP minimum
+parameters, which verify several times faster. The algorithm names are
+unchanged, so stored hashes stay readable by Django's own hashers, and
+changing a cost below makes check_password() rehash on the next login.
+"""
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_config = getattr(settings, 'PASSWORD_HASHING', {})
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id, 19 MiB, 2 passes, 1 lane. Needs the argon2-cffi package."""
+
+    time_cost = _config.get('ARGON2_TIME_COST', 2)
+    memory_cost = _config.get('ARGON2_MEMORY_COST', 19456)
+    parallelism = _config.get('ARGON2_PARALLELISM', 1)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """scrypt, N=2**14, r=8, p=1 (16 MiB). Uses hashlib only."""
+
+    work_factor = _config.get('SCRYPT_WORK_FACTOR', 2**14)
+    block_size = _config.get('SCRYPT_BLOCK_SIZE', 8)
+    parallelism = _config.get('SCRYPT_PARALLELISM', 1)
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from user.enrollment import BATCH_SIZE, WORKERS, HashingProcesses, enroll, read_roster, summary, write_results
+
+
+class Command(BaseCommand):
+    help = 'Create accounts and tokens for a roster (.csv with email,password columns, or .jsonl)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='Path of the .csv or .jsonl roster')
+        parser.add_argument('--role', choices=['user', 'admin'], default='user')
+        parser.add_argument('--output', help='Write the per-row results (tokens, generated passwords) to this CSV file; - for stdout')
+        parser.add_argument('--workers', type=int, default=WORKERS, help='Hashing processes (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['roster'], 'rb') as stream:
+                rows, errors = read_roster(stream, options['roster'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        processes = HashingProcesses(options['workers'], max_concurrent=1)
+        try:
+            results = enroll(rows, options['role'], errors, processes, options['batch_size'])
+        finally:
+            processes.shutdown()
+        if options['output'] == '-':
+            write_results(results, sys.stdout)
+        elif options['output']:
+            with open(options['output'], 'w', newline='') as stream:
+                write_results(results, stream)
+        counts = summary(results)
+        self.stderr.write(f"Created {counts['created']} users, skipped {counts['skipped']} existing, {counts['invalid']} invalid rows")
@@ -0,0 +1,127 @@
+"""
+Login logic shared by the sync DRF view in views.py and the ASGI-native view
+in async_views.py.
+
+Login goes through django.contrib.auth.authenticate(), so every backend in
+AUTHENTICATION_BACKENDS is consulted, user_login_failed fires on failures and
+ModelBackend upgrades outdated password hashes; user_logged_in is sent on
+success. Password hashing is bounded by a HashingPool: sync logins hash on
+their own request thread and async ones on the pool's threads (hashlib
+releases the GIL), and at most WORKERS hashes run at once, so a burst of
+logins cannot occupy every request worker with hashing. When WORKERS +
+MAX_PENDING logins are already in flight, login fails fast with LOGIN_BUSY.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+CREDENTIALS_REQUIRED = {'status':False, 'message': 'Username and password are required'}
+INVALID_CREDENTIALS = {'status':False, 'message': 'Invalid credentials'}
+LOGIN_BUSY = {'status':False, 'message': 'Too many logins in progress, please try again'}
+
+_config = getattr(settings, 'PASSWORD_HASHING', {})
+
+
+class HashingPoolFull(Exception):
+    pass
+
+
+class HashingPool:
+    """
+        Runs at most `workers` password checks at once and refuses work once
+        `workers + max_pending` calls are in flight. submit() runs a call on
+        the pool's threads, run() on the calling thread.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._running = threading.BoundedSemaphore(workers)
+
+    def _call(self, fn, *args):
+        with self._running:
+            return fn(*args)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolFull
+        try:
+            future = self._executor.submit(self._call, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolFull
+        try:
+            return self._call(fn, *args)
+        finally:
+            self._slots.release()
+
+
+hashing_pool = HashingPool(_config.get('WORKERS', 4), _config.get('MAX_PENDING', 64))
+
+
+def parse_credentials(data):
+    """Return (username, password, error payload)."""
+
+    if not isinstance(data, dict) or data.get('username') is None or data.get('password') is None:
+        return None, None, CREDENTIALS_REQUIRED
+    return data.get('username'), data.get('password'), None
+
+
+def _authenticate(request, username, password):
+    return authenticate(request, username=username, password=password)
+
+
+def _authenticate_on_pool(request, username, password):
+    # Pool threads serve no requests, so nothing else recycles their connections
+    close_old_connections()
+    try:
+        return _authenticate(request, username, password)
+    finally:
+        close_old_connections()
+
+
+def login(request, data):
+    username, password, error = parse_credentials(data)
+    if error:
+        return error
+    try:
+        user = hashing_pool.run(_authenticate, request, username, password)
+    except HashingPoolFull:
+        return LOGIN_BUSY
+    if user is None:
+        return INVALID_CREDENTIALS
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
+    return {'status':True, 'token':Token.objects.get_or_create(user=user)[0].key}
+
+
+async def alogin(request, data):
+    """See login()."""
+
+    username, password, error = parse_credentials(data)
+    if error:
+        return error
+    try:
+        future = hashing_pool.submit(_authenticate_on_pool, request, username, password)
+    except HashingPoolFull:
+        return LOGIN_BUSY
+    user = await asyncio.wrap_future(future)
+    if user is None:
+        return INVALID_CREDENTIALS
+    await user_logged_in.asend(sender=user.__class__, request=request, user=user)
+    return {'status':True, 'token':(await Token.objects.aget_or_create(user=user))[0].key}
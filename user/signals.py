@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_user_tokens, token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: token_cache.invalidate(key))
+
+
+# Deleting a user cascades to its token, which is handled above
+@receiver(post_save, sender=User)
+def invalidate_saved_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Every login saves last_login, which no cached snapshot holds
+    if created or update_fields == frozenset(['last_login']):
+        return
+    invalidate_user_tokens(instance.id)
@@ -1,3 +1,195 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from task_project import health, replicas
+from task_project.metrics import assert_query_budgets
+from . import enrollment, services
+from .authentication import TokenCache, token_cache
+
+User = get_user_model()
+
+SHARED_LOCMEM = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='s@x.com', email='s@x.com', password='pw', role='user')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/get_quiz_attempts').status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get('/api/get_quiz_attempts').status_code, 401)
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get('/api/get_quiz_attempts').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get('/api/get_quiz_attempts').status_code, 401)
+
+    @override_settings(CACHES=SHARED_LOCMEM)
+    def test_invalidation_reaches_other_workers(self):
+        # Two workers sharing one cache
+        first, second = TokenCache(backend='shared'), TokenCache(backend='shared')
+        snapshot, version = first.get('key')
+        self.assertIsNone(snapshot)
+        first.set('key', (1, 'user', True), version)
+        self.assertEqual(second.get('key')[0], (1, 'user', True))
+        second.invalidate('key')
+        self.assertIsNone(first.get('key')[0])
+
+    @override_settings(CACHES=SHARED_LOCMEM)
+    def test_snapshot_loaded_before_invalidation_is_not_served(self):
+        first, second = TokenCache(backend='shared'), TokenCache(backend='shared')
+        _, version = first.get('key')
+        # The user is deactivated while the first worker loads the old snapshot
+        second.invalidate('key')
+        first.set('key', (1, 'user', True), version)
+        self.assertIsNone(second.get('key')[0])
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='s@x.com', email='s@x.com', password='pw', role='user')
+
+    def login(self, password='pw', path='/api/user/login'):
+        return APIClient().post(path, {'username': 's@x.com', 'password': password}, format='json')
+
+    def test_login_returns_the_token_and_records_it(self):
+        logged_in = []
+        user_logged_in.connect(lambda **kwargs: logged_in.append(kwargs['user']), dispatch_uid='test-login', weak=False)
+        try:
+            with assert_query_budgets():
+                response = self.login().json()
+        finally:
+            user_logged_in.disconnect(dispatch_uid='test-login')
+        self.assertEqual(response, {'status': True, 'token': Token.objects.get(user=self.user).key})
+        self.assertEqual(logged_in, [self.user])
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_wrong_password_is_rejected_and_signalled(self):
+        failed = []
+        user_login_failed.connect(lambda **kwargs: failed.append(kwargs['credentials']), dispatch_uid='test-login', weak=False)
+        try:
+            response = self.login('nope').json()
+        finally:
+            user_login_failed.disconnect(dispatch_uid='test-login')
+        self.assertEqual(response, {'status': False, 'message': 'Invalid credentials'})
+        self.assertEqual([credentials['username'] for credentials in failed], ['s@x.com'])
+
+    def test_inactive_user_is_rejected(self):
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(self.login().json(), {'status': False, 'message': 'Invalid credentials'})
+
+    def test_outdated_hash_is_upgraded(self):
+        User.objects.filter(id=self.user.id).update(password=make_password('pw', hasher='pbkdf2_sha1'))
+        self.assertTrue(self.login().json()['status'])
+        self.user.refresh_from_db()
+        self.assertEqual(identify_hasher(self.user.password).algorithm, get_hasher().algorithm)
+
+    def test_bodies_that_are_not_objects_are_rejected(self):
+        for body in ('[1]', 'null', '5'):
+            with self.subTest(body=body):
+                response = APIClient().post('/api/user/login', body, content_type='application/json')
+                self.assertEqual(response.json(), {'status': False, 'message': 'Username and password are required'})
+
+    def test_saturated_pool_answers_busy(self):
+        with mock.patch.object(services.hashing_pool, 'run', side_effect=services.HashingPoolFull):
+            response = self.login()
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+
+
+class AsyncLoginTests(TransactionTestCase):
+    # The password is checked on a pool thread, which only sees committed rows
+
+    def test_async_login_returns_the_token(self):
+        user = User.objects.create_user(username='s@x.com', email='s@x.com', password='pw', role='user')
+        response = APIClient().post('/api/user/async/login', {'username': 's@x.com', 'password': 'pw'}, format='json')
+        self.assertEqual(response.json(), {'status': True, 'token': Token.objects.get(user=user).key})
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+        response = APIClient().post('/api/user/async/login', {'username': 's@x.com', 'password': 'nope'}, format='json')
+        self.assertEqual(response.json(), {'status': False, 'message': 'Invalid credentials'})
+
+    def test_async_login_rejects_bodies_that_are_not_objects(self):
+        for body in ('[1]', 'null', '5'):
+            with self.subTest(body=body):
+                response = APIClient().post('/api/user/async/login', body, content_type='application/json')
+                self.assertEqual(response.json(), {'status': False, 'message': 'Username and password are required'})
+
+
+class ReplicaPinTests(TestCase):
+    def test_pins_default_to_the_shared_cache(self):
+        self.assertEqual(replicas.sticky_primary.backend, settings.SHARED_CACHE)
+
+    @override_settings(CACHES=SHARED_LOCMEM)
+    def test_pins_reach_other_workers(self):
+        first, second = replicas.StickyPrimary(backend='shared'), replicas.StickyPrimary(backend='shared')
+        first.pin(7)
+        self.assertTrue(second.is_pinned(7))
+        self.assertFalse(second.is_pinned(8))
+
+    def test_replicas_without_a_shared_backend_are_flagged(self):
+        with mock.patch.object(replicas, 'REPLICAS', ['replica1']), mock.patch.object(replicas.sticky_primary, 'backend', None):
+            self.assertEqual([message.id for message in health.check_replicas()], ['task_project.W003'])
+        with mock.patch.object(replicas, 'REPLICAS', ['replica1']), mock.patch.object(replicas.sticky_primary, 'backend', 'shared'):
+            self.assertEqual(health.check_replicas(), [])
+
+
+class EnrollmentTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin@x.com', email='admin@x.com', password='pw', role='admin')
+
+    def test_existing_emails_match_regardless_of_case(self):
+        User.objects.create_user(username='Bob@x.com', email='Bob@x.com', password='pw', role='user')
+        results = enrollment.enroll([{'email': 'bob@X.com', 'password': 'pw'}, {'email': 'amy@x.com', 'password': 'pw'}])
+        self.assertEqual([(result['email'], result['status']) for result in results], [('bob@X.com', 'skipped'), ('amy@x.com', 'created')])
+        self.assertEqual(User.objects.filter(email__iexact='bob@x.com').count(), 1)
+
+    def test_enrollments_share_one_bounded_pool(self):
+        processes = enrollment.HashingProcesses(2, max_concurrent=1)
+        self.addCleanup(processes.shutdown)
+        executors = []
+        with mock.patch.object(enrollment, 'MIN_POOL_ROWS', 1):
+            for name in ('first', 'second'):
+                rows = [{'email': f'{name}{index}@x.com', 'password': 'pw'} for index in range(3)]
+                results = enrollment.enroll(rows, processes=processes, batch_size=2)
+                self.assertEqual([result['status'] for result in results], ['created'] * 3)
+                executors.append(processes._executor)
+            self.assertIs(executors[0], executors[1])
+            self.assertTrue(User.objects.get(email='second2@x.com').check_password('pw'))
+            # One enrollment at a time; the next is refused while it hashes
+            processes.acquire()
+            with self.assertRaises(enrollment.EnrollmentBusy):
+                enrollment.enroll([{'email': 'third@x.com'}], processes=processes)
+            processes.release()
+
+    def test_bodies_without_users_are_rejected(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.admin).key}')
+        for body in ('"x"', '5', 'null', '{"users": "x"}'):
+            with self.subTest(body=body):
+                response = client.post('/api/user/enroll_users', body, content_type='application/json')
+                self.assertEqual(response.json(), {'status': False, 'message': 'Users are required'})
+
+    def test_busy_pool_answers_busy(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.admin).key}')
+        with mock.patch('user.views.enroll', side_effect=enrollment.EnrollmentBusy):
+            response = client.post('/api/user/enroll_users', [{'email': 'amy@x.com'}], format='json')
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '5'))
@@ -0,0 +1,30 @@
+import hashlib
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginIPThrottle(SimpleRateThrottle):
+    """Limits login attempts per client IP (see NUM_PROXIES for X-Forwarded-For)."""
+
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginUserThrottle(SimpleRateThrottle):
+    """Limits login attempts per username, whatever IPs they come from."""
+
+    scope = 'login_user'
+
+    def get_cache_key(self, request, view):
+        if not isinstance(request.data, dict):
+            return None
+        username = request.data.get('username')
+        if not isinstance(username, str):
+            return None
+        # Usernames are arbitrary input; hash them into a safe cache key
+        return self.cache_format % {'scope': self.scope, 'ident': hashlib.sha256(username.encode()).hexdigest()}
+
+
+LOGIN_THROTTLES = [LoginIPThrottle, LoginUserThrottle]
@@ -1,8 +1,11 @@
 from django.urls import path
 from .views import *
+from . import async_views
 
 urlpatterns = [
     path('register_admin',register_admin), # Register Admin
     path('register_user',register_user), # Register User
+    path('enroll_users', enroll_users), # Bulk enrollment (Admin)
     path('login', login), # Login
+    path('async/login', async_views.login), # Login (ASGI-native)
 ]
\ No newline at end of file
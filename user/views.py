@@ -1,24 +1,25 @@
 from django.shortcuts import render
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from django.contrib.auth import authenticate
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+
+from .enrollment import MAX_REQUEST_ROWS, EnrollmentBusy, enroll, read_roster, summary, write_results
+from .services import LOGIN_BUSY, login as login_service
+from .throttling import LOGIN_THROTTLES
 
 User = get_user_model()
 
 @api_view(['POST'])
+@throttle_classes(LOGIN_THROTTLES)
 def login(request):
-    if request.data.get('username') is None or request.data.get('password') is None:
-        return Response({'status':False, 'message': 'Username and password are required'})
-    username = request.data.get('username')
-    password = request.data.get('password')
-    user = authenticate(username=username, password=password)
-    if user:
-        token = Token.objects.get(user=user)
-        return Response({'status':True, 'token':token.key})
-    return Response({'status':False, 'message': 'Invalid credentials'})
+    payload = login_service(request, request.data)
+    if payload is LOGIN_BUSY:
+        return Response(payload, status=503, headers={'Retry-After': '1'})
+    return Response(payload)
 
 @api_view(['POST'])
 def register_user(request):
@@ -46,4 +47,65 @@ def register_admin(request):
         user.save()
         token = Token.objects.create(user=user)
         return Response({'status':True, 'token':token.key})
-    return Response({'status':False, 'message': 'Email already exists'})
\ No newline at end of file
+    return Response({'status':False, 'message': 'Email already exists'})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def enroll_users(request):
+    """
+        Create student accounts from a roster (Admin only)
+        Passwords are hashed on a process pool and the accounts and their
+        tokens are inserted in batches; emails that already have an account
+        are skipped.
+
+        Body (one of):
+        - A JSON array of {"email": ..., "password": ...}
+        - {"users": [...]}
+        - multipart form with a file (.csv with an email,password header row, or .jsonl)
+        The password is optional; a random one is generated and returned when missing.
+
+        Query params:
+        - output (string, optional): 'json' (default) or 'csv' for a downloadable result file
+
+        Returns:
+        - {'status': True, 'created': 2, 'skipped': 1, 'invalid': 0, 'results': [
+            {'row': 1, 'email': ..., 'status': 'created', 'token': ..., 'password': <if generated>},
+            {'row': 2, 'email': ..., 'status': 'skipped', 'message': 'Email already exists'}, ...]}
+        - {'status': False, 'message': ...} if the roster cannot be read
+        Rosters of more than BULK_ENROLLMENT['MAX_REQUEST_ROWS'] rows must go
+        through `manage.py enroll_users`. While BULK_ENROLLMENT['MAX_CONCURRENT']
+        enrollments are hashing, further ones get a 503 with Retry-After.
+    """
+
+    user = request.user
+    if user.role != 'admin':
+        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
+    output = request.GET.get('output', 'json')
+    if output not in ('json', 'csv'):
+        return Response({'status':False, 'message': 'Output must be json or csv'})
+    upload = request.FILES.get('file')
+    try:
+        if upload is not None:
+            rows, errors = read_roster(upload.file, upload.name)
+        else:
+            if isinstance(request.data, list):
+                rows = request.data
+            else:
+                rows = request.data.get('users') if isinstance(request.data, dict) else None
+            if not isinstance(rows, list):
+                raise ValueError('Users are required')
+            errors = {}
+    except ValueError as exc:
+        return Response({'status':False, 'message': str(exc)})
+    if len(rows) > MAX_REQUEST_ROWS:
+        return Response({'status':False, 'message': f'At most {MAX_REQUEST_ROWS} users per request; use manage.py enroll_users for larger rosters'})
+    try:
+        results = enroll(rows, errors=errors)
+    except EnrollmentBusy:
+        return Response({'status':False, 'message': 'Too many enrollments in progress, please try again'}, status=503, headers={'Retry-After': '5'})
+    if output == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="enrollment.csv"'
+        write_results(results, response)
+        return response
+    return Response({'status': True, **summary(results), 'results': results})
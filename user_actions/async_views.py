@@ -0,0 +1,73 @@
+"""
+ASGI-native variants of the student endpoints. They share their logic with
+views.py through services.py and use Django's async ORM, so they do not tie
+up a thread per request when served by an ASGI server.
+"""
+
+from django.http import StreamingHttpResponse
+from user.async_api import async_api_view, json_response
+from task_project.replicas import replica_reads
+from .services import (
+    NOT_AUTHORIZED, INVALID_QUERY, is_student, catalogue_queryset, aget_catalogue, astream_catalogue,
+    aget_attempts, aattempt_quiz, asubmit_quiz, aget_submission, asave_answers,
+)
+
+
+@async_api_view(['GET'])
+@replica_reads
+async def get_all_quiz(request):
+    """See views.get_all_quiz()."""
+
+    if not is_student(request.user):
+        return json_response(NOT_AUTHORIZED)
+    if request.GET.get('stream'):
+        try:
+            quizzes = catalogue_queryset(request)
+        except ValueError:
+            return json_response(INVALID_QUERY)
+        return StreamingHttpResponse(astream_catalogue(quizzes), content_type='application/json')
+    return json_response(await aget_catalogue(request))
+
+
+@async_api_view(['POST'])
+async def attempt_quiz(request):
+    """See views.attempt_quiz()."""
+
+    if not is_student(request.user):
+        return json_response(NOT_AUTHORIZED)
+    return json_response(await aattempt_quiz(request.user, request.data))
+
+
+@async_api_view(['POST'])
+async def submit_quiz(request):
+    """See views.submit_quiz()."""
+
+    if not is_student(request.user):
+        return json_response(NOT_AUTHORIZED)
+    return json_response(await asubmit_quiz(request.user, request.data))
+
+
+@async_api_view(['POST'])
+async def save_answers(request):
+    """See views.save_answers(). Waits for the autosave write without holding a thread."""
+
+    if not is_student(request.user):
+        return json_response(NOT_AUTHORIZED)
+    return json_response(await asave_answers(request.user, request.data))
+
+
+@async_api_view(['GET'])
+async def get_submission(request):
+    """See views.get_submission(). Long-polls without holding a thread."""
+
+    if not is_student(request.user):
+        return json_response(NOT_AUTHORIZED)
+    return json_response(await aget_submission(request.user, request.GET))
+
+
+@async_api_view(['GET'])
+@replica_reads
+async def get_quiz_attempts(request):
+    if not is_student(request.user):
+        return json_response(NOT_AUTHORIZED)
+    return json_response(await aget_attempts(request.user))
@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .scoring import aload_answer_key, aload_answer_keys, load_answer_key, load_answer_keys
+
+
+def _shared_key(quiz_id, version):
+    # The prefix names the answer key format; change it when the format changes
+    return f'answer_key:v2:{quiz_id}:{version}'
+
+
+class AnswerKeyCache:
+    """
+        Process-local LRU cache of quiz answer keys.
+
+        Entries are keyed by (quiz_id, version), so bumping Quiz.version makes
+        stale keys unreachable; they simply age out of the LRU. When a shared
+        backend (a CACHES alias) is configured, local misses are looked up
+        there before falling back to the database.
+    """
+
+    def __init__(self, max_entries=1024, backend=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.evictions = 0
+
+    def _shared(self):
+        if self.backend:
+            return caches[self.backend]
+        return None
+
+    def _get_local(self, key):
+        with self._lock:
+            answer_key = self._entries.get(key)
+            if answer_key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return answer_key
+
+    def get(self, quiz_id, version):
+        answer_key = self._get_local((quiz_id, version))
+        if answer_key is not None:
+            return answer_key
+        shared = self._shared()
+        shared_key = _shared_key(quiz_id, version)
+        answer_key = shared.get(shared_key) if shared is not None else None
+        if answer_key is None:
+            answer_key = load_answer_key(quiz_id)
+            if shared is not None:
+                shared.set(shared_key, answer_key)
+        else:
+            with self._lock:
+                self.shared_hits += 1
+        self.put(quiz_id, version, answer_key)
+        return answer_key
+
+    async def aget(self, quiz_id, version):
+        """See get()."""
+
+        answer_key = self._get_local((quiz_id, version))
+        if answer_key is not None:
+            return answer_key
+        shared = self._shared()
+        shared_key = _shared_key(quiz_id, version)
+        answer_key = await shared.aget(shared_key) if shared is not None else None
+        if answer_key is None:
+            answer_key = await aload_answer_key(quiz_id)
+            if shared is not None:
+                await shared.aset(shared_key, answer_key)
+        else:
+            with self._lock:
+                self.shared_hits += 1
+        self.put(quiz_id, version, answer_key)
+        return answer_key
+
+    def _local_many(self, quizzes):
+        """Split quizzes into a dict of locally cached answer keys and the list of misses."""
+
+        answer_keys, missing = {}, []
+        for quiz in quizzes:
+            answer_key = self._get_local((quiz.id, quiz.version))
+            if answer_key is None:
+                missing.append(quiz)
+            else:
+                answer_keys[quiz.id] = answer_key
+        return answer_keys, missing
+
+    def _put_many(self, quizzes, loaded):
+        for quiz in quizzes:
+            self.put(quiz.id, quiz.version, loaded[quiz.id])
+
+    def get_many(self, quizzes):
+        """
+            Map the id of each of quizzes (objects with id and version) to its
+            answer key, like get(), loading all the misses in one query.
+        """
+
+        answer_keys, missing = self._local_many(quizzes)
+        if not missing:
+            return answer_keys
+        shared = self._shared()
+        keys = {quiz.id: _shared_key(quiz.id, quiz.version) for quiz in missing}
+        found = shared.get_many(keys.values()) if shared is not None else {}
+        loaded = {quiz_id: found[key] for quiz_id, key in keys.items() if key in found}
+        unloaded = [quiz.id for quiz in missing if quiz.id not in loaded]
+        with self._lock:
+            self.shared_hits += len(loaded)
+        if unloaded:
+            fresh = load_answer_keys(unloaded)
+            if shared is not None:
+                shared.set_many({keys[quiz_id]: answer_key for quiz_id, answer_key in fresh.items()})
+            loaded.update(fresh)
+        self._put_many(missing, loaded)
+        answer_keys.update(loaded)
+        return answer_keys
+
+    async def aget_many(self, quizzes):
+        """See get_many()."""
+
+        answer_keys, missing = self._local_many(quizzes)
+        if not missing:
+            return answer_keys
+        shared = self._shared()
+        keys = {quiz.id: _shared_key(quiz.id, quiz.version) for quiz in missing}
+        found = await shared.aget_many(keys.values()) if shared is not None else {}
+        loaded = {quiz_id: found[key] for quiz_id, key in keys.items() if key in found}
+        unloaded = [quiz.id for quiz in missing if quiz.id not in loaded]
+        with self._lock:
+            self.shared_hits += len(loaded)
+        if unloaded:
+            fresh = await aload_answer_keys(unloaded)
+            if shared is not None:
+                await shared.aset_many({keys[quiz_id]: answer_key for quiz_id, answer_key in fresh.items()})
+            loaded.update(fresh)
+        self._put_many(missing, loaded)
+        answer_keys.update(loaded)
+        return answer_keys
+
+    def put(self, quiz_id, version, answer_key):
+        with self._lock:
+            self._entries[(quiz_id, version)] = answer_key
+            self._entries.move_to_end((quiz_id, version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared_hits': self.shared_hits,
+                'evictions': self.evictions,
+            }
+
+
+_config = getattr(settings, 'ANSWER_KEY_CACHE', {})
+answer_key_cache = AnswerKeyCache(
+    max_entries=_config.get('MAX_ENTRIES', 1024),
+    backend=_config.get('BACKEND'),
+)
@@ -0,0 +1,127 @@
+"""
+Per-student question draws for pooled quizzes (Quiz.draw_count).
+
+A pooled quiz delivers each student draw_count questions sampled from its
+active questions. The pool is the id list of the quiz's cached answer key,
+so a draw costs no question query and no ORDER BY RANDOM() scan over the
+pool: random.sample picks draw_count of its ids, and the answer keys of all
+the quizzes drawn in one request load in one query. The first delivery records
+the draw as a QuestionDraw; later deliveries and the grading of the
+student's attempt use the recorded ids, so the set never changes under the
+student. Questions deactivated after the draw are dropped from it rather
+than replaced.
+"""
+
+import random
+from array import array
+
+from .cache import answer_key_cache
+from .models import QuestionDraw
+
+_random = random.SystemRandom()
+
+
+def pack_ids(question_ids):
+    return array('q', question_ids).tobytes()
+
+
+def unpack_ids(data):
+    question_ids = array('q')
+    question_ids.frombytes(bytes(data))
+    return question_ids.tolist()
+
+
+def sample_questions(answer_key, draw_count):
+    """Draw draw_count question ids from an answer key's questions, in id order."""
+
+    pool = tuple(answer_key)
+    if draw_count >= len(pool):
+        return list(pool)
+    return sorted(_random.sample(pool, draw_count))
+
+
+def _pooled(quizzes):
+    return {quiz.id: quiz for quiz in quizzes if quiz.draw_count}
+
+
+def _existing_draws(user_id, quiz_ids):
+    return QuestionDraw.objects.filter(user_id=user_id, quiz_id__in=quiz_ids).values_list('quiz_id', 'question_ids')
+
+
+def _new_draw(user_id, quiz, answer_key):
+    return QuestionDraw(
+        user_id=user_id, quiz_id=quiz.id, quiz_version=quiz.version,
+        question_ids=pack_ids(sample_questions(answer_key, quiz.draw_count)),
+    )
+
+
+def drawn_questions(user_id, quizzes):
+    """
+        Map the id of each pooled quiz among quizzes to the question ids drawn
+        for the user, drawing and recording the missing draws.
+    """
+
+    pooled = _pooled(quizzes)
+    if not pooled:
+        return {}
+    draws = {quiz_id: unpack_ids(ids) for quiz_id, ids in _existing_draws(user_id, list(pooled))}
+    missing = [quiz for quiz_id, quiz in pooled.items() if quiz_id not in draws]
+    if missing:
+        answer_keys = answer_key_cache.get_many(missing)
+        QuestionDraw.objects.bulk_create([
+            _new_draw(user_id, quiz, answer_keys[quiz.id]) for quiz in missing
+        ], ignore_conflicts=True)
+        # Re-read, as a concurrent request may have recorded a different draw first
+        draws.update((quiz_id, unpack_ids(ids)) for quiz_id, ids in _existing_draws(user_id, [quiz.id for quiz in missing]))
+    return draws
+
+
+async def adrawn_questions(user_id, quizzes):
+    """See drawn_questions()."""
+
+    pooled = _pooled(quizzes)
+    if not pooled:
+        return {}
+    draws = {quiz_id: unpack_ids(ids) async for quiz_id, ids in _existing_draws(user_id, list(pooled))}
+    missing = [quiz for quiz_id, quiz in pooled.items() if quiz_id not in draws]
+    if missing:
+        answer_keys = await answer_key_cache.aget_many(missing)
+        await QuestionDraw.objects.abulk_create([
+            _new_draw(user_id, quiz, answer_keys[quiz.id]) for quiz in missing
+        ], ignore_conflicts=True)
+        draws.update([(quiz_id, unpack_ids(ids)) async for quiz_id, ids in _existing_draws(user_id, [quiz.id for quiz in missing])])
+    return draws
+
+
+def batch_draws(pairs, quizzes):
+    """
+        Like drawn_questions() for several users at once: map each (user id,
+        quiz id) pair whose quiz is pooled to its drawn question ids.
+        quizzes maps quiz id -> Quiz.
+    """
+
+    pooled = {pair for pair in pairs if pair[1] in quizzes and quizzes[pair[1]].draw_count}
+    if not pooled:
+        return {}
+
+    def existing(pairs):
+        rows = QuestionDraw.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs}, quiz_id__in={quiz_id for _, quiz_id in pairs},
+        ).values_list('user_id', 'quiz_id', 'question_ids')
+        return {(user_id, quiz_id): unpack_ids(ids) for user_id, quiz_id, ids in rows if (user_id, quiz_id) in pairs}
+
+    draws = existing(pooled)
+    missing = pooled - draws.keys()
+    if missing:
+        answer_keys = answer_key_cache.get_many([quizzes[quiz_id] for quiz_id in {quiz_id for _, quiz_id in missing}])
+        QuestionDraw.objects.bulk_create([
+            _new_draw(user_id, quizzes[quiz_id], answer_keys[quiz_id]) for user_id, quiz_id in missing
+        ], ignore_conflicts=True)
+        draws.update(existing(missing))
+    return draws
+
+
+def question_set(quiz, draws):
+    """The ids a student may answer for quiz, None when every question counts."""
+
+    return set(draws[quiz.id]) if quiz.id in draws else None
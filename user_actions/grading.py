@@ -0,0 +1,197 @@
+"""
+Queued grading. submit_quiz stores a Submission and returns immediately;
+grade_submissions workers claim pending submissions in batches, score them
+against the cached answer keys and record the attempts with bulk_create.
+"""
+
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.utils import timezone
+from admin_actions.models import Quiz, QuizAttempt
+from admin_actions.analysis import ensure_layout
+from admin_actions.stats import record_scores
+from admin_actions.feed import submission_feed
+from .cache import answer_key_cache
+from .draws import batch_draws
+from .models import Submission
+from .scoring import grade_answers, total_marks
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'GRADING_QUEUE', {})
+BATCH_SIZE = _config.get('BATCH_SIZE', 200)
+POLL_INTERVAL = _config.get('POLL_INTERVAL', 1.0)
+RECLAIM_AFTER = _config.get('RECLAIM_AFTER', 300)
+
+
+def reclaim_stale(reclaim_after=RECLAIM_AFTER):
+    """Put back submissions claimed by a worker that died before grading them."""
+
+    cutoff = timezone.now() - timezone.timedelta(seconds=reclaim_after)
+    return Submission.objects.filter(status=Submission.PROCESSING, claimed_at__lt=cutoff).update(status=Submission.PENDING, worker='')
+
+
+def claim_batch(worker, batch_size=BATCH_SIZE):
+    """
+        Claim up to batch_size pending submissions for worker, oldest first.
+        Uses SELECT ... FOR UPDATE SKIP LOCKED where the backend supports it,
+        so concurrent workers claim disjoint batches. Elsewhere (SQLite) the
+        claim is a single UPDATE, which the database write lock serializes.
+    """
+
+    pending = Submission.objects.filter(status=Submission.PENDING).order_by('id')
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(pending.select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return []
+            Submission.objects.filter(id__in=ids).update(status=Submission.PROCESSING, worker=worker, claimed_at=now)
+    else:
+        claimed = Submission.objects.filter(id__in=pending.values('id')[:batch_size], status=Submission.PENDING).update(
+            status=Submission.PROCESSING, worker=worker, claimed_at=now,
+        )
+        if not claimed:
+            return []
+    return list(Submission.objects.filter(status=Submission.PROCESSING, worker=worker, claimed_at=now))
+
+
+def insert_attempts(attempts):
+    """
+        Insert attempts, skipping those whose user already has an attempt at
+        the quiz. Returns the inserted ones. Conflicts are rare, so the batch
+        is inserted in one go and only retried row by row when one occurs.
+    """
+
+    try:
+        with transaction.atomic():
+            QuizAttempt.objects.bulk_create(attempts, batch_size=BATCH_SIZE)
+        return attempts
+    except IntegrityError:
+        pass
+    inserted = []
+    for attempt in attempts:
+        # Ids set by a batch that was rolled back may be taken by now
+        attempt.pk = None
+        try:
+            with transaction.atomic():
+                attempt.save(force_insert=True)
+        except IntegrityError:
+            continue
+        inserted.append(attempt)
+    return inserted
+
+
+def grade_entries(entries):
+    """
+        Score entries (objects with user_id, quiz_id and answers, such as
+        Submissions) against the cached answer keys and set their score,
+        None when the quiz is gone or the user already attempted it.
+        Returns a function recording the attempts; call it inside the
+        transaction that saves the entries, with the (user_id, quiz_id) of
+        the entries to leave out, if any. It sets the score of the entries
+        whose attempt was not recorded back to None.
+    """
+
+    quizzes = Quiz.objects.only('id', 'version', 'draw_count').in_bulk({e.quiz_id for e in entries})
+    attempted = set(QuizAttempt.objects.filter(
+        user_id__in={e.user_id for e in entries}, quiz_id__in=quizzes,
+    ).values_list('user_id', 'quiz_id'))
+    draws = batch_draws({(e.user_id, e.quiz_id) for e in entries} - attempted, quizzes)
+    attempts = []
+    answer_keys = {}
+    totals = {}
+    for entry in entries:
+        if entry.quiz_id not in quizzes or (entry.user_id, entry.quiz_id) in attempted:
+            entry.score = None
+            continue
+        version = quizzes[entry.quiz_id].version
+        answer_key = answer_key_cache.get(entry.quiz_id, version)
+        drawn = draws.get((entry.user_id, entry.quiz_id))
+        questions = set(drawn) if drawn is not None else None
+        entry.score, responses = grade_answers(answer_key, entry.answers, questions)
+        answer_keys[entry.quiz_id] = answer_key
+        totals[(entry.user_id, entry.quiz_id)] = total_marks(answer_key, questions)
+        attempts.append(QuizAttempt(
+            user_id=entry.user_id, quiz_id=entry.quiz_id, score=entry.score,
+            quiz_version=version, responses=responses,
+        ))
+
+    def record(dropped=frozenset()):
+        # Covers an attempt recorded through the other endpoints in the meantime
+        inserted = insert_attempts([attempt for attempt in attempts if (attempt.user_id, attempt.quiz_id) not in dropped])
+        recorded = {(attempt.user_id, attempt.quiz_id) for attempt in inserted}
+        for entry in entries:
+            if entry.score is not None and (entry.user_id, entry.quiz_id) not in recorded:
+                entry.score = None
+        results = defaultdict(list)
+        for attempt in inserted:
+            results[attempt.quiz_id].append((attempt.score, totals[(attempt.user_id, attempt.quiz_id)]))
+        for quiz_id, quiz_results in results.items():
+            record_scores(quiz_id, quiz_results)
+            ensure_layout(quiz_id, quizzes[quiz_id].version, answer_keys[quiz_id])
+            transaction.on_commit(lambda quiz_id=quiz_id: submission_feed.notify(quiz_id))
+
+    return record
+
+
+def grade_batch(submissions):
+    """
+        Score submissions claimed by one worker and record their attempts in
+        one transaction. Submissions whose claim was lost, i.e. reclaimed
+        from a worker that was slow rather than dead, are left to their new
+        worker. Returns the number graded.
+    """
+
+    if not submissions:
+        return 0
+    record = grade_entries(submissions)
+    now = timezone.now()
+    claim = {'status': Submission.PROCESSING, 'worker': submissions[0].worker, 'claimed_at': submissions[0].claimed_at}
+    with transaction.atomic():
+        owned = set(Submission.objects.select_for_update().filter(
+            id__in=[submission.id for submission in submissions], **claim,
+        ).values_list('id', flat=True))
+        record({(submission.user_id, submission.quiz_id) for submission in submissions if submission.id not in owned})
+        outcomes = defaultdict(list)
+        for submission in submissions:
+            if submission.id not in owned:
+                continue
+            if submission.score is None:
+                outcome = (Submission.REJECTED, None, 'You have already attempted this quiz')
+            else:
+                outcome = (Submission.GRADED, submission.score, 'Quiz attempted successfully')
+            outcomes[outcome].append(submission.id)
+        # Conditional on the claim, so a write never lands on rows another worker took over
+        for (status, score, message), ids in outcomes.items():
+            Submission.objects.filter(id__in=ids, **claim).update(status=status, score=score, message=message, graded_at=now)
+    return len(owned)
+
+
+def run_worker(worker, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL, once=False, stop=None):
+    """
+        Drain the queue until it is empty (once=True) or stop is set.
+        Returns the number of submissions processed.
+    """
+
+    processed = 0
+    reclaim_stale()
+    while stop is None or not stop.is_set():
+        try:
+            batch = claim_batch(worker, batch_size)
+            processed += grade_batch(batch)
+        except OperationalError:
+            # e.g. "database is locked"; anything claimed is picked up again by reclaim_stale()
+            logger.exception('Grading worker %s failed to process a batch', worker)
+            time.sleep(poll_interval)
+            continue
+        if not batch:
+            if once:
+                break
+            reclaim_stale()
+            time.sleep(poll_interval)
+    return processed
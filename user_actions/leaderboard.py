@@ -0,0 +1,293 @@
+"""
+In-process leaderboards backed by indexable skip lists.
+
+Each board keeps its entries sorted by (-score, user id) in a skip list whose
+links carry their width, so inserts, removals and rank/percentile lookups
+are O(log n) and top-N reads walk the first N nodes. Boards are built from
+QuizAttempt once and then caught up incrementally, at most once per
+REFRESH_INTERVAL, which keeps every worker process in sync with attempts
+recorded by the others. Attempts scored in this process mark their boards
+stale on commit, so they show up on the very next read.
+
+Attempts can commit out of id order on server databases, so a catch-up does
+not start at the last id seen but at the last attempt recorded (attempted_at)
+more than SETTLE_SECONDS ago, and skips the ids it already applied. An
+attempt whose transaction takes longer than that to commit can be missed
+until the board is rebuilt.
+
+The global board of total scores is not built by reading every attempt:
+its settled part is loaded from one per-user SUM() aggregate, and only the
+attempts of the last SETTLE_SECONDS are then caught up one by one.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Max, Sum
+from django.utils import timezone
+from admin_actions.models import QuizAttempt
+
+_config = getattr(settings, 'LEADERBOARD', {})
+MAX_QUIZ_BOARDS = _config.get('MAX_QUIZ_BOARDS', 256)
+REFRESH_INTERVAL = _config.get('REFRESH_INTERVAL', 1.0)
+SETTLE_SECONDS = _config.get('SETTLE_SECONDS', 10.0)
+
+
+class _Node:
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        # Number of positions from this node to next[level]
+        self.width = [1] * levels
+
+
+class RankedList:
+    """A sorted list of distinct values with O(log n) expected insert, remove and bisect_left."""
+
+    MAX_LEVELS = 32
+
+    def __init__(self, values=()):
+        """Build from sorted distinct values in O(n)."""
+
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._tail = _Node(None, 0)
+        self._head.next = [self._tail] * self.MAX_LEVELS
+        self._levels = 1  # levels in use; above them the head links straight to the tail
+        self._size = 0
+        last = [self._head] * self.MAX_LEVELS
+        last_positions = [0] * self.MAX_LEVELS
+        for position, value in enumerate(values, 1):
+            node = _Node(value, self._random_levels())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_positions[level]
+                last[level] = node
+                last_positions[level] = position
+            self._levels = max(self._levels, len(node.next))
+            self._size = position
+        for level in range(self._levels):
+            last[level].next[level] = self._tail
+            last[level].width[level] = self._size + 1 - last_positions[level]
+
+    def _random_levels(self):
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not self._tail:
+            yield node.value
+            node = node.next[0]
+
+    def _path(self, value):
+        """The last node before value on each level in use, and its position (head is 0)."""
+
+        chain = [self._head] * self.MAX_LEVELS
+        positions = [0] * self.MAX_LEVELS
+        node, position = self._head, 0
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not self._tail and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def bisect_left(self, value):
+        """Number of values less than value."""
+
+        node, position = self._head, 0
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not self._tail and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def insert(self, value):
+        chain, positions = self._path(value)
+        levels = self._random_levels()
+        for level in range(self._levels, levels):
+            self._head.width[level] = self._size + 1
+        self._levels = max(self._levels, levels)
+        node = _Node(value, levels)
+        before = positions[0]
+        for level in range(levels):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - (before - positions[level])
+            previous.width[level] = before - positions[level] + 1
+        for level in range(levels, self._levels):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, value):
+        chain, _ = self._path(value)
+        node = chain[0].next[0]
+        if node is self._tail or node.value != value:
+            raise ValueError(value)
+        for level in range(len(node.next)):
+            chain[level].next[level] = node.next[level]
+            chain[level].width[level] += node.width[level] - 1
+        for level in range(len(node.next), self._levels):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+
+class Leaderboard:
+    def __init__(self):
+        self._entries = RankedList()  # (-score, user_id), best first
+        self._by_user = {}
+        self.last_attempt_id = 0
+        self._settled_id = 0  # the last attempt recorded SETTLE_SECONDS before the last catch-up
+        self._applied = set()  # ids above _settled_id
+        self.refreshed_at = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def set(self, user_id, score):
+        previous = self._by_user.get(user_id)
+        if previous is not None:
+            self._entries.remove((-previous, user_id))
+        self._by_user[user_id] = score
+        self._entries.insert((-score, user_id))
+
+    def score_of(self, user_id):
+        return self._by_user.get(user_id)
+
+    def _better_than(self, score):
+        # (-score,) sorts before every (-score, user_id)
+        return self._entries.bisect_left((-score,))
+
+    def rank_of_score(self, score):
+        # Competition ranking: tied scores share the best rank
+        return self._better_than(score) + 1
+
+    def percentile_of_score(self, score):
+        """Share of participants scoring at or below score, in percent."""
+
+        return (len(self._entries) - self._better_than(score)) * 100 / len(self._entries)
+
+    def top(self, limit):
+        return [(user_id, -negative) for negative, user_id in islice(self._entries, limit)]
+
+    def load_totals(self, attempts, settle_seconds):
+        """
+            Fill an empty board with each user's total score over the attempts
+            up to the last one recorded more than settle_seconds ago, with one
+            aggregate query. catch_up(attempts, _total, ...) applies the rest.
+        """
+
+        cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+        settled_id = attempts.filter(attempted_at__lt=cutoff).aggregate(last=Max('id'))['last']
+        if settled_id is None:
+            return
+        totals = attempts.filter(id__lte=settled_id).values('user_id').annotate(total=Sum('score')).values_list('user_id', 'total')
+        self._by_user = dict(totals)
+        self._entries = RankedList(sorted((-score, user_id) for user_id, score in self._by_user.items()))
+        self._settled_id = settled_id
+        self.last_attempt_id = max(self.last_attempt_id, settled_id)
+
+    def catch_up(self, attempts, combine, settle_seconds):
+        """
+            Apply the attempts after the settled one that are not applied yet,
+            setting each user's score to combine(their current score or None,
+            the attempt's score).
+        """
+
+        cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+        building = not self._by_user
+        rows = attempts.filter(id__gt=self._settled_id).order_by('id').values_list('id', 'user_id', 'score', 'attempted_at')
+        for attempt_id, user_id, score, attempted_at in rows.iterator(chunk_size=5000):
+            if attempted_at < cutoff:
+                self._settled_id = attempt_id
+            if attempt_id in self._applied:
+                continue
+            if building:
+                self._by_user[user_id] = combine(self._by_user.get(user_id), score)
+            else:
+                self.set(user_id, combine(self._by_user.get(user_id), score))
+            self._applied.add(attempt_id)
+            self.last_attempt_id = max(self.last_attempt_id, attempt_id)
+        if building:
+            self._entries = RankedList(sorted((-score, user_id) for user_id, score in self._by_user.items()))
+        self._applied = {attempt_id for attempt_id in self._applied if attempt_id > self._settled_id}
+
+
+def _latest(previous, score):
+    return score
+
+
+def _total(previous, score):
+    return (previous or 0) + score
+
+
+class LeaderboardRegistry:
+    """Per-quiz boards (LRU-bounded) plus a global board of total scores."""
+
+    def __init__(self, max_quiz_boards=MAX_QUIZ_BOARDS, refresh_interval=REFRESH_INTERVAL, settle_seconds=SETTLE_SECONDS):
+        self.max_quiz_boards = max_quiz_boards
+        self.refresh_interval = refresh_interval
+        self.settle_seconds = settle_seconds
+        self._quiz_boards = OrderedDict()
+        self._global = Leaderboard()
+        self._lock = threading.Lock()
+
+    def _quiz_board(self, quiz_id):
+        with self._lock:
+            board = self._quiz_boards.get(quiz_id)
+            if board is None:
+                board = self._quiz_boards[quiz_id] = Leaderboard()
+                while len(self._quiz_boards) > self.max_quiz_boards:
+                    self._quiz_boards.popitem(last=False)
+            self._quiz_boards.move_to_end(quiz_id)
+            return board
+
+    def _refresh(self, board, attempts, combine, load=None):
+        with board.lock:
+            now = time.monotonic()
+            if now - board.refreshed_at < self.refresh_interval:
+                return board
+            if load is not None and not len(board):
+                load(attempts, self.settle_seconds)
+            board.catch_up(attempts, combine, self.settle_seconds)
+            board.refreshed_at = now
+        return board
+
+    def for_quiz(self, quiz_id):
+        return self._refresh(self._quiz_board(quiz_id), QuizAttempt.objects.filter(quiz_id=quiz_id), _latest)
+
+    def overall(self):
+        board = self._global
+        return self._refresh(board, QuizAttempt.objects.all(), _total, board.load_totals)
+
+    def mark_stale(self, quiz_id):
+        """Make the next read of the quiz and global boards catch up immediately."""
+
+        with self._lock:
+            board = self._quiz_boards.get(quiz_id)
+        if board is not None:
+            board.refreshed_at = 0.0
+        self._global.refreshed_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._quiz_boards.clear()
+            self._global = Leaderboard()
+
+
+leaderboards = LeaderboardRegistry()
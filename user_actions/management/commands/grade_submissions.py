@@ -0,0 +1,42 @@
+import os
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from user_actions.grading import BATCH_SIZE, POLL_INTERVAL, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Grade queued quiz submissions in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of grading threads')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        counts = []
+        prefix = f'{socket.gethostname()}-{os.getpid()}'
+
+        def work(index):
+            try:
+                counts.append(run_worker(
+                    f'{prefix}-{index}', options['batch_size'], options['poll_interval'], options['once'], stop,
+                ))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(index,), daemon=True) for index in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(f'Graded {sum(counts)} submissions')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from user_actions.sessions import POLL_INTERVAL, DeadlineSweeper
+
+
+class Command(BaseCommand):
+    help = 'Grade and close timed attempt sessions whose deadline has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help='Most seconds between sweeps')
+        parser.add_argument('--once', action='store_true', help='Sweep once and exit')
+
+    def handle(self, *args, **options):
+        try:
+            expired = DeadlineSweeper().run(options['poll_interval'], options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f'Expired {expired} sessions')
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 12:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('admin_actions', '0004_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('graded', 'graded'), ('rejected', 'rejected')], default='pending', max_length=20)),
+                ('score', models.IntegerField(blank=True, null=True)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('worker', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('graded_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='admin_actions.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='submission_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'quiz'), name='unique_submission_per_user')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_actions', '0009_quiz_time_limit'),
+        ('user_actions', '0002_question_draw'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttemptSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('open', 'open'), ('submitted', 'submitted'), ('expired', 'expired')], default='open', max_length=20)),
+                ('score', models.IntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('deadline', models.DateTimeField()),
+                ('saved_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='admin_actions.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='session_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'quiz'), name='unique_session_per_user')],
+            },
+        ),
+    ]
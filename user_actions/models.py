@@ -1,3 +1,92 @@
 from django.db import models
+from django.contrib.auth import get_user_model
+from admin_actions.models import Quiz
 
-# Create your models here.
+User = get_user_model()
+
+class Submission(models.Model):
+    """
+        A quiz submission waiting to be graded by the grade_submissions workers.
+        Holds the raw answers until a worker scores them and records the QuizAttempt.
+    """
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    GRADED = 'graded'
+    REJECTED = 'rejected'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    answers = models.JSONField()
+    status = models.CharField(max_length=20, default=PENDING, choices=[(PENDING, 'pending'), (PROCESSING, 'processing'), (GRADED, 'graded'), (REJECTED, 'rejected')])
+    score = models.IntegerField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    worker = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    graded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'quiz'], name='unique_submission_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='submission_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.quiz_id} ({self.status})"
+
+class QuestionDraw(models.Model):
+    """
+        The questions drawn for a student from a pooled quiz (Quiz.draw_count).
+        question_ids is an array('q') of question ids in id order; see
+        user_actions.draws.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    quiz_version = models.PositiveIntegerField()
+    question_ids = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'quiz'], name='unique_draw_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.quiz_id}"
+
+class AttemptSession(models.Model):
+    """
+        A timed attempt started with start_attempt. answers holds the
+        autosaved answers in the attempt_quiz format; they are graded when the
+        student finishes before the deadline, or by the session sweeper once it
+        has passed (see user_actions.sessions).
+    """
+
+    OPEN = 'open'
+    SUBMITTED = 'submitted'
+    EXPIRED = 'expired'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
+    answers = models.JSONField(default=list)
+    status = models.CharField(max_length=20, default=OPEN, choices=[(OPEN, 'open'), (SUBMITTED, 'submitted'), (EXPIRED, 'expired')])
+    score = models.IntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    deadline = models.DateTimeField()
+    saved_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'quiz'], name='unique_session_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='session_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.quiz_id} ({self.status})"
@@ -0,0 +1,142 @@
+from admin_actions.models import Question
+
+OPTION_FIELDS = ('option1', 'option2', 'option3', 'option4')
+
+# Codes used in packed responses besides the option numbers 1-4
+NOT_ANSWERED = 0
+NOT_DRAWN = 254
+OTHER_OPTION = 255
+
+
+def load_answer_key(quiz_id):
+    """
+        Load the answer key of a quiz in a single query.
+
+        Returns a dict mapping question id -> (correct option, marks, answer,
+        options) for every active question of the quiz, in question id order.
+        The correct option is the text of the chosen option, the same value
+        returned by Question.get_answer(); answer is its number (1-4) and
+        options the texts of all four options.
+    """
+
+    return _build_answer_key(_answer_key_rows(quiz_id))
+
+
+async def aload_answer_key(quiz_id):
+    """See load_answer_key()."""
+
+    return _build_answer_key([row async for row in _answer_key_rows(quiz_id)])
+
+
+def load_answer_keys(quiz_ids):
+    """Like load_answer_key() for several quizzes in a single query: map quiz id -> answer key."""
+
+    return _build_answer_keys(quiz_ids, _answer_keys_rows(quiz_ids))
+
+
+async def aload_answer_keys(quiz_ids):
+    """See load_answer_keys()."""
+
+    return _build_answer_keys(quiz_ids, [row async for row in _answer_keys_rows(quiz_ids)])
+
+
+def _answer_key_rows(quiz_id):
+    return Question.objects.filter(quiz_id=quiz_id, is_active=True).order_by('id').values_list('id', 'answer', 'marks', *OPTION_FIELDS)
+
+
+def _answer_keys_rows(quiz_ids):
+    return Question.objects.filter(quiz_id__in=quiz_ids, is_active=True).order_by('quiz_id', 'id').values_list(
+        'quiz_id', 'id', 'answer', 'marks', *OPTION_FIELDS,
+    )
+
+
+def _build_answer_key(rows):
+    return {row[0]: (row[2 + row[1]], row[2], row[1], row[3:]) for row in rows}
+
+
+def _build_answer_keys(quiz_ids, rows):
+    grouped = {quiz_id: [] for quiz_id in quiz_ids}
+    for row in rows:
+        grouped[row[0]].append(row[1:])
+    return {quiz_id: _build_answer_key(quiz_rows) for quiz_id, quiz_rows in grouped.items()}
+
+
+def _question_id(answer):
+    if not isinstance(answer, dict):
+        return None
+    try:
+        return int(answer.get('question'))
+    except (TypeError, ValueError):
+        return None
+
+
+def score_answers(answer_key, answers, questions=None):
+    """
+        Score a list of submitted answers against an answer key in one pass.
+
+        Each question is scored at most once (the first answer for it wins),
+        and answers for unknown or inactive questions are ignored, as are
+        answers for questions outside `questions` (a set of ids) when given.
+    """
+
+    score = 0
+    seen = set()
+    for answer in answers:
+        question_id = _question_id(answer)
+        if question_id is None or question_id in seen or (questions is not None and question_id not in questions):
+            continue
+        seen.add(question_id)
+        key = answer_key.get(question_id)
+        if key is not None and answer.get('selected_option') == key[0]:
+            score += key[1]
+    return score
+
+
+def grade_answers(answer_key, answers, questions=None):
+    """
+        Score answers like score_answers() and also pack the selected options.
+
+        Returns (score, responses) where responses has one byte per question of
+        the answer key, in its order: NOT_ANSWERED, the number of the chosen
+        option (1-4), OTHER_OPTION if the answer matches none of the options,
+        or NOT_DRAWN for questions outside `questions`.
+    """
+
+    positions = {question_id: index for index, question_id in enumerate(answer_key)}
+    if questions is None:
+        responses = bytearray(len(positions))
+    else:
+        responses = bytearray([NOT_DRAWN]) * len(positions)
+        for question_id in questions:
+            if question_id in positions:
+                responses[positions[question_id]] = NOT_ANSWERED
+    score = 0
+    seen = set()
+    for answer in answers:
+        question_id = _question_id(answer)
+        if question_id is None or question_id in seen or (questions is not None and question_id not in questions):
+            continue
+        seen.add(question_id)
+        key = answer_key.get(question_id)
+        if key is None:
+            continue
+        selected = answer.get('selected_option')
+        if selected == key[0]:
+            score += key[1]
+            responses[positions[question_id]] = key[2]
+        elif selected in key[3]:
+            responses[positions[question_id]] = key[3].index(selected) + 1
+        else:
+            responses[positions[question_id]] = OTHER_OPTION
+    return score, bytes(responses)
+
+
+def total_marks(answer_key, questions=None):
+    """
+        Total marks of the quiz, or of the questions among `questions` (the
+        ids drawn for a student from a pooled quiz) that are still in it.
+    """
+
+    if questions is None:
+        return sum(key[1] for key in answer_key.values())
+    return sum(answer_key[question_id][1] for question_id in questions if question_id in answer_key)
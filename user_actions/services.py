@@ -0,0 +1,615 @@
+"""
+Business logic of the student-facing endpoints, shared by the sync DRF views
+in views.py and the ASGI-native views in async_views.py.
+
+Each operation has a sync and an `a`-prefixed async variant that differ only
+in how they talk to the database. Both return the response payload.
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from admin_actions.models import Quiz, Question, QuizAttempt, QuizDocument
+from admin_actions.documents import document_fields, ensure_published, splice
+from admin_actions.serializers import QUIZ_ROWS, QUIZ_LIST_ROWS, QUESTION_ROWS, ATTEMPT_ROWS
+from admin_actions.analysis import ensure_layout
+from admin_actions.stats import record_scores
+from admin_actions.feed import submission_feed
+from admin_actions.pagination import keyset_page, akeyset_page, stream_json_array, astream_json_array
+from .cache import answer_key_cache
+from .draws import drawn_questions, adrawn_questions, question_set
+from .leaderboard import leaderboards
+from .models import AttemptSession, Submission
+from .scoring import grade_answers, total_marks
+from .sessions import DEFAULT_TIME_LIMIT, autosave, deadlines, is_late, merge_answers
+
+NOT_AUTHORIZED = {'status':False, 'message': 'You are not authorized to perform this action'}
+INVALID_QUERY = {'status':False, 'message': 'Invalid query parameters'}
+INVALID_BODY = {'status':False, 'message': 'Request body must be a JSON object'}
+QUIZ_ID_REQUIRED = {'status':False, 'message': 'Quiz ID is required'}
+QUIZ_NOT_FOUND = {'status':False, 'message': 'Quiz not found'}
+ALREADY_ATTEMPTED = {'status':False, 'message': 'You have already attempted this quiz'}
+ANSWERS_NOT_LIST = {'status':False, 'message': 'Answers must be a list'}
+SUBMISSION_ID_REQUIRED = {'status':False, 'message': 'Submission ID is required'}
+SUBMISSION_NOT_FOUND = {'status':False, 'message': 'Submission not found'}
+TIMED_QUIZ = {'status':False, 'message': 'This quiz is timed, start it with start_attempt'}
+SESSION_ID_REQUIRED = {'status':False, 'message': 'Session ID is required'}
+SESSION_NOT_FOUND = {'status':False, 'message': 'Attempt session not found'}
+SESSION_CLOSED = {'status':False, 'message': 'This attempt is already finished'}
+TIME_IS_UP = {'status':False, 'message': 'Time is up, your saved answers will be graded'}
+ANSWERS_NOT_SAVED = {'status':False, 'message': 'Answers could not be saved, please try again'}
+
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+
+# Longest a get_submission call may wait for grading, in seconds. The sync
+# view holds a server thread while it waits, so it gets a much shorter cap.
+MAX_SUBMISSION_WAIT = getattr(settings, 'GRADING_QUEUE', {}).get('MAX_WAIT', 30)
+MAX_SYNC_SUBMISSION_WAIT = getattr(settings, 'GRADING_QUEUE', {}).get('MAX_SYNC_WAIT', 2)
+SUBMISSION_POLL_INTERVAL = 0.25
+
+
+def is_student(user):
+    return getattr(user, 'role', None) == 'user'
+
+
+# Catalogue
+def catalogue_queryset(request):
+    """
+        Active quizzes filtered by the get_all_quiz query params.
+        Raises ValueError on a malformed category_id.
+    """
+
+    quizzes = Quiz.objects.filter(is_active=True)
+    if request.GET.get('category_id'):
+        quizzes = quizzes.filter(category_id=int(request.GET.get('category_id')))
+    return quizzes
+
+
+def _page_queryset(request):
+    quizzes = catalogue_queryset(request)
+    if request.GET.get('mode') == 'list':
+        quizzes = quizzes.annotate(question_count=Count('question', filter=Q(question__is_active=True)))
+    return quizzes
+
+
+def catalogue_questions(quizzes):
+    """
+        Active questions of the quizzes that are not pools. A pool's questions
+        are drawn when the student opens the quiz (get_quiz_questions,
+        get_quiz_document, start_attempt or attempt_quiz), so listing the
+        catalogue never writes.
+    """
+
+    return Question.objects.filter(is_active=True, quiz__in=quizzes)
+
+
+def _pooled_counts(quizzes):
+    # mode=list counts the questions a student gets, not the size of the pool
+    for quiz in quizzes:
+        if quiz.draw_count:
+            quiz.question_count = min(quiz.question_count, quiz.draw_count)
+    return quizzes
+
+
+def catalogue_payload(request, quizzes, next_cursor, questions=None):
+    """questions are QUESTION_ROWS dicts."""
+
+    if request.GET.get('mode') == 'list':
+        return {"quiz": QUIZ_LIST_ROWS.from_objects(_pooled_counts(quizzes)), "next_cursor": next_cursor}
+    return {
+        "quiz": QUIZ_ROWS.from_objects(quizzes),
+        "questions": questions,
+        "next_cursor": next_cursor,
+    }
+
+
+def stream_catalogue(quizzes):
+    """Yield the whole catalogue as chunked JSON, in the get_all_quiz shape without next_cursor."""
+
+    questions = catalogue_questions(quizzes.filter(draw_count__isnull=True)).order_by('quiz_id', 'id')
+    yield '{"quiz":'
+    yield from stream_json_array(quizzes.order_by('id'), QUIZ_ROWS)
+    yield ',"questions":'
+    yield from stream_json_array(questions, QUESTION_ROWS)
+    yield '}'
+
+
+async def astream_catalogue(quizzes):
+    """See stream_catalogue()."""
+
+    questions = catalogue_questions(quizzes.filter(draw_count__isnull=True)).order_by('quiz_id', 'id')
+    yield '{"quiz":'
+    async for chunk in astream_json_array(quizzes.order_by('id'), QUIZ_ROWS):
+        yield chunk
+    yield ',"questions":'
+    async for chunk in astream_json_array(questions, QUESTION_ROWS):
+        yield chunk
+    yield '}'
+
+
+def get_catalogue(request):
+    try:
+        quizzes, next_cursor = keyset_page(_page_queryset(request), request)
+    except ValueError:
+        return INVALID_QUERY
+    questions = None
+    if request.GET.get('mode') != 'list':
+        questions = QUESTION_ROWS.data(catalogue_questions([quiz.id for quiz in quizzes if not quiz.draw_count]))
+    return catalogue_payload(request, quizzes, next_cursor, questions)
+
+
+async def aget_catalogue(request):
+    """See get_catalogue()."""
+
+    try:
+        quizzes, next_cursor = await akeyset_page(_page_queryset(request), request)
+    except ValueError:
+        return INVALID_QUERY
+    questions = None
+    if request.GET.get('mode') != 'list':
+        questions = QUESTION_ROWS.to_dicts([row async for row in QUESTION_ROWS.values(catalogue_questions([quiz.id for quiz in quizzes if not quiz.draw_count]))])
+    return catalogue_payload(request, quizzes, next_cursor, questions)
+
+
+# Compiled quiz documents
+def document_meta(params):
+    """
+        Return ((quiz_id, etag, version, draw_count), error payload) for the
+        document of an active quiz, publishing the quiz on its first read.
+    """
+
+    try:
+        quiz_id = int(params.get('quiz_id') or '')
+    except ValueError:
+        return None, QUIZ_ID_REQUIRED
+    row = QuizDocument.objects.filter(quiz_id=quiz_id, quiz__is_active=True).values_list('etag', 'quiz__version', 'quiz__draw_count').first()
+    if row is None:
+        quiz = Quiz.objects.filter(id=quiz_id, is_active=True).first()
+        if quiz is None:
+            return None, QUIZ_NOT_FOUND
+        row = (ensure_published(quiz), quiz.version, quiz.draw_count)
+    return (quiz_id, *row), None
+
+
+def document_body(user, meta, gzip_ok):
+    """
+        Return (content, gzipped) for the document described by meta, None if
+        it was recompiled since. Pooled quizzes get the questions drawn for
+        the user spliced out of the document, uncompressed.
+    """
+
+    quiz_id, etag, version, draw_count = meta
+    if draw_count:
+        fields = document_fields(quiz_id, etag, ('content', 'question_ids', 'offsets'))
+        if fields is None:
+            return None
+        draws = drawn_questions(user.id, [Quiz(id=quiz_id, version=version, draw_count=draw_count)])
+        return splice(*fields, set(draws[quiz_id])), False
+    fields = document_fields(quiz_id, etag, ('compressed',) if gzip_ok else ('content',))
+    return (fields[0], gzip_ok) if fields is not None else None
+
+
+# Attempts
+def parse_attempt(data):
+    """Return (quiz_id, error payload)."""
+
+    if not isinstance(data, dict):
+        return None, INVALID_BODY
+    if not data.get('quiz_id'):
+        return None, QUIZ_ID_REQUIRED
+    return data.get('quiz_id'), None
+
+
+def scored_payload(score):
+    return {'status':True, 'message': 'Quiz attempted successfully', 'score': score}
+
+
+def record_attempt(user, quiz, answer_key, score, responses, questions=None):
+    """
+        Insert the attempt with its packed responses, update the quiz stats
+        (questions is the student's draw from a pooled quiz, see question_set()),
+        mark the quiz leaderboard stale and wake its submission feed.
+        Returns False if the user already attempted the quiz.
+    """
+
+    try:
+        with transaction.atomic():
+            QuizAttempt.objects.create(user=user, quiz=quiz, score=score, quiz_version=quiz.version, responses=responses)
+            record_scores(quiz.id, [(score, total_marks(answer_key, questions))])
+            ensure_layout(quiz.id, quiz.version, answer_key)
+            transaction.on_commit(lambda: leaderboards.mark_stale(quiz.id))
+            transaction.on_commit(lambda: submission_feed.notify(quiz.id))
+    except IntegrityError:
+        return False
+    return True
+
+
+def attempt_quiz(user, data):
+    """Grade a submission and record the attempt."""
+
+    quiz_id, error = parse_attempt(data)
+    if error:
+        return error
+    quiz = Quiz.objects.filter(id=quiz_id).first()
+    if quiz is None:
+        return QUIZ_NOT_FOUND
+    if quiz.time_limit:
+        return TIMED_QUIZ
+    if QuizAttempt.objects.filter(user=user, quiz_id=quiz.id).exists():
+        return ALREADY_ATTEMPTED
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    answer_key = answer_key_cache.get(quiz.id, quiz.version)
+    # Pooled quizzes only score the questions drawn for the student
+    questions = question_set(quiz, drawn_questions(user.id, [quiz]))
+    score, responses = grade_answers(answer_key, answers, questions)
+    if not record_attempt(user, quiz, answer_key, score, responses, questions):
+        return ALREADY_ATTEMPTED
+    return scored_payload(score)
+
+
+async def aattempt_quiz(user, data):
+    """See attempt_quiz()."""
+
+    quiz_id, error = parse_attempt(data)
+    if error:
+        return error
+    quiz = await Quiz.objects.filter(id=quiz_id).afirst()
+    if quiz is None:
+        return QUIZ_NOT_FOUND
+    if quiz.time_limit:
+        return TIMED_QUIZ
+    if await QuizAttempt.objects.filter(user=user, quiz_id=quiz.id).aexists():
+        return ALREADY_ATTEMPTED
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    answer_key = await answer_key_cache.aget(quiz.id, quiz.version)
+    questions = question_set(quiz, await adrawn_questions(user.id, [quiz]))
+    score, responses = grade_answers(answer_key, answers, questions)
+    # Transactions are sync-only, so the write runs in the ORM's sync thread
+    if not await sync_to_async(record_attempt)(user, quiz, answer_key, score, responses, questions):
+        return ALREADY_ATTEMPTED
+    return scored_payload(score)
+
+
+def get_attempts(user):
+    return ATTEMPT_ROWS.data(QuizAttempt.objects.filter(user=user))
+
+
+async def aget_attempts(user):
+    """See get_attempts()."""
+
+    return ATTEMPT_ROWS.to_dicts([row async for row in ATTEMPT_ROWS.values(QuizAttempt.objects.filter(user=user))])
+
+
+# Timed attempt sessions
+def parse_session(data):
+    """Return (session_id, error payload)."""
+
+    if not isinstance(data, dict):
+        return None, INVALID_BODY
+    try:
+        return int(data.get('session_id') or ''), None
+    except (TypeError, ValueError):
+        return None, SESSION_ID_REQUIRED
+
+
+def session_payload(session, now):
+    return {
+        'status':True,
+        'session_id': session.id,
+        'quiz_id': session.quiz_id,
+        'state': session.status,
+        'started_at': session.started_at,
+        'deadline': session.deadline,
+        'remaining_seconds': max(int((session.deadline - now).total_seconds()), 0),
+        'answers': merge_answers(session.answers, autosave.peek(session.id)),
+    }
+
+
+def start_attempt(user, data):
+    """Open a timed attempt session, or return the open one of the user for the quiz."""
+
+    quiz_id, error = parse_attempt(data)
+    if error:
+        return error
+    quiz = Quiz.objects.filter(id=quiz_id).first()
+    if quiz is None:
+        return QUIZ_NOT_FOUND
+    if QuizAttempt.objects.filter(user=user, quiz_id=quiz.id).exists():
+        return ALREADY_ATTEMPTED
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            session = AttemptSession.objects.create(
+                user=user, quiz=quiz, deadline=now + timedelta(seconds=quiz.time_limit or DEFAULT_TIME_LIMIT),
+            )
+    except IntegrityError:
+        session = AttemptSession.objects.get(user=user, quiz=quiz)
+        if session.status != AttemptSession.OPEN:
+            return SESSION_CLOSED
+    drawn_questions(user.id, [quiz])
+    deadlines.put(session.id, user.id, session.deadline)
+    return session_payload(session, now)
+
+
+def _save_error(user, entry):
+    """The error payload for a save to the session of entry (user id, deadline), if any."""
+
+    if entry is None or entry[0] != user.id:
+        return SESSION_NOT_FOUND
+    if is_late(entry[1]):
+        return TIME_IS_UP
+    return None
+
+
+def _saved_payload(session_id, saved):
+    if saved is None:
+        return ANSWERS_NOT_SAVED
+    if not saved:
+        # Finished or expired since this process cached its deadline
+        deadlines.discard(session_id)
+        return SESSION_CLOSED
+    return {'status':True, 'message': 'Answers saved', 'saved_at': timezone.now()}
+
+
+def save_answers(user, data):
+    """
+        Autosave answers of an open session. Only the cached deadline is
+        checked; the answers are written with the other saves of the next
+        autosave buffer write, and acknowledged once written.
+    """
+
+    session_id, error = parse_session(data)
+    if error:
+        return error
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    entry = deadlines.get(session_id)
+    if entry is None:
+        entry = AttemptSession.objects.filter(id=session_id, status=AttemptSession.OPEN).values_list('user_id', 'deadline').first()
+        if entry is not None:
+            deadlines.put(session_id, *entry)
+    error = _save_error(user, entry)
+    if error:
+        return error
+    return _saved_payload(session_id, autosave.save(session_id, answers))
+
+
+async def asave_answers(user, data):
+    """See save_answers()."""
+
+    session_id, error = parse_session(data)
+    if error:
+        return error
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    entry = deadlines.get(session_id)
+    if entry is None:
+        entry = await AttemptSession.objects.filter(id=session_id, status=AttemptSession.OPEN).values_list('user_id', 'deadline').afirst()
+        if entry is not None:
+            deadlines.put(session_id, *entry)
+    error = _save_error(user, entry)
+    if error:
+        return error
+    return _saved_payload(session_id, await autosave.asave(session_id, answers))
+
+
+def finish_attempt(user, data):
+    """Grade the saved and final answers of a session that ends in time and record the attempt."""
+
+    session_id, error = parse_session(data)
+    if error:
+        return error
+    answers = data.get('answers', [])
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    session = AttemptSession.objects.select_related('quiz').filter(id=session_id, user=user).first()
+    if session is None:
+        return SESSION_NOT_FOUND
+    if session.status != AttemptSession.OPEN:
+        return SESSION_CLOSED
+    now = timezone.now()
+    if is_late(session.deadline, now):
+        return TIME_IS_UP
+    quiz = session.quiz
+    answer_key = answer_key_cache.get(quiz.id, quiz.version)
+    questions = question_set(quiz, drawn_questions(user.id, [quiz]))
+    with transaction.atomic():
+        # Autosave writes take the same lock, so none lands between this read and the update
+        saved = AttemptSession.objects.select_for_update().filter(
+            id=session.id, status=AttemptSession.OPEN,
+        ).values_list('answers', flat=True).first()
+        if saved is None:
+            return SESSION_CLOSED
+        with autosave.taken(session.id) as pending:
+            answers = merge_answers(merge_answers(saved, pending), answers)
+            score, responses = grade_answers(answer_key, answers, questions)
+            AttemptSession.objects.filter(id=session.id).update(
+                status=AttemptSession.SUBMITTED, answers=answers, score=score, saved_at=now, finished_at=now,
+            )
+            if not record_attempt(user, quiz, answer_key, score, responses, questions):
+                transaction.set_rollback(True)
+                return ALREADY_ATTEMPTED
+    deadlines.discard(session.id)
+    return scored_payload(score)
+
+
+# Queued grading
+def submitted_payload(submission_id, message='Submission received'):
+    return {'status':True, 'message': message, 'submission_id': submission_id}
+
+
+def submit_quiz(user, data):
+    """Validate a submission and queue it for the grading workers."""
+
+    quiz_id, error = parse_attempt(data)
+    if error:
+        return error
+    quiz = Quiz.objects.filter(id=quiz_id).first()
+    if quiz is None:
+        return QUIZ_NOT_FOUND
+    if quiz.time_limit:
+        return TIMED_QUIZ
+    if QuizAttempt.objects.filter(user=user, quiz_id=quiz.id).exists():
+        return ALREADY_ATTEMPTED
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    try:
+        with transaction.atomic():
+            submission = Submission.objects.create(user=user, quiz=quiz, answers=answers)
+    except IntegrityError:
+        existing = Submission.objects.get(user=user, quiz=quiz)
+        return submitted_payload(existing.id, 'Quiz already submitted')
+    return submitted_payload(submission.id)
+
+
+async def asubmit_quiz(user, data):
+    """See submit_quiz()."""
+
+    quiz_id, error = parse_attempt(data)
+    if error:
+        return error
+    quiz = await Quiz.objects.filter(id=quiz_id).afirst()
+    if quiz is None:
+        return QUIZ_NOT_FOUND
+    if quiz.time_limit:
+        return TIMED_QUIZ
+    if await QuizAttempt.objects.filter(user=user, quiz_id=quiz.id).aexists():
+        return ALREADY_ATTEMPTED
+    answers = data.get('answers')
+    if not isinstance(answers, list):
+        return ANSWERS_NOT_LIST
+    try:
+        submission = await Submission.objects.acreate(user=user, quiz=quiz, answers=answers)
+    except IntegrityError:
+        existing = await Submission.objects.aget(user=user, quiz=quiz)
+        return submitted_payload(existing.id, 'Quiz already submitted')
+    return submitted_payload(submission.id)
+
+
+def parse_submission_query(params, max_wait):
+    """Return (submission_id, seconds to wait, error payload)."""
+
+    try:
+        submission_id = int(params.get('submission_id', ''))
+    except ValueError:
+        return None, 0, SUBMISSION_ID_REQUIRED
+    try:
+        wait = min(max(float(params.get('wait', 0)), 0), max_wait)
+    except ValueError:
+        return None, 0, INVALID_QUERY
+    return submission_id, wait, None
+
+
+def submission_payload(submission):
+    payload = {'status': submission.status != Submission.REJECTED, 'submission_id': submission.id, 'state': submission.status}
+    if submission.status in (Submission.GRADED, Submission.REJECTED):
+        payload['message'] = submission.message
+    if submission.status == Submission.GRADED:
+        payload['score'] = submission.score
+    return payload
+
+
+def _is_final(submission):
+    return submission.status in (Submission.GRADED, Submission.REJECTED)
+
+
+def get_submission(user, params):
+    """
+        Return the state of a submission, waiting up to `wait` seconds (at
+        most MAX_SYNC_SUBMISSION_WAIT) for it to be graded.
+    """
+
+    submission_id, wait, error = parse_submission_query(params, MAX_SYNC_SUBMISSION_WAIT)
+    if error:
+        return error
+    deadline = time.monotonic() + wait
+    queryset = Submission.objects.filter(id=submission_id, user=user).only('id', 'status', 'score', 'message')
+    while True:
+        submission = queryset.first()
+        if submission is None:
+            return SUBMISSION_NOT_FOUND
+        if _is_final(submission) or time.monotonic() >= deadline:
+            return submission_payload(submission)
+        time.sleep(SUBMISSION_POLL_INTERVAL)
+
+
+async def aget_submission(user, params):
+    """See get_submission(). Waits up to MAX_SUBMISSION_WAIT seconds."""
+
+    submission_id, wait, error = parse_submission_query(params, MAX_SUBMISSION_WAIT)
+    if error:
+        return error
+    deadline = time.monotonic() + wait
+    queryset = Submission.objects.filter(id=submission_id, user=user).only('id', 'status', 'score', 'message')
+    while True:
+        submission = await queryset.afirst()
+        if submission is None:
+            return SUBMISSION_NOT_FOUND
+        if _is_final(submission) or time.monotonic() >= deadline:
+            return submission_payload(submission)
+        await asyncio.sleep(SUBMISSION_POLL_INTERVAL)
+
+
+# Leaderboards
+def parse_leaderboard_query(params):
+    """Return (quiz_id or None for the global board, limit, error payload)."""
+
+    try:
+        quiz_id = int(params['quiz_id']) if params.get('quiz_id') else None
+        limit = min(max(int(params.get('limit', DEFAULT_LEADERBOARD_SIZE)), 1), MAX_LEADERBOARD_SIZE)
+    except ValueError:
+        return None, 0, INVALID_QUERY
+    return quiz_id, limit, None
+
+
+def get_leaderboard(user, params):
+    """
+        Top scores, and the rank and percentile of the user, of one quiz or overall.
+        Admins only see the boards of their own quizzes, with usernames, and
+        the global board without them.
+    """
+
+    if getattr(user, 'role', None) not in ('admin', 'user'):
+        return NOT_AUTHORIZED
+    quiz_id, limit, error = parse_leaderboard_query(params)
+    if error:
+        return error
+    if quiz_id is None:
+        board = leaderboards.overall()
+    else:
+        quizzes = Quiz.objects.filter(id=quiz_id)
+        if not is_student(user):
+            quizzes = quizzes.filter(created_by=user)
+        if not quizzes.exists():
+            return QUIZ_NOT_FOUND
+        board = leaderboards.for_quiz(quiz_id)
+    with board.lock:
+        top = board.top(limit)
+        ranks = [board.rank_of_score(score) for _, score in top]
+        participants = len(board)
+        score = board.score_of(user.id)
+        me = None
+        if score is not None:
+            me = {'rank': board.rank_of_score(score), 'score': score, 'percentile': round(board.percentile_of_score(score), 2)}
+    entries = [{'rank': rank, 'user': user_id, 'score': score} for (user_id, score), rank in zip(top, ranks)]
+    if not is_student(user) and quiz_id is not None:
+        # Usernames are email addresses, so only the quiz's admin gets to see them
+        usernames = dict(get_user_model().objects.filter(id__in=[entry['user'] for entry in entries]).values_list('id', 'username'))
+        for entry in entries:
+            entry['username'] = usernames.get(entry['user'])
+    return {'status':True, 'quiz_id': quiz_id, 'participants': participants, 'top': entries, 'me': me}
@@ -0,0 +1,422 @@
+"""
+Timed attempt sessions (AttemptSession).
+
+start_attempt opens a session with a deadline. save_answers calls go through
+the process-local AutosaveBuffer, which keeps the latest answer per question
+of each session and group-commits them: the saves arriving while a write
+runs are written together by the next one, BATCH_SIZE sessions per read and
+bulk UPDATE, so a burst of saves from many clients costs a handful of queries
+rather than a write each. The async view waits on the event loop, so its
+saves also gather for up to FLUSH_INTERVAL seconds before a write; a sync
+save holds a server thread and leads its write right away. A save is
+answered once it was written, so a save
+that reaches a finished session (e.g. through another process's cached
+deadline) is refused rather than acknowledged and dropped. The owner and
+deadline of open sessions are cached per process, so checking a save needs
+no query.
+
+finish_attempt grades a session that ends before deadline + GRACE. It reads
+the saved answers under the session's row lock, which autosave writes also
+take, so every write either lands before the read or skips the finished
+session and tells its savers. The answers it takes from the local buffer are
+only acknowledged once its transaction commits, and go back to the buffer if
+it rolls back. Sessions
+left open are expired and graded with their saved answers by the sweeper
+(manage.py sweep_attempt_sessions). It keeps the open sessions in a heap
+ordered by deadline, adds new ones by id and only looks at the top of the
+heap, so a sweep never scans every open session. Sessions can commit out of
+id order on server databases, so each load rescans the ids loaded during the
+last SETTLE_POLLS loads and pushes only the new ones. It waits
+FLUSH_INTERVAL past the grace period, so the saves accepted just before it
+are written rather than refused.
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .grading import grade_entries
+from .models import AttemptSession
+from .scoring import _question_id
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'ATTEMPT_SESSIONS', {})
+DEFAULT_TIME_LIMIT = _config.get('DEFAULT_TIME_LIMIT', 3600)
+GRACE = _config.get('GRACE', 5)
+FLUSH_INTERVAL = _config.get('FLUSH_INTERVAL', 2.0)
+BATCH_SIZE = _config.get('BATCH_SIZE', 500)
+SAVE_TIMEOUT = _config.get('SAVE_TIMEOUT', 10.0)
+POLL_INTERVAL = _config.get('POLL_INTERVAL', 1.0)
+SETTLE_POLLS = _config.get('SETTLE_POLLS', 3)
+MAX_CACHED_DEADLINES = _config.get('MAX_CACHED_DEADLINES', 50000)
+
+
+def merge_answers(saved, answers):
+    """Merge answers into saved (both in the attempt_quiz format); the last answer per question wins."""
+
+    merged = {_question_id(answer): answer for answer in saved}
+    for answer in answers:
+        question_id = _question_id(answer)
+        if question_id is not None:
+            merged[question_id] = {'question': question_id, 'selected_option': answer.get('selected_option')}
+    return list(merged.values())
+
+
+def is_late(deadline, now=None):
+    return (now or timezone.now()) > deadline + timedelta(seconds=GRACE)
+
+
+class DeadlineCache:
+    """LRU of session id -> (user id, deadline) for the open sessions seen by this process."""
+
+    def __init__(self, max_entries=MAX_CACHED_DEADLINES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def put(self, session_id, user_id, deadline):
+        with self._lock:
+            self._entries[session_id] = (user_id, deadline)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Event(threading.Event):
+    """A threading.Event that coroutines can also wait for without holding a thread."""
+
+    def __init__(self):
+        super().__init__()
+        self._futures = []
+        self._futures_lock = threading.Lock()
+
+    def set(self):
+        super().set()
+        with self._futures_lock:
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait_async(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._futures_lock:
+            if self.is_set():
+                return True
+            self._futures.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            with self._futures_lock:
+                if waiter in self._futures:
+                    self._futures.remove(waiter)
+        return self.is_set()
+
+
+class _Flush:
+    """One write of an AutosaveBuffer; savers wait on it to learn whether their session was written."""
+
+    def __init__(self):
+        self.done = _Event()
+        self.saved = set()
+        self.closed = set()
+        # The write itself, plus one per session taken by AutosaveBuffer.taken()
+        self._holds = 1
+        self._lock = threading.Lock()
+
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self, session_id=None, saved=False):
+        with self._lock:
+            if saved:
+                self.saved.add(session_id)
+            self._holds -= 1
+            if not self._holds:
+                self.done.set()
+
+    def outcome(self, session_id):
+        if session_id in self.closed:
+            return False
+        if session_id in self.saved:
+            return True
+        return None
+
+
+class AutosaveBuffer:
+    """
+        Pending autosaved answers of this process, written in batches.
+
+        save() and asave() merge answers into the pending ones of the
+        session. The first saver after a write leads the next one: once the
+        running write is done (and, for asave(), after up to flush_interval,
+        less once batch_size sessions are pending) it writes every pending
+        session, while the other savers wait for that write. A save is only
+        acknowledged once its answers were written to a session that was
+        still open.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, timeout=SAVE_TIMEOUT):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._pending = {}
+        self._next = None
+        self._lock = threading.Lock()
+        self._writing = threading.Lock()
+        self._wake = _Event()
+        self.flushes = 0
+        self.written = 0
+
+    def save(self, session_id, answers):
+        """
+            Buffer answers and wait for them to be written. Returns True once
+            written, False if the session is no longer open and None if the
+            write failed or timed out.
+        """
+
+        leader, flush = self._buffer(session_id, answers)
+        if leader:
+            self.flush()
+        if not flush.done.wait(self.timeout if leader else self.flush_interval + self.timeout):
+            return None
+        return flush.outcome(session_id)
+
+    async def asave(self, session_id, answers):
+        """See save(). Waits on the event loop; only the write it leads runs in a thread."""
+
+        leader, flush = self._buffer(session_id, answers)
+        if leader:
+            await self._wake.wait_async(self.flush_interval)
+            await sync_to_async(self.flush)()
+        if not await flush.done.wait_async(self.timeout if leader else self.flush_interval + self.timeout):
+            return None
+        return flush.outcome(session_id)
+
+    def _buffer(self, session_id, answers):
+        """Merge answers into the pending ones of the session. Returns (leader, flush)."""
+
+        with self._lock:
+            pending = self._pending.setdefault(session_id, {})
+            for answer in answers:
+                question_id = _question_id(answer)
+                if question_id is not None:
+                    pending[question_id] = {'question': question_id, 'selected_option': answer.get('selected_option')}
+            leader = self._next is None
+            if leader:
+                self._next = _Flush()
+            flush = self._next
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+        return leader, flush
+
+    def peek(self, session_id):
+        with self._lock:
+            return list(self._pending.get(session_id, {}).values())
+
+    @contextmanager
+    def taken(self, session_id):
+        """
+            Take the pending answers of a session to grade them in the current
+            transaction. Their savers are told they were saved once it
+            commits. If it rolls back, the answers go back to the buffer and
+            are written with the next write; savers whose write is already
+            done by then are told to retry.
+        """
+
+        with self._lock:
+            answers = self._pending.pop(session_id, None)
+            flush = self._next
+            if answers is not None:
+                flush.hold()
+        if answers is None:
+            yield []
+            return
+        try:
+            yield list(answers.values())
+        except BaseException:
+            self._restore(session_id, answers, flush)
+            raise
+        if transaction.get_rollback():
+            self._restore(session_id, answers, flush)
+        else:
+            transaction.on_commit(lambda: flush.release(session_id, saved=True))
+
+    def _restore(self, session_id, answers, flush):
+        with self._lock:
+            # Answers saved since they were taken win
+            self._pending[session_id] = {**answers, **self._pending.get(session_id, {})}
+        flush.release()
+
+    def flush(self):
+        """
+            Write every pending session, once the running write is done.
+            Returns the number of sessions written.
+        """
+
+        with self._writing:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            flush, self._next = self._next, None
+            self._wake.clear()
+        if flush is None:
+            return 0
+        items = list(pending.items())
+        written = 0
+        try:
+            for start in range(0, len(items), self.batch_size):
+                batch = dict(items[start:start + self.batch_size])
+                saved = self._write(batch)
+                flush.saved.update(saved)
+                flush.closed.update(batch.keys() - saved)
+                written += len(saved)
+        except Exception:
+            # The savers of the unwritten sessions are told so and retry
+            logger.exception('Failed to write %d autosaved sessions', len(items))
+        finally:
+            flush.release()
+        with self._lock:
+            self.flushes += 1
+            self.written += written
+        return written
+
+    def _write(self, batch):
+        now = timezone.now()
+        # Read and write in one transaction so concurrent writes and finish_attempt() do not lose answers
+        with transaction.atomic():
+            sessions = list(AttemptSession.objects.select_for_update().filter(
+                id__in=batch, status=AttemptSession.OPEN,
+            ).only('id', 'answers'))
+            for session in sessions:
+                session.answers = merge_answers(session.answers, batch[session.id].values())
+                session.saved_at = now
+            AttemptSession.objects.bulk_update(sessions, ['answers', 'saved_at'])
+        return {session.id for session in sessions}
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'flushes': self.flushes, 'written': self.written}
+
+
+deadlines = DeadlineCache()
+autosave = AutosaveBuffer()
+
+
+def expire_sessions(session_ids):
+    """Grade the saved answers of sessions that are still open and mark them expired."""
+
+    sessions = list(AttemptSession.objects.filter(id__in=session_ids, status=AttemptSession.OPEN))
+    if not sessions:
+        return 0
+    record = grade_entries(sessions)
+    now = timezone.now()
+    for session in sessions:
+        session.status = AttemptSession.EXPIRED
+        session.finished_at = now
+    with transaction.atomic():
+        record()
+        AttemptSession.objects.bulk_update(sessions, ['status', 'score', 'finished_at'], batch_size=BATCH_SIZE)
+    return len(sessions)
+
+
+class DeadlineSweeper:
+    """Expire sessions FLUSH_INTERVAL after the end of their grace period, earliest deadline first."""
+
+    def __init__(self, delay=GRACE + FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        self.delay = timedelta(seconds=delay)
+        self.batch_size = batch_size
+        self._heap = []
+        self._last_id = 0
+        self._marks = deque([0], maxlen=SETTLE_POLLS)
+        self._recent = set()
+
+    def load(self):
+        """Push the open sessions not loaded yet onto the heap."""
+
+        rows = AttemptSession.objects.filter(status=AttemptSession.OPEN).order_by('id').values_list('id', 'deadline')
+        after = self._marks[0]
+        while True:
+            chunk = list(rows.filter(id__gt=after)[:self.batch_size])
+            for session_id, deadline in chunk:
+                if session_id not in self._recent:
+                    heapq.heappush(self._heap, (deadline, session_id))
+                    self._recent.add(session_id)
+                self._last_id = max(self._last_id, session_id)
+            if len(chunk) < self.batch_size:
+                break
+            after = chunk[-1][0]
+        self._marks.append(self._last_id)
+        floor = self._marks[0]
+        self._recent = {session_id for session_id in self._recent if session_id > floor}
+
+    def due(self, now=None):
+        """Pop the ids of up to batch_size sessions whose deadline has passed."""
+
+        cutoff = (now or timezone.now()) - self.delay
+        session_ids = []
+        while self._heap and self._heap[0][0] <= cutoff and len(session_ids) < self.batch_size:
+            session_ids.append(heapq.heappop(self._heap)[1])
+        return session_ids
+
+    def seconds_until_next(self, now=None):
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] + self.delay - (now or timezone.now())).total_seconds(), 0)
+
+    def sweep(self):
+        """Expire every due session. Returns the number expired."""
+
+        self.load()
+        expired = 0
+        while True:
+            session_ids = self.due()
+            if not session_ids:
+                return expired
+            # Sessions finished in the meantime are no longer open and are skipped
+            expired += expire_sessions(session_ids)
+
+    def run(self, poll_interval=POLL_INTERVAL, once=False, stop=None):
+        """Sweep until stop is set (or once). Returns the number of sessions expired."""
+
+        expired = 0
+        while stop is None or not stop.is_set():
+            expired += self.sweep()
+            if once:
+                break
+            wait = self.seconds_until_next()
+            time.sleep(poll_interval if wait is None else min(wait, poll_interval))
+        return expired
@@ -1,3 +1,408 @@
+import asyncio
+import bisect
+import json
+import random
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from admin_actions import documents
+from admin_actions.models import Category, Quiz, Question, QuizAttempt, QuizDocument, QuizStats
+from task_project.metrics import assert_query_budgets
+from user.authentication import token_cache
+from .cache import answer_key_cache
+from .grading import claim_batch, grade_batch, grade_entries, run_worker
+from .leaderboard import LeaderboardRegistry, RankedList, leaderboards
+from .models import AttemptSession, QuestionDraw, Submission
+from .sessions import DeadlineSweeper, _Flush, autosave, deadlines
+
+User = get_user_model()
+
+
+class QuizAPITestCase(TestCase):
+    """An admin with one quiz of four one-mark questions (option1 is right) and a student."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin@x.com', email='admin@x.com', password='pw', role='admin')
+        cls.student = User.objects.create_user(username='s@x.com', email='s@x.com', password='pw', role='user')
+        cls.category = Category.objects.create(name='Science', created_by=cls.admin)
+        cls.quiz = Quiz.objects.create(name='Biology', category=cls.category, created_by=cls.admin)
+        cls.questions = [
+            Question.objects.create(
+                quiz=cls.quiz, question_text=f'Question {index}', option1='a', option2='b', option3='c', option4='d',
+                answer=1, marks=1,
+            )
+            for index in range(4)
+        ]
+
+    def setUp(self):
+        # Process-local state outlives the test transactions
+        for local in (token_cache, answer_key_cache, leaderboards, deadlines, cache):
+            local.clear()
+        with autosave._lock:
+            autosave._pending.clear()
+            autosave._next = None
+        # Each save writes its own answers instead of waiting for others
+        patcher = mock.patch.object(autosave, 'flush_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client
+
+    def answers(self, correct):
+        return [
+            {'question': question.id, 'selected_option': 'a' if index < correct else 'b'}
+            for index, question in enumerate(self.questions)
+        ]
+
+
+class RequestBodyTests(QuizAPITestCase):
+    def test_non_object_bodies_are_rejected(self):
+        client = self.client_for(self.student)
+        for path in ('/api/attempt_quiz', '/api/submit_quiz', '/api/start_attempt', '/api/save_answers',
+                     '/api/finish_attempt', '/api/async/attempt_quiz', '/api/async/submit_quiz', '/api/async/save_answers'):
+            with self.subTest(path=path):
+                response = client.post(path, ['x'], format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), {'status': False, 'message': 'Request body must be a JSON object'})
+
+
+class QueuedGradingTests(QuizAPITestCase):
+    def submit(self, correct=3):
+        response = self.client_for(self.student).post('/api/submit_quiz', {'quiz_id': self.quiz.id, 'answers': self.answers(correct)}, format='json')
+        return Submission.objects.get(id=response.json()['submission_id'])
+
+    def test_submission_is_graded(self):
+        submission = self.submit()
+        self.assertEqual(run_worker('test', once=True), 1)
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.score), (Submission.GRADED, 3))
+        self.assertEqual(QuizAttempt.objects.get(user=self.student, quiz=self.quiz).score, 3)
+
+    def test_submission_is_rejected_when_attempt_was_recorded_meanwhile(self):
+        submission = self.submit()
+
+        def grade_then_attempt(entries):
+            record = grade_entries(entries)
+            # An attempt recorded through attempt_quiz while the batch was being scored
+            QuizAttempt.objects.create(user=self.student, quiz=self.quiz, score=1)
+            return record
+
+        with mock.patch('user_actions.grading.grade_entries', grade_then_attempt):
+            run_worker('test', once=True)
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.score), (Submission.REJECTED, None))
+        self.assertEqual(QuizAttempt.objects.get(user=self.student, quiz=self.quiz).score, 1)
+        # The skipped attempt's score is not added to the stats
+        self.assertFalse(QuizStats.objects.filter(quiz=self.quiz).exists())
+
+    def test_reclaimed_batch_is_left_to_its_new_worker(self):
+        submission = self.submit(3)
+        slow = claim_batch('slow')
+        # The slow worker outlives RECLAIM_AFTER; another worker reclaims and grades its batch
+        Submission.objects.filter(id=submission.id).update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(run_worker('fast', once=True), 1)
+        self.assertEqual(grade_batch(slow), 0)
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.score, submission.worker), (Submission.GRADED, 3, 'fast'))
+        self.assertEqual(QuizAttempt.objects.filter(user=self.student, quiz=self.quiz).count(), 1)
+        self.assertEqual(QuizStats.objects.get(quiz=self.quiz).attempt_count, 1)
+
+    def test_sync_long_poll_is_capped(self):
+        submission = self.submit()
+        client = self.client_for(self.student)
+        start = time.monotonic()
+        with mock.patch('user_actions.services.MAX_SYNC_SUBMISSION_WAIT', 0.3):
+            response = client.get('/api/get_submission', {'submission_id': submission.id, 'wait': 30})
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(response.json()['state'], Submission.PENDING)
+
+
+class QuizDocumentTests(QuizAPITestCase):
+    def test_concurrent_first_reads_share_one_document(self):
+        compile_quiz = documents.compile_quiz
+
+        def compile_after_another_read(quiz):
+            # Another request publishes the quiz while this one compiles it
+            compile_quiz(quiz).save(force_insert=True)
+            return compile_quiz(quiz)
+
+        with mock.patch('admin_actions.documents.compile_quiz', compile_after_another_read):
+            response = self.client_for(self.student).get('/api/get_quiz_document', {'quiz_id': self.quiz.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['questions']), 4)
+        self.assertEqual(response['ETag'], f'"{QuizDocument.objects.get(quiz=self.quiz).etag}"')
+
+
+class QuestionPoolTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Quiz.objects.filter(id=self.quiz.id).update(draw_count=2)
+
+    def test_catalogue_lists_pools_without_drawing(self):
+        client = self.client_for(self.student)
+        for path, params in (('/api/get_all_quiz', {}), ('/api/get_all_quiz', {'stream': 1}),
+                             ('/api/async/get_all_quiz', {})):
+            with self.subTest(path=path, params=params):
+                response = client.get(path, params)
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                self.assertEqual([quiz['id'] for quiz in json.loads(body)['quiz']], [self.quiz.id])
+                self.assertEqual(json.loads(body)['questions'], [])
+        self.assertFalse(QuestionDraw.objects.exists())
+
+    def test_starting_an_attempt_draws(self):
+        response = self.client_for(self.student).post('/api/start_attempt', {'quiz_id': self.quiz.id}, format='json')
+        self.assertTrue(response.json()['status'])
+        self.assertTrue(QuestionDraw.objects.filter(user=self.student, quiz=self.quiz).exists())
+
+
+class AttemptSessionTests(QuizAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Quiz.objects.filter(id=self.quiz.id).update(time_limit=600)
+        self.client = self.client_for(self.student)
+        self.session_id = self.client.post('/api/start_attempt', {'quiz_id': self.quiz.id}, format='json').json()['session_id']
+
+    def save(self, correct):
+        return self.client.post('/api/save_answers', {'session_id': self.session_id, 'answers': self.answers(correct)}, format='json').json()
+
+    def finish(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/finish_attempt', {'session_id': self.session_id, **data}, format='json').json()
+
+    def test_saves_are_written_before_they_are_acknowledged(self):
+        self.assertTrue(self.save(3)['status'])
+        saved = AttemptSession.objects.get(id=self.session_id).answers
+        self.assertEqual([answer['selected_option'] for answer in saved], ['a', 'a', 'a', 'b'])
+        self.assertEqual(self.finish()['score'], 3)
+
+    def test_save_to_a_session_finished_elsewhere_is_refused(self):
+        self.assertEqual(self.finish(answers=self.answers(2))['score'], 2)
+        # Another process still holds the session's deadline
+        deadlines.put(self.session_id, self.student.id, AttemptSession.objects.get(id=self.session_id).deadline)
+        self.assertEqual(self.save(4), {'status': False, 'message': 'This attempt is already finished'})
+        self.assertIsNone(deadlines.get(self.session_id))
+        self.assertEqual(AttemptSession.objects.get(id=self.session_id).score, 2)
+
+    def test_finish_grades_answers_written_by_another_process(self):
+        get = answer_key_cache.get
+
+        def get_then_write(*args):
+            # Another process writes its buffered saves while finish_attempt is grading
+            AttemptSession.objects.filter(id=self.session_id).update(answers=self.answers(4))
+            return get(*args)
+
+        with mock.patch.object(answer_key_cache, 'get', get_then_write):
+            self.assertEqual(self.finish()['score'], 4)
+        self.assertEqual(AttemptSession.objects.get(id=self.session_id).status, AttemptSession.SUBMITTED)
+
+    def test_sync_saves_write_without_waiting_for_other_saves(self):
+        with mock.patch.object(autosave, 'flush_interval', 5):
+            started = time.monotonic()
+            self.assertTrue(self.save(3)['status'])
+            self.assertLess(time.monotonic() - started, 1)
+
+    def test_async_save_is_acknowledged_once_written(self):
+        response = self.client.post('/api/async/save_answers', {'session_id': self.session_id, 'answers': self.answers(2)}, format='json')
+        self.assertEqual(response.json()['message'], 'Answers saved')
+        saved = AttemptSession.objects.get(id=self.session_id).answers
+        self.assertEqual([answer['selected_option'] for answer in saved], ['a', 'a', 'b', 'b'])
+
+    def test_async_saves_share_one_write(self):
+        batches = []
+
+        def write(batch):
+            batches.append(set(batch))
+            return set(batch)
+
+        async def save_both():
+            return await asyncio.gather(autosave.asave(1, self.answers(1)), autosave.asave(2, self.answers(2)))
+
+        with mock.patch.object(autosave, 'flush_interval', 5), mock.patch.object(autosave, 'batch_size', 2), \
+                mock.patch.object(autosave, '_write', write):
+            started = time.monotonic()
+            self.assertEqual(asyncio.run(save_both()), [True, True])
+            # A full batch is written without waiting out flush_interval
+            self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(batches, [{1, 2}])
+
+    def buffer(self, correct):
+        # A save still waiting in this process's buffer for its write
+        with autosave._lock:
+            autosave._pending[self.session_id] = {answer['question']: answer for answer in self.answers(correct)}
+            autosave._next = _Flush()
+            return autosave._next
+
+    def test_taken_saves_are_acknowledged_once_finish_commits(self):
+        flush = self.buffer(3)
+        with mock.patch.object(transaction, 'on_commit') as on_commit:
+            self.assertEqual(self.client.post('/api/finish_attempt', {'session_id': self.session_id}, format='json').json()['score'], 3)
+            autosave.flush()
+            self.assertFalse(flush.done.is_set())
+        on_commit.call_args.args[0]()
+        self.assertTrue(flush.done.is_set())
+        self.assertTrue(flush.outcome(self.session_id))
+
+    def test_taken_saves_go_back_to_the_buffer_when_finish_rolls_back(self):
+        flush = self.buffer(3)
+        QuizAttempt.objects.create(user=self.student, quiz=self.quiz, score=1)
+        self.assertEqual(self.finish()['message'], 'You have already attempted this quiz')
+        self.assertEqual(len(autosave.peek(self.session_id)), 4)
+        self.assertIsNone(flush.outcome(self.session_id))
+        autosave.flush()
+        self.assertTrue(flush.outcome(self.session_id))
+        saved = AttemptSession.objects.get(id=self.session_id)
+        self.assertEqual((saved.status, [answer['selected_option'] for answer in saved.answers]), (AttemptSession.OPEN, ['a', 'a', 'a', 'b']))
+
+    def test_sweeper_loads_sessions_committed_out_of_id_order(self):
+        sweeper = DeadlineSweeper()
+        deadline = timezone.now() - timedelta(hours=1)
+        physics, chemistry = (Quiz.objects.create(name=name, category=self.category, created_by=self.admin) for name in ('Physics', 'Chemistry'))
+        AttemptSession.objects.create(id=self.session_id + 10, user=self.student, quiz=physics, deadline=deadline)
+        sweeper.load()
+        # Its id was taken before the last load, but it committed after it
+        AttemptSession.objects.create(id=self.session_id + 5, user=self.student, quiz=chemistry, deadline=deadline)
+        sweeper.load()
+        sweeper.load()
+        self.assertEqual(sorted(sweeper.due()), [self.session_id + 5, self.session_id + 10])
+
+    def test_failed_write_is_not_acknowledged(self):
+        with mock.patch.object(autosave, '_write', side_effect=DatabaseError), self.assertLogs('user_actions.sessions', 'ERROR'):
+            self.assertEqual(self.save(3), {'status': False, 'message': 'Answers could not be saved, please try again'})
+        self.assertEqual(AttemptSession.objects.get(id=self.session_id).answers, [])
+
+
+class LeaderboardTests(QuizAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_admin = User.objects.create_user(username='other@x.com', email='other@x.com', password='pw', role='admin')
+        cls.students = [cls.student] + [
+            User.objects.create_user(username=f's{index}@x.com', email=f's{index}@x.com', password='pw', role='user')
+            for index in range(1, 4)
+        ]
+
+    def test_ranked_list_matches_a_sorted_list(self):
+        ranked, expected = RankedList(), []
+        rng = random.Random(7)
+        for _ in range(2000):
+            value = (rng.randrange(-50, 0), rng.randrange(100))
+            if value in expected:
+                ranked.remove(value)
+                expected.remove(value)
+            else:
+                ranked.insert(value)
+                bisect.insort(expected, value)
+            probe = (rng.randrange(-50, 0),)
+            self.assertEqual(ranked.bisect_left(probe), bisect.bisect_left(expected, probe))
+        self.assertEqual(list(ranked), expected)
+        self.assertEqual(len(ranked), len(expected))
+        built = RankedList(expected)
+        built.insert((-1, -1))
+        built.remove(expected[0])
+        self.assertEqual([built.bisect_left((score,)) for score in range(-50, 1)],
+                         [bisect.bisect_left(sorted(expected[1:] + [(-1, -1)]), (score,)) for score in range(-50, 1)])
+
+    def test_ranks_share_ties(self):
+        for student, score in zip(self.students, (3, 4, 3, 1)):
+            QuizAttempt.objects.create(user=student, quiz=self.quiz, score=score)
+        response = self.client_for(self.student).get('/api/get_leaderboard', {'quiz_id': self.quiz.id}).json()
+        self.assertEqual([(entry['rank'], entry['score']) for entry in response['top']], [(1, 4), (2, 3), (2, 3), (4, 1)])
+        self.assertEqual(response['me'], {'rank': 2, 'score': 3, 'percentile': 75.0})
+        self.assertNotIn('username', response['top'][0])
+
+    def test_attempts_committed_out_of_id_order_are_caught_up(self):
+        registry = LeaderboardRegistry(refresh_interval=0)
+        QuizAttempt.objects.create(id=10, user=self.students[0], quiz=self.quiz, score=1)
+        QuizAttempt.objects.create(id=12, user=self.students[1], quiz=self.quiz, score=2)
+        registry.for_quiz(self.quiz.id)
+        registry.overall()
+        # Id 11 was allocated before 12 but commits after the boards caught up to 12
+        QuizAttempt.objects.create(id=11, user=self.students[2], quiz=self.quiz, score=3)
+        for _ in range(2):
+            self.assertEqual(registry.for_quiz(self.quiz.id).top(5), [(self.students[2].id, 3), (self.students[1].id, 2), (self.students[0].id, 1)])
+            self.assertEqual(registry.overall().score_of(self.students[2].id), 3)
+
+    def test_global_board_loads_settled_totals_in_one_query(self):
+        other_quiz = Quiz.objects.create(name='Chemistry', category=self.category, created_by=self.admin)
+        for student, quiz, score in ((self.students[0], self.quiz, 3), (self.students[0], other_quiz, 2), (self.students[1], self.quiz, 4)):
+            QuizAttempt.objects.create(user=student, quiz=quiz, score=score)
+        QuizAttempt.objects.update(attempted_at=timezone.now() - timedelta(hours=1))
+        recent = QuizAttempt.objects.create(user=self.students[1], quiz=other_quiz, score=1)
+        registry = LeaderboardRegistry(refresh_interval=0)
+        # The aggregate, its settled id, then the walk over the recent attempt
+        with self.assertNumQueries(3):
+            board = registry.overall()
+        self.assertEqual(board.top(5), [(self.students[0].id, 5), (self.students[1].id, 5)])
+        self.assertEqual(board.last_attempt_id, recent.id)
+        QuizAttempt.objects.create(user=self.students[2], quiz=self.quiz, score=2)
+        self.assertEqual(registry.overall().score_of(self.students[2].id), 2)
+        self.assertEqual(registry.overall().score_of(self.students[1].id), 5)
+
+    def test_admins_only_see_their_own_quiz_boards(self):
+        QuizAttempt.objects.create(user=self.student, quiz=self.quiz, score=2)
+        owner = self.client_for(self.admin).get('/api/get_leaderboard', {'quiz_id': self.quiz.id}).json()
+        self.assertEqual(owner['top'][0]['username'], self.student.username)
+        other = self.client_for(self.other_admin).get('/api/get_leaderboard', {'quiz_id': self.quiz.id}).json()
+        self.assertEqual(other, {'status': False, 'message': 'Quiz not found'})
+        overall = self.client_for(self.other_admin).get('/api/get_leaderboard').json()
+        self.assertNotIn('username', overall['top'][0])
+
+
+class QueryBudgetTests(QuizAPITestCase):
+    """A student's hot paths stay within REQUEST_METRICS['QUERY_BUDGETS'], with cold caches."""
+
+    def quiz_with_questions(self, name, **fields):
+        quiz = Quiz.objects.create(name=name, category=self.category, created_by=self.admin, **fields)
+        questions = [
+            Question.objects.create(
+                quiz=quiz, question_text=f'{name} {index}', option1='a', option2='b', option3='c', option4='d',
+                answer=1, marks=1,
+            )
+            for index in range(4)
+        ]
+        return quiz, [{'question': question.id, 'selected_option': 'a'} for question in questions]
+
+    def cold(self, method, path, data=None):
+        for local in (token_cache, answer_key_cache, leaderboards, deadlines, cache):
+            local.clear()
+        client = self.client_for(self.student)
+        if method == 'get':
+            return client.get(path, data).json()
+        return client.post(path, data, format='json').json()
+
+    def test_student_hot_paths(self):
+        Quiz.objects.filter(id=self.quiz.id).update(draw_count=2)
+        # A second pooled quiz, which the catalogue lists without drawing
+        self.quiz_with_questions('Geology', draw_count=3)
+        timed, timed_answers = self.quiz_with_questions('Physics', time_limit=600)
+        queued, queued_answers = self.quiz_with_questions('Chemistry')
+        self.assertTrue(self.client_for(self.admin).post(f'/api/admin/publish_quiz?quiz_id={self.quiz.id}').json()['status'])
+        with assert_query_budgets(), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(self.cold('get', '/api/get_all_quiz')['quiz']), 4)
+            drawn = self.cold('get', '/api/get_quiz_questions', {'quiz_id': self.quiz.id})['questions']
+            self.assertEqual(len(drawn), 2)
+            self.assertEqual(len(self.cold('get', '/api/get_quiz_document', {'quiz_id': self.quiz.id})['questions']), 2)
+            answers = [{'question': question['id'], 'selected_option': 'a'} for question in drawn]
+            self.assertEqual(self.cold('post', '/api/attempt_quiz', {'quiz_id': self.quiz.id, 'answers': answers})['score'], 2)
+
+            session_id = self.cold('post', '/api/start_attempt', {'quiz_id': timed.id})['session_id']
+            self.assertTrue(self.cold('post', '/api/save_answers', {'session_id': session_id, 'answers': timed_answers})['status'])
+            self.assertEqual(self.cold('post', '/api/finish_attempt', {'session_id': session_id})['score'], 4)
 
-# Create your tests here.
+            submission_id = self.cold('post', '/api/submit_quiz', {'quiz_id': queued.id, 'answers': queued_answers})['submission_id']
+            self.assertEqual(self.cold('get', '/api/get_submission', {'submission_id': submission_id})['state'], Submission.PENDING)
+            self.assertEqual(len(self.cold('get', '/api/get_quiz_attempts')), 2)
+            self.assertEqual(self.cold('get', '/api/get_leaderboard', {'quiz_id': self.quiz.id})['me']['rank'], 1)
+            self.assertEqual(self.cold('get', '/api/get_leaderboard')['me']['score'], 6)
@@ -1,8 +1,24 @@
 from django.urls import path
 from .views import *
+from . import async_views
 
 urlpatterns = [
     path('get_all_quiz', get_all_quiz),
+    path('get_quiz_questions', get_quiz_questions),
+    path('get_quiz_document', get_quiz_document),
     path('attempt_quiz', attempt_quiz),
+    path('submit_quiz', submit_quiz),
+    path('start_attempt', start_attempt),
+    path('save_answers', save_answers),
+    path('finish_attempt', finish_attempt),
+    path('get_submission', get_submission),
     path('get_quiz_attempts', get_quiz_attempts),
+    path('get_leaderboard', get_leaderboard),
+    # ASGI-native variants
+    path('async/get_all_quiz', async_views.get_all_quiz),
+    path('async/attempt_quiz', async_views.attempt_quiz),
+    path('async/submit_quiz', async_views.submit_quiz),
+    path('async/save_answers', async_views.save_answers),
+    path('async/get_submission', async_views.get_submission),
+    path('async/get_quiz_attempts', async_views.get_quiz_attempts),
 ]
\ No newline at end of file
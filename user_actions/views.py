@@ -1,3 +1,4 @@
+import re
 from django.shortcuts import render
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated
@@ -5,20 +6,136 @@ from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import authenticate
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from admin_actions.models import *
 from admin_actions.serializers import *
+from admin_actions.pagination import keyset_page
+from admin_actions.catalogue import conditional_catalogue
+from task_project.replicas import replica_reads
+from .services import (
+    NOT_AUTHORIZED, INVALID_QUERY, is_student, catalogue_queryset, get_catalogue, stream_catalogue,
+    get_attempts, attempt_quiz as attempt_quiz_service, submit_quiz as submit_quiz_service,
+    get_submission as get_submission_service, get_leaderboard as get_leaderboard_service,
+    start_attempt as start_attempt_service, save_answers as save_answers_service, finish_attempt as finish_attempt_service,
+    document_meta, document_body,
+)
+from .draws import drawn_questions
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+@conditional_catalogue('user')
 def get_all_quiz(request):
+    """
+        List active quizzes and their active questions.
+        Results are paginated by quiz, ordered by quiz ID. Quizzes with a
+        draw_count list no questions: the student's draw is made when the
+        quiz is opened with get_quiz_questions or get_quiz_document.
+
+        Query params:
+        - category_id (int, optional): Only return quizzes of this category
+        - cursor (int, optional): The next_cursor returned by the previous page
+        - limit (int, optional): Quizzes per page (default 50, max 500)
+        - mode (string, optional): 'list' returns quiz metadata with question_count and no questions
+        - stream (bool, optional): Stream the whole catalogue as chunked JSON, ignoring cursor/limit
+
+        Returns:
+        - {'quiz': [...], 'questions': [...], 'next_cursor': <int or null>}
+        - {'quiz': [...], 'next_cursor': <int or null>} when mode=list
+        Responses carry an ETag and Last-Modified; send them back as
+        If-None-Match / If-Modified-Since to get a 304 when nothing changed.
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    if request.GET.get('stream'):
+        try:
+            quizzes = catalogue_queryset(request)
+        except ValueError:
+            return Response(INVALID_QUERY)
+        return StreamingHttpResponse(stream_catalogue(quizzes), content_type='application/json')
+    return Response(get_catalogue(request))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_quiz_questions(request):
+    """
+        List the active questions of one active quiz, paginated by question ID.
+        For a quiz with a draw_count, only the questions drawn for the student;
+        the first call draws them. Pages are read from the question rows; to
+        load a whole quiz at once, use get_quiz_document.
+
+        Query params:
+        - quiz_id (int, required): The ID of the quiz
+        - cursor (int, optional): The next_cursor returned by the previous page
+        - limit (int, optional): Questions per page (default 50, max 500)
+
+        Returns:
+        - {'questions': [...], 'next_cursor': <int or null>}
+    """
+
     user = request.user
     if user.role != 'user':
         return Response({'status':False, 'message': 'You are not authorized to perform this action'})
-    quizzes = Quiz.objects.filter(is_active=True)
-    serializer = QuizSerial(quizzes, many=True)
-    questions = Question.objects.filter(quiz__in=quizzes, is_active=True)
-    question_serializer = QuestionSerial(questions, many=True)
-    return Response({"quiz": serializer.data, "questions": question_serializer.data})
+    if not request.GET.get('quiz_id'):
+        return Response({'status':False, 'message': 'Quiz ID is required'})
+    quiz_id = request.GET.get('quiz_id')
+    try:
+        quiz = Quiz.objects.filter(id=int(quiz_id), is_active=True).first()
+        if quiz is None:
+            return Response({'status':False, 'message': 'Quiz not found'})
+        questions = Question.objects.filter(quiz_id=quiz_id, is_active=True)
+        draws = drawn_questions(user.id, [quiz])
+        if quiz.id in draws:
+            questions = questions.filter(id__in=draws[quiz.id])
+        questions, next_cursor = keyset_page(questions, request)
+    except ValueError:
+        return Response({'status':False, 'message': 'Invalid query parameters'})
+    return Response({"questions": QUESTION_ROWS.from_objects(questions), "next_cursor": next_cursor})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_quiz_document(request):
+    """
+        Get one active quiz with its active questions, without answers, as a
+        precompiled document. The bytes are stored when the quiz is published
+        and served as is; gzip-compressed when the client accepts it.
+        For a quiz with a draw_count, only the questions drawn for the student.
+
+        Query params:
+        - quiz_id (int, required): The ID of the quiz
+
+        Returns:
+        - {'quiz': {...}, 'questions': [...]}
+        Responses carry an ETag; send it back as If-None-Match to get a 304.
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    meta, error = document_meta(request.GET)
+    if error:
+        return Response(error)
+    etag = f'"{meta[1]}-{user.id}"' if meta[3] else f'"{meta[1]}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is None:
+        body = document_body(user, meta, bool(ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))))
+        if body is None:
+            # Recompiled since the lookup; the next request gets the new document
+            return Response({'status':False, 'message': 'Quiz changed, please retry'}, status=503, headers={'Retry-After': '1'})
+        content, gzipped = body
+        response = HttpResponse(content, content_type='application/json')
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    else:
+        response = not_modified
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Authorization', 'Accept-Encoding'])
+    return response
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -31,6 +148,7 @@ def attempt_quiz(request):
         - quiz_id (int, required): The ID of the quiz
         - answers (list, required): A list of dictionaries containing the question ID and selected option.
             Example: [{"question": 1, "selected_option": 2}, {"question": 2, "selected_option": 1}]
+            Each question is scored once; repeated or unknown question IDs are ignored.
 
         Returns:
         - JSON response indicating success/failure:
@@ -56,34 +174,146 @@ def attempt_quiz(request):
     """
 
     user = request.user
-    if user.role != 'user':
-        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
-    if not request.data.get('quiz_id'):
-        return Response({'status':False, 'message': 'Quiz ID is required'})
-    quiz_id = request.data.get('quiz_id')
-    if Quiz.objects.filter(id=quiz_id).exists():
-        if not QuizAttempt.objects.filter(user=user, quiz__id=quiz_id).exists():
-            quiz = Quiz.objects.get(id=quiz_id)
-            questions = Question.objects.filter(quiz=quiz, is_active=True)
-            answers = request.data.get('answers')
-            score = 0
-            for answer in answers:
-                if questions.filter(id=answer['question']).exists():
-                    question = questions.get(id=answer['question'])
-                    if answer.get('selected_option') == question.get_answer():
-                        score += question.marks
-            attempt = QuizAttempt.objects.create(user=user, quiz=quiz, score=score)
-            attempt.save()
-            return Response({'status':True, 'message': 'Quiz attempted successfully', 'score': score})
-        return Response({'status':False, 'message': 'You have already attempted this quiz'})
-    return Response({'status':False, 'message': 'Quiz not found'})
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(attempt_quiz_service(user, request.data))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_attempt(request):
+    """
+        Start a timed attempt of a quiz, or resume the open one.
+        Timed quizzes (with a time_limit) can only be taken this way; others
+        get the default time limit.
+
+        Body:
+        - quiz_id (int, required): The ID of the quiz
+
+        Returns:
+        - {'status': True, 'session_id': 1, 'quiz_id': 1, 'state': 'open', 'started_at': ..., 'deadline': ...,
+           'remaining_seconds': 1800, 'answers': [saved answers]}
+        - {'status': False, 'message': 'Error message'}
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(start_attempt_service(user, request.data))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def save_answers(request):
+    """
+        Autosave answers of an attempt session. Answers are merged into the
+        saved ones, the latest per question winning, and written in batches;
+        the response comes once they are written. The request holds a server
+        thread until then; async/save_answers waits without one.
+
+        Body:
+        - session_id (int, required): The ID returned by start_attempt
+        - answers (list, required): Answers in the attempt_quiz format
+
+        Returns:
+        - {'status': True, 'message': 'Answers saved', 'saved_at': ...}
+        - {'status': False, 'message': 'Time is up, your saved answers will be graded'} after the deadline
+        - {'status': False, 'message': 'This attempt is already finished'} once finished or expired
+        - {'status': False, 'message': 'Answers could not be saved, please try again'} if the write failed
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(save_answers_service(user, request.data))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finish_attempt(request):
+    """
+        Finish an attempt session before its deadline: grade the saved answers
+        together with any final ones and record the attempt. Sessions that are
+        not finished in time are graded with their saved answers.
+
+        Body:
+        - session_id (int, required): The ID returned by start_attempt
+        - answers (list, optional): Final answers in the attempt_quiz format
+
+        Returns:
+        - {'status': True, 'message': 'Quiz attempted successfully', 'score': 5}
+        - {'status': False, 'message': 'Error message'}
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(finish_attempt_service(user, request.data))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def submit_quiz(request):
+    """
+        Submit a quiz for queued grading.
+        Takes the same body as attempt_quiz, but only validates and stores the
+        submission; grade_submissions workers score it and record the attempt.
+
+        Returns:
+        - {'status': True, 'message': 'Submission received', 'submission_id': 1}
+        - {'status': True, 'message': 'Quiz already submitted', 'submission_id': 1} on a repeated submission
+        - {'status': False, 'message': 'Error message'} on the same errors as attempt_quiz
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(submit_quiz_service(user, request.data))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_submission(request):
+    """
+        Get the grading state of a submission.
+
+        Query params:
+        - submission_id (int, required): The ID returned by submit_quiz
+        - wait (float, optional): Seconds to wait for grading to finish (long-poll, max 2;
+          async/get_submission waits up to 30 without holding a thread)
+
+        Returns:
+        - {'status': True, 'submission_id': 1, 'state': 'pending'} (or 'processing')
+        - {'status': True, 'submission_id': 1, 'state': 'graded', 'message': 'Quiz attempted successfully', 'score': 5}
+        - {'status': False, 'submission_id': 1, 'state': 'rejected', 'message': 'You have already attempted this quiz'}
+    """
+
+    user = request.user
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(get_submission_service(user, request.GET))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_quiz_attempts(request):
     user = request.user
-    if user.role != 'user':
-        return Response({'status':False, 'message': 'You are not authorized to perform this action'})
-    attempts = QuizAttempt.objects.filter(user=user)
-    serializer = AttemptSerial(attempts, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    if not is_student(user):
+        return Response(NOT_AUTHORIZED)
+    return Response(get_attempts(user))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_leaderboard(request):
+    """
+        Get the leaderboard of a quiz, or the global leaderboard of total scores.
+        Tied scores share the same rank.
+
+        Query params:
+        - quiz_id (int, optional): The ID of the quiz; omit for the global leaderboard
+        - limit (int, optional): Number of top entries (default 10, max 100)
+
+        Returns:
+        - {'status': True, 'quiz_id': 1, 'participants': 250,
+           'top': [{'rank': 1, 'user': 7, 'score': 10}, ...],
+           'me': {'rank': 12, 'score': 8, 'percentile': 95.6} or null if the user has no attempt}
+        - {'status': False, 'message': 'Quiz not found'} if an admin asks for another admin's quiz
+        Entries of quiz boards include 'username' for the quiz's admin.
+    """
+
+    return Response(get_leaderboard_service(request.user, request.GET))